@@ -0,0 +1,515 @@
+import atexit
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+# ====================================================
+#          📜 STRUCTURED ACCESS LOG (buffered, rotated)
+# ====================================================
+# Events are queued in memory and written by a background thread as JSON lines
+# into size/time-rotated segment files. Every segment has a small sidecar
+# ".meta.json" index (time range, per-user and per-kind counts) so queries only
+# open the segments that can contain matching records. Other structured logs
+# (e.g. routing decisions) reuse AccessLogger with their own directory, segment
+# name prefix and a cap on the number of segments kept.
+
+LOG_DIR = os.getenv("ACCESS_LOG_DIR", os.path.join("logs", "access"))
+LEGACY_LOG_FILE = "access_log.txt"
+
+MAX_SEGMENT_BYTES = int(os.getenv("ACCESS_LOG_MAX_SEGMENT_BYTES", 8 * 1024 * 1024))
+MAX_SEGMENT_SECONDS = int(os.getenv("ACCESS_LOG_MAX_SEGMENT_SECONDS", 24 * 3600))
+FLUSH_INTERVAL_S = 0.5
+MAX_BATCH = 500
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+SEGMENT_SUFFIX = ".jsonl"
+META_SUFFIX = ".meta.json"
+
+# Event text prefix -> kind, used for indexing and filtering
+EVENT_KINDS = [
+    ("Logged in", "login"),
+    ("Logged out", "logout"),
+    ("Completed translation", "translation"),
+    # Old access_log.txt files log this alongside "Completed translation" for the same job
+    ("Performed translation", "translation_step"),
+    ("Submitted feedback", "feedback"),
+    ("Created new user", "admin"),
+    ("Deleted user", "admin"),
+]
+
+# --- Record Helpers ---
+
+def classify_event(event):
+    """Maps free-text event messages onto a small set of kinds."""
+    for prefix, kind in EVENT_KINDS:
+        if event.startswith(prefix):
+            return kind
+    return "other"
+
+def make_record(username, event, when=None):
+    when = when or time.time()
+    return {
+        "t": round(when, 3),
+        "timestamp": datetime.datetime.fromtimestamp(when).strftime(TIMESTAMP_FORMAT),
+        "username": username,
+        "event": event,
+        "kind": classify_event(event),
+    }
+
+def to_epoch(value):
+    """Accepts None, epoch seconds, datetime/date or a 'YYYY-MM-DD[ HH:MM:SS]' string."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day).timestamp()
+    value = value.strip()
+    fmt = TIMESTAMP_FORMAT if len(value) > 10 else "%Y-%m-%d"
+    return datetime.datetime.strptime(value, fmt).timestamp()
+
+def _new_meta(name, start):
+    return {"name": name, "start": start, "end": start, "count": 0, "bytes": 0,
+            "users": {}, "kinds": {}, "closed": False}
+
+def _write_json_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+# --- Buffered Writer ---
+
+class AccessLogger:
+    """Queues events and appends them to rotating segments from a background thread."""
+
+    def __init__(self, log_dir=None, max_segment_bytes=None, max_segment_seconds=None, name_prefix="access",
+                 max_segments=None):
+        self.log_dir = log_dir or LOG_DIR
+        self.max_segment_bytes = max_segment_bytes or MAX_SEGMENT_BYTES
+        self.max_segment_seconds = max_segment_seconds or MAX_SEGMENT_SECONDS
+        self.name_prefix = name_prefix
+        self.max_segments = max_segments  # None keeps every segment (the access log is an audit trail)
+        self._queue = queue.Queue()
+        self._meta = None
+        self._seq = 0
+        self._closed = False
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="access-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, username, event):
+        """Enqueues an event; never blocks on disk I/O."""
+        if not self._closed:
+            self._queue.put(make_record(username, event))
+
+    def log_record(self, record):
+        """Enqueues a ready-made record; it needs "t", "username" and "kind", which the segment index counts."""
+        if not self._closed:
+            self._queue.put(record)
+
+    def flush(self, timeout=5):
+        """Blocks until everything queued so far has been written."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= MAX_BATCH:
+                    break
+                try:
+                    item = self._queue.get(timeout=FLUSH_INTERVAL_S if batch else 0.001)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"Error writing to log: {e}")
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._close_segment()
+                return
+
+    def _segment_path(self, name):
+        return os.path.join(self.log_dir, name + SEGMENT_SUFFIX)
+
+    def _open_segment(self, start):
+        self._seq += 1
+        stamp = datetime.datetime.fromtimestamp(start).strftime("%Y%m%d-%H%M%S")
+        name = f"{self.name_prefix}-{stamp}-{os.getpid()}-{self._seq:04d}"
+        self._meta = _new_meta(name, start)
+
+    def _close_segment(self):
+        if self._meta is not None:
+            self._meta["closed"] = True
+            _write_json_atomic(os.path.join(self.log_dir, self._meta["name"] + META_SUFFIX), self._meta)
+            self._meta = None
+            if self.max_segments:
+                self._drop_old_segments()
+
+    def _drop_old_segments(self):
+        closed = [m for m in list_segments(self.log_dir) if m["closed"]]
+        for meta in closed[:max(0, len(closed) - self.max_segments)]:
+            for suffix in (SEGMENT_SUFFIX, META_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.log_dir, meta["name"] + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _needs_rotation(self, now):
+        meta = self._meta
+        return (meta["bytes"] >= self.max_segment_bytes
+                or now - meta["start"] >= self.max_segment_seconds)
+
+    def _write_batch(self, records):
+        pending = list(records)
+        while pending:
+            if self._meta is None:
+                self._open_segment(pending[0]["t"])
+            elif self._needs_rotation(pending[0]["t"]):
+                self._close_segment()
+                continue
+
+            # Fill the current segment up to its size limit
+            meta = self._meta
+            lines, taken = [], 0
+            for record in pending:
+                line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+                lines.append(line)
+                taken += 1
+                meta["bytes"] += len(line.encode("utf-8"))
+                meta["count"] += 1
+                meta["end"] = max(meta["end"], record["t"])
+                meta["users"][record["username"]] = meta["users"].get(record["username"], 0) + 1
+                meta["kinds"][record["kind"]] = meta["kinds"].get(record["kind"], 0) + 1
+                if meta["bytes"] >= self.max_segment_bytes:
+                    break
+            with open(self._segment_path(meta["name"]), "a", encoding="utf-8") as f:
+                f.writelines(lines)
+            _write_json_atomic(os.path.join(self.log_dir, meta["name"] + META_SUFFIX), meta)
+            pending = pending[taken:]
+
+# --- Segment Index ---
+
+_meta_cache = {}  # path -> (mtime_ns, meta)
+_meta_cache_lock = threading.Lock()
+
+def list_segments(log_dir=None):
+    """Returns segment metadata sorted oldest to newest, re-reading only changed sidecars."""
+    log_dir = log_dir or LOG_DIR
+    if not os.path.isdir(log_dir):
+        return []
+    metas = []
+    with _meta_cache_lock:
+        for entry in os.scandir(log_dir):
+            if not entry.name.endswith(META_SUFFIX):
+                continue
+            mtime = entry.stat().st_mtime_ns
+            cached = _meta_cache.get(entry.path)
+            if cached is None or cached[0] != mtime:
+                try:
+                    with open(entry.path, "r") as f:
+                        cached = (mtime, json.load(f))
+                except (OSError, ValueError):
+                    continue
+                _meta_cache[entry.path] = cached
+            metas.append(cached[1])
+    metas.sort(key=lambda m: (m["start"], m["name"]))
+    return metas
+
+def _segment_may_match(meta, start, end, username, kind):
+    if start is not None and meta["end"] < start:
+        return False
+    if end is not None and meta["start"] > end:
+        return False
+    if username is not None and username not in meta["users"]:
+        return False
+    if kind is not None and kind not in meta["kinds"]:
+        return False
+    return True
+
+def _known_match_count(meta, start, end, username, kind, event):
+    """Number of matches in a segment when it follows from the index alone, else None."""
+    if event is not None:
+        return None
+    if (start is not None and meta["start"] < start) or (end is not None and meta["end"] > end):
+        return None
+    if username is not None and kind is not None:
+        return None
+    if username is not None:
+        return meta["users"].get(username, 0)
+    if kind is not None:
+        return meta["kinds"].get(kind, 0)
+    return meta["count"]
+
+def read_segment(meta, log_dir=None):
+    """Reads all records from one segment, oldest first."""
+    path = os.path.join(log_dir or LOG_DIR, meta["name"] + SEGMENT_SUFFIX)
+    records = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # partially written line
+    except FileNotFoundError:
+        pass
+    return records
+
+def _record_matches(record, start, end, username, kind, event):
+    if start is not None and record["t"] < start:
+        return False
+    if end is not None and record["t"] > end:
+        return False
+    if username is not None and record["username"] != username:
+        return False
+    if kind is not None and record.get("kind") != kind:
+        return False
+    if event is not None and event.lower() not in record["event"].lower():
+        return False
+    return True
+
+# --- Query API ---
+
+def query_logs(start=None, end=None, username=None, kind=None, event=None,
+               offset=0, limit=50, newest_first=True, log_dir=None):
+    """Returns (records, total_or_None) for a filtered page of the access log.
+
+    Segments whose index rules them out are never opened, and segments whose
+    match count is known from the index are skipped wholesale while paging.
+    `event` is a case-insensitive substring filter, `kind` an exact match on
+    classify_event(), and limit=None returns every match. `total` is only
+    computed when it follows from the index alone.
+    """
+    log_dir = log_dir or LOG_DIR
+    start, end = to_epoch(start), to_epoch(end)
+    metas = [m for m in list_segments(log_dir) if _segment_may_match(m, start, end, username, kind)]
+    if newest_first:
+        metas.reverse()
+
+    page, skip, total = [], max(0, offset), 0
+    def page_full():
+        return limit is not None and len(page) >= limit
+
+    for meta in metas:
+        known = _known_match_count(meta, start, end, username, kind, event)
+        if total is not None:
+            total = None if known is None else total + known
+        if page_full():
+            if total is None:
+                break
+            continue
+        if known is not None and skip >= known:
+            skip -= known
+            continue
+
+        records = read_segment(meta, log_dir)
+        if newest_first:
+            records.reverse()
+        for record in records:
+            if not _record_matches(record, start, end, username, kind, event):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            page.append(record)
+            if page_full():
+                break
+    return page, total
+
+# --- Tail Reader (newest first, seeking from the end) ---
+
+TAIL_BLOCK_BYTES = 64 * 1024
+
+def _read_lines_backward(path, end, limit, block_size=TAIL_BLOCK_BYTES):
+    """Returns up to `limit` (offset, line) pairs ending before byte `end`, newest first."""
+    lines = []
+    with open(path, "rb") as f:
+        pos, buf = end, b""
+        while len(lines) < limit:
+            k = buf.rfind(b"\n", 0, max(len(buf) - 1, 0))
+            if k == -1:
+                if pos == 0:
+                    if buf:
+                        lines.append((0, buf))
+                    break
+                step = min(block_size, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+                continue
+            lines.append((pos + k + 1, buf[k + 1:]))
+            buf = buf[:k + 1]
+    return lines
+
+def tail_page(cursor=None, limit=50, log_dir=None):
+    """Returns (records, next_cursor): the `limit` newest records before `cursor`.
+
+    Only the bytes needed for one page are read, seeking backwards from the end
+    of the newest segment. Pass the returned cursor back in to page further
+    into the past; it is None once the oldest record has been returned.
+    Cursors are plain dicts ({"segment", "offset"}) so they fit in session state.
+    """
+    log_dir = log_dir or LOG_DIR
+    metas = list_segments(log_dir)
+    names = [m["name"] for m in metas]
+    if cursor is None:
+        idx, offset = len(names) - 1, None
+    elif cursor["segment"] in names:
+        idx, offset = names.index(cursor["segment"]), cursor["offset"]
+    else:
+        return [], None
+
+    records = []
+    while idx >= 0 and len(records) < limit:
+        path = os.path.join(log_dir, names[idx] + SEGMENT_SUFFIX)
+        try:
+            if offset is None:
+                offset = os.path.getsize(path)
+            wanted = limit - len(records)
+            lines = _read_lines_backward(path, offset, wanted)
+        except FileNotFoundError:
+            wanted, lines = 1, []
+        for line_offset, raw in lines:
+            try:
+                records.append(json.loads(raw))
+            except ValueError:
+                continue  # partially written line
+            offset = line_offset
+        if len(lines) < wanted or offset == 0:
+            idx, offset = idx - 1, None
+
+    next_cursor = None if idx < 0 else {"segment": names[idx], "offset": offset}
+    if next_cursor and next_cursor["offset"] is None:
+        next_cursor["offset"] = metas[idx]["bytes"]
+    return records, next_cursor
+
+# --- Incremental Aggregates ---
+
+AGGREGATES_FILE = "aggregates.json"
+AGGREGATES_VERSION = 2  # bumped when counting changes; older saved counts are rebuilt
+
+_aggregates = None
+_aggregates_lock = threading.Lock()
+
+def _empty_aggregates():
+    return {"version": AGGREGATES_VERSION, "offsets": {}, "events": 0, "logins_per_user": {}, "translations_per_pair": {}}
+
+def _apply_record(state, record):
+    state["events"] += 1
+    # Re-classified: records imported before "Performed translation" had its own kind stored "translation"
+    kind = classify_event(record["event"])
+    if kind == "login":
+        user = record["username"]
+        state["logins_per_user"][user] = state["logins_per_user"].get(user, 0) + 1
+    elif kind == "translation":
+        # "Completed translation English->Portuguese" -> "English->Portuguese"
+        pair = record["event"].split("translation", 1)[1].strip() or "unknown"
+        state["translations_per_pair"][pair] = state["translations_per_pair"].get(pair, 0) + 1
+
+def update_aggregates(log_dir=None):
+    """Folds records appended since the last call into the running counts and returns them.
+
+    The byte offset reached in each segment is stored alongside the counts
+    (logs/access/aggregates.json), so every call only reads new bytes and
+    segments that have not grown are not opened at all.
+    """
+    global _aggregates
+    log_dir = log_dir or LOG_DIR
+    state_path = os.path.join(log_dir, AGGREGATES_FILE)
+    with _aggregates_lock:
+        if _aggregates is None or _aggregates[0] != log_dir:
+            try:
+                with open(state_path, "r") as f:
+                    saved = json.load(f)
+                _aggregates = (log_dir, saved if saved.get("version") == AGGREGATES_VERSION else _empty_aggregates())
+            except (OSError, ValueError):
+                _aggregates = (log_dir, _empty_aggregates())
+        state = _aggregates[1]
+
+        changed = False
+        metas = list_segments(log_dir)
+        for meta in metas:
+            done = state["offsets"].get(meta["name"], 0)
+            if done >= meta["bytes"]:
+                continue
+            with open(os.path.join(log_dir, meta["name"] + SEGMENT_SUFFIX), "rb") as f:
+                f.seek(done)
+                data = f.read(meta["bytes"] - done)
+            data = data[:data.rfind(b"\n") + 1]  # complete lines only
+            for raw in data.splitlines():
+                try:
+                    _apply_record(state, json.loads(raw))
+                except ValueError:
+                    continue
+            state["offsets"][meta["name"]] = done + len(data)
+            changed = changed or bool(data)
+
+        live = {m["name"] for m in metas}
+        for name in [n for n in state["offsets"] if n not in live]:
+            del state["offsets"][name]
+        if changed and os.path.isdir(log_dir):
+            _write_json_atomic(state_path, state)
+        return {k: (dict(v) if isinstance(v, dict) else v) for k, v in state.items() if k not in ("offsets", "version")}
+
+def import_legacy_log(path=LEGACY_LOG_FILE, logger=None):
+    """One-time import of the old '[ts] user: event' text log into segments."""
+    logger = logger or get_logger()
+    if not os.path.exists(path) or list_segments(logger.log_dir):
+        return 0
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                timestamp, rest = line.strip().split("] ", 1)
+                username, event = rest.split(":", 1)
+                when = datetime.datetime.strptime(timestamp.strip("["), TIMESTAMP_FORMAT).timestamp()
+            except ValueError:
+                continue
+            records.append(make_record(username.strip(), event.strip(), when))
+    for record in records:
+        logger._queue.put(record)
+    logger.flush()
+    return len(records)
+
+# --- Process-wide Logger ---
+
+_logger = None
+_logger_lock = threading.Lock()
+
+def get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                _logger = AccessLogger()
+                atexit.register(_logger.close)
+                import_legacy_log(logger=_logger)
+    return _logger
+
+def log_event(username, event):
+    get_logger().log(username, event)
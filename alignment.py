@@ -0,0 +1,69 @@
+import re
+
+# ====================================================
+#     📐 PARAGRAPH ALIGNMENT & NUMBERED RE-REQUESTS
+# ====================================================
+# Every prompt asks the model to preserve paragraph breaks, and everything
+# downstream (QA, TM, revisions, deduplication) pairs source and target line
+# by line. Each chunk's output is checked against the paragraph structure of
+# its source: the same number of non-empty paragraphs, laid out with the
+# source's blank lines. A chunk whose paragraphs were merged or split is
+# re-requested on its own with every paragraph numbered ("[1] ..."), and the
+# reply is put back together by number; the rest of the document is untouched.
+
+STRICT_FORMAT = """
+
+IMPORTANT: the text above is split into {count} numbered segments, one per paragraph.
+Write your answer (every version of it, if several are asked for) as exactly {count} lines,
+one per segment and in the same order, each starting with its number in square brackets,
+e.g. "[1] ...". Never merge, split, drop or add segments."""
+
+_NUMBERED_RE = re.compile(r"^\s*\[(\d+)\]\s?(.*)$")
+
+def paragraphs(text):
+    """The non-empty lines of `text`, stripped."""
+    return [line.strip() for line in (text or "").split("\n") if line.strip()]
+
+def realign(source, output):
+    """`output` laid out like `source` (same blank lines), or None if the paragraph counts differ."""
+    lines = paragraphs(output)
+    layout = (source or "").split("\n")
+    if len(lines) != sum(1 for line in layout if line.strip()):
+        return None
+    remaining = iter(lines)
+    return "\n".join(next(remaining) if line.strip() else "" for line in layout)
+
+# --- Numbered Segments ---
+
+def numbered(text):
+    return "\n".join(f"[{i}] {paragraph}" for i, paragraph in enumerate(paragraphs(text), 1))
+
+def numbered_prompt(prompt, texts, source):
+    """`prompt` with each of `texts` (the chunk and any earlier version of it) numbered, plus the strict format rule."""
+    for text in dict.fromkeys(t for t in texts if t and t.strip()):
+        # The chunk comes after the gold examples, so only its last occurrence is replaced
+        head, found, tail = prompt.rpartition(text)
+        if found:
+            prompt = head + numbered(text) + tail
+    return prompt + STRICT_FORMAT.format(count=len(paragraphs(source)))
+
+def parse_numbered(output, count):
+    """The `count` segments of a numbered answer, in order, or None if any is missing, repeated or empty."""
+    segments, current = {}, None
+    for line in (output or "").split("\n"):
+        match = _NUMBERED_RE.match(line)
+        if match:
+            current = int(match.group(1))
+            if current in segments:
+                return None
+            segments[current] = match.group(2).strip()
+        elif line.strip() and current is not None:
+            segments[current] += " " + line.strip()  # a paragraph split over lines goes back together
+    if sorted(segments) != list(range(1, count + 1)) or not all(segments.values()):
+        return None
+    return [segments[i] for i in range(1, count + 1)]
+
+def realign_numbered(source, output):
+    """A numbered answer for `source` laid out like it, or None if it does not line up."""
+    segments = parse_numbered(output, len(paragraphs(source)))
+    return None if segments is None else realign(source, "\n".join(segments))
@@ -0,0 +1,136 @@
+import math
+import os
+import time
+
+import dedupe
+import pipeline
+import tm
+
+# ====================================================
+#       📊 CAT-STYLE REPETITION & MATCH ANALYSIS
+# ====================================================
+# A quoting pass for Step 2 that never calls the LLM. The source is split into
+# segments (paragraph lines); every segment is classified once through hash
+# lookups: internal repetition (seen earlier in this document), TM exact match,
+# TM fuzzy band, or no match. Word counts per band give billable words under a
+# discount grid, and token counts (after in-document deduplication, which the
+# translation steps apply) give a rough pipeline duration.
+
+BANDS = ("Repetitions", "100%", "95–99%", "85–94%", "75–84%", "No match")
+
+# Share of the full word rate billed per band (a common CAT discount grid)
+BILLING_WEIGHTS = {
+    "Repetitions": 0.3,
+    "100%": 0.3,
+    "95–99%": 0.6,
+    "85–94%": 0.7,
+    "75–84%": 0.8,
+    "No match": 1.0,
+}
+
+CHARS_PER_TOKEN = 4  # rough average for Latin-script text
+OUTPUT_TOKENS_PER_SECOND = float(os.getenv("ANALYSIS_OUTPUT_TOKENS_PER_SECOND", 80))
+REQUEST_OVERHEAD_S = float(os.getenv("ANALYSIS_REQUEST_OVERHEAD_S", 2.0))
+
+def band_for(score):
+    if score >= 100:
+        return "100%"
+    if score >= 95:
+        return "95–99%"
+    if score >= 85:
+        return "85–94%"
+    if score >= 75:
+        return "75–84%"
+    return "No match"
+
+def analyze(source_text, memory=None):
+    """Segment, repetition and TM match analysis of a source text (no LLM calls)."""
+    start = time.perf_counter()
+    bands = {band: {"segments": 0, "words": 0} for band in BANDS}
+    seen = set()
+    total_words = 0
+    for line in (source_text or "").split("\n"):
+        key = tm.normalize(line)
+        if not key:
+            continue
+        words = len(key.split())
+        total_words += words
+        if key in seen:
+            band = "Repetitions"
+        else:
+            seen.add(key)
+            band = band_for(memory.lookup(line)[0]) if memory else "No match"
+        bands[band]["segments"] += 1
+        bands[band]["words"] += words
+
+    segments = sum(b["segments"] for b in bands.values())
+    billable = sum(b["words"] * BILLING_WEIGHTS[band] for band, b in bands.items())
+    source_tokens = math.ceil(len(source_text or "") / CHARS_PER_TOKEN)
+    plan = dedupe.dedupe(source_text)
+    unique_tokens = math.ceil(plan["unique_chars"] / CHARS_PER_TOKEN)
+    return {
+        "segments": segments,
+        "words": total_words,
+        "bands": bands,
+        "billable_words": round(billable),
+        "source_tokens": source_tokens,
+        "unique_tokens": unique_tokens,
+        "estimate": estimate_duration(plan["text"], unique_tokens),
+        "tm_units": len(memory) if memory else 0,
+        "seconds": time.perf_counter() - start,
+    }
+
+def estimate_duration(source_text, source_tokens):
+    """Rough wall-clock seconds for Steps 4-6, step by step vs. pipelined per chunk."""
+    # Each pass writes about as many tokens as the source has; generation speed dominates
+    pass_seconds = source_tokens / OUTPUT_TOKENS_PER_SECOND + REQUEST_OVERHEAD_S
+    chunks = len(pipeline.chunk_text(source_text)) if source_text else 0
+    chunk_seconds = source_tokens / max(1, chunks) / OUTPUT_TOKENS_PER_SECOND + REQUEST_OVERHEAD_S
+    waves = math.ceil(chunks / max(1, min(pipeline.STAGE_WORKERS, pipeline.MAX_CONCURRENT_CALLS)))
+    return {
+        "step_by_step_s": round(3 * pass_seconds),
+        # Three stages deep, `waves` chunk batches wide
+        "pipelined_s": round((waves + 2) * chunk_seconds) if chunks else 0,
+        "chunks": chunks,
+    }
+
+def format_analysis(report):
+    """Markdown summary of an analyze() report for Step 2."""
+    estimate = report["estimate"]
+    lines = [
+        f"**Project Scope:** {report['words']} words in {report['segments']} segments "
+        f"· **Billable:** {report['billable_words']} words · **~{report['source_tokens']:,} source tokens** "
+        f"(~{report['unique_tokens']:,} after deduplication)",
+        "",
+        "| Match | Segments | Words | Rate |",
+        "|---|---|---|---|",
+    ]
+    for band in BANDS:
+        entry = report["bands"][band]
+        lines.append(f"| {band} | {entry['segments']} | {entry['words']} | {BILLING_WEIGHTS[band]:.0%} |")
+    tm_note = f"TM: {report['tm_units']} units" if report["tm_units"] else "TM: empty for this language pair"
+    lines += [
+        "",
+        f"⏱️ Estimated Steps 4-6: ~{_minutes(estimate['step_by_step_s'])} step by step, "
+        f"~{_minutes(estimate['pipelined_s'])} pipelined ({estimate['chunks']} chunks). "
+        f"{tm_note}. Analysis took {report['seconds'] * 1000:.0f} ms.",
+    ]
+    return "\n".join(lines)
+
+def format_dedupe(plan):
+    """One-line summary of the token and latency savings of a dedupe plan."""
+    repeated = plan["segments"] - plan["unique"]
+    if plan.get("fallback"):
+        return f"♻️ {repeated} repeated segments, but the model merged lines, so the full text was translated."
+    if not dedupe.worthwhile(plan):
+        return "♻️ No repeated segments to deduplicate."
+    saved_tokens = math.ceil((plan["source_chars"] - plan["unique_chars"]) / CHARS_PER_TOKEN)
+    share = (plan["source_chars"] - plan["unique_chars"]) / max(1, plan["source_chars"])
+    return (
+        f"♻️ Deduplication: {repeated} of {plan['segments']} segments were repeats, sent once. "
+        f"~{saved_tokens:,} fewer input and output tokens per pass ({share:.0%}), "
+        f"~{_minutes(round(saved_tokens / OUTPUT_TOKENS_PER_SECOND))} less generation time per pass."
+    )
+
+def _minutes(seconds):
+    return f"{seconds // 60} min {seconds % 60} s" if seconds >= 60 else f"{seconds} s"
@@ -1,11 +1,29 @@
 import gradio as gr
-import google.generativeai as genai
-import pdfplumber
-import docx  # Used for reading and creating .docx files
-import io
+import contextlib
 import os
 import tempfile
+import time
+import functools
 from dotenv import load_dotenv
+import dedupe
+import delivery
+import extraction
+import doc_viewer
+import alignment
+import analysis
+import archive
+import glossary
+import gold_cache
+import metrics
+import pipeline
+import qa
+import revision
+import routing
+import scheduler
+import service_client
+import tm
+import usage
+import warmup
 
 # --- Load environment variables ---
 load_dotenv()
@@ -18,28 +36,14 @@ def read_file(filepath):
     try:
         file_name = os.path.basename(filepath)
 
-        if file_name.endswith(".txt"):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
-        
-        elif file_name.endswith(".pdf"):
-            with pdfplumber.open(filepath) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                return text
-        
-        elif file_name.endswith(".docx"):
-            doc = docx.Document(filepath)
-            text = ""
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-            return text
-        else:
-            raise gr.Error(f"Unsupported file format: {file_name}")
-            
+        # Extraction runs on the translation service when one is configured
+        if service_client.enabled():
+            with open(filepath, "rb") as f:
+                return service_client.extract(f, file_name)
+
+        # Gradio keeps uploads on disk: parsed in place, large files in a worker process (extraction.py)
+        return extraction.extract_file(filepath, file_name)
+
     except Exception as e:
         raise gr.Error(f"Error reading file {file_name}: {e}")
 
@@ -53,30 +57,37 @@ def build_gold_standard_prompt(en_files, pt_files):
     if len(en_files) != len(pt_files):
         gr.Warning("Warning: The number of English and Portuguese gold standard files does not match.")
 
-    prompt = "\n\nHere are some 'gold standard' examples of English-to-Portuguese translations to guide your tone and terminology. Follow these examples closely:\n"
-    
-    for i, (en_file, pt_file) in enumerate(zip(en_files, pt_files)):
-        en_text = read_file(en_file.name) # .name is the path to the temp file
-        pt_text = read_file(pt_file.name)
-        
-        if en_text and pt_text:
-            prompt += f"\n--- Gold Standard Example {i+1} ---\n"
-            prompt += f"[English]:\n{en_text}\n"
-            prompt += f"[Portuguese]:\n{pt_text}\n"
-            prompt += "--- End Example ---\n"
-            
-    return prompt
+    # Sessions using the same gold set share one cached prompt, keyed by file contents
+    pairs = list(zip(en_files, pt_files))
+    key = [(gold_cache.file_hash(en_file.name), gold_cache.file_hash(pt_file.name)) for en_file, pt_file in pairs]
+    return gold_cache.get_or_build(key, lambda: gold_cache.format_gold_prompt(
+        (read_file(en_file.name), read_file(pt_file.name)) # .name is the path to the temp file
+        for en_file, pt_file in pairs
+    ))
 
 # --- Helper Function: Call Gemini API ---
-def call_gemini(api_key, model_name, prompt, task_description):
-    """Generic function to call the Gemini API with error handling."""
+def call_gemini(api_key, model_name, prompt, task_description, step=None, segment_text=None, reference_text=None,
+                qa_failures=0):
+    """Generic function to call the Gemini API with error handling.
+
+    With model "auto", the routing cascade picks the model for this step and
+    escalates if the output fails local checks against `reference_text`.
+    Thin clients make the call on the translation service instead.
+    """
+    if service_client.enabled():
+        try:
+            return service_client.generate(model_name, step, prompt, segment_text, reference_text, qa_failures)
+        except scheduler.Cancelled as e:
+            raise gr.Error(str(e))
+        except Exception as e:
+            raise gr.Error(f"Error communicating with the translation service: {e}")
     if not api_key:
         raise gr.Error("Error: Invalid Gemini API Key. Please check your .env file.")
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt, request_options={'timeout': 600})
-        return response.text
+        # Waits for a fair-share call slot (scheduler.py); pooled client with retries and hedging (resilience.py)
+        return pipeline.call_model(api_key, model_name, step, prompt, segment_text, reference_text, qa_failures=qa_failures)
+    except scheduler.Cancelled as e:
+        raise gr.Error(str(e))
     except Exception as e:
         if "API_KEY_INVALID" in str(e) or "PERMISSION_DENIED" in str(e):
              raise gr.Error("Error: Invalid Gemini API Key. Please check your .env file.")
@@ -85,62 +96,130 @@ def call_gemini(api_key, model_name, prompt, task_description):
 
 # --- Helper Function: Create Word Doc ---
 def create_word_document(text_content):
-    """Creates a .docx file in memory from a string."""
-    doc = docx.Document()
-    if text_content:
-        for para in text_content.split('\n'):
-            doc.add_paragraph(para)
-            
-    file_stream = io.BytesIO()
-    doc.save(file_stream)
-    file_stream.seek(0)
-    return file_stream.getvalue()
+    """Creates a .docx file in memory from a string (on the translation service when one is configured)."""
+    if service_client.enabled():
+        return service_client.word_document(text_content)
+    return delivery.word_document(text_content)
+
+def create_delivery_bundle(final_texts, base_name):
+    """A .zip (bytes) with one translated .docx per target language."""
+    if service_client.enabled():
+        return service_client.delivery_bundle(final_texts, base_name)
+    return delivery.delivery_bundle(final_texts, base_name)
 
 # --- Prompt Generation Helpers ---
+# The step prompts are pipeline.step_prompt's, built by the translation service when one is configured
+def step_prompt(step, source_lang, target_lang, gold_prompt="", source_text="", translation=""):
+    if service_client.enabled():
+        return service_client.step_prompt(step, source_lang, target_lang, gold_prompt, source_text, translation)
+    return pipeline.step_prompt(step, source_lang, target_lang, gold_prompt, source_text, translation)
+
 def generate_step_4_prompt(source_lang, target_lang, gold_prompt, source_text):
-    return f"""You are a professional {source_lang}-to-{target_lang} translator.
-Translate the following text. Maintain a professional tone and ensure accuracy.
-Preserve paragraph breaks (indicated by newlines).
-{gold_prompt}
----
-Source Text to Translate:
-{source_text}
----
-{target_lang} Translation:"""
+    return step_prompt("translate", source_lang, target_lang, gold_prompt, source_text)
 
 def generate_step_5_prompt(source_lang, target_lang, gold_prompt, source_text, translation_text):
-    return f"""You are a professional editor. Review the following translation from {source_lang} to {target_lang}.
-Compare it against the source text for accuracy, terminology, and tone.
-Correct any stylistic or grammatical issues to improve fluency. Preserve paragraph breaks.
-{gold_prompt}
----
-Source Text:
-{source_text}
----
-Initial Translation to Review:
-{translation_text}
----
-Provide only the final, improved {target_lang} translation:"""
+    return step_prompt("edit", source_lang, target_lang, gold_prompt, source_text, translation_text)
 
 def generate_step_6_prompt(target_lang, text_to_proofread):
-    return f"""You are a meticulous proofreader. Perform a final check on the following {target_lang} text.
-Correct only objective errors (typos, grammar, punctuation). Preserve paragraph breaks.
-Do NOT change the style or word choice unless it's grammatically incorrect.
----
-Text to Proofread:
-{text_to_proofread}
----
-Provide only the final, proofread text:"""
+    return step_prompt("proofread", "", target_lang, translation=text_to_proofread)
+
+# --- Prompt Placeholders ---
+# The editable prompts in the UI refer to the documents by placeholder; the
+# (potentially multi-megabyte) texts are substituted server-side at run time
+# instead of being shipped to the browser inside every prompt box.
+GOLD_PLACEHOLDER = "{{GOLD_STANDARD_EXAMPLES}}"
+SOURCE_PLACEHOLDER = "{{SOURCE_TEXT}}"
+TRANSLATION_PLACEHOLDER = "{{TRANSLATION}}"
+GLOSSARY_PLACEHOLDER = "{{GLOSSARY_TERMS}}"  # only the glossary entries found in the source
+REFERENCE_PLACEHOLDERS = GOLD_PLACEHOLDER + GLOSSARY_PLACEHOLDER
+
+def expand_prompt(prompt, gold_prompt="", source_text="", translation_text="", glossary_text=""):
+    """Substitutes the document placeholders in an (edited) prompt template."""
+    return (prompt.replace(GOLD_PLACEHOLDER, gold_prompt or "")
+                  .replace(GLOSSARY_PLACEHOLDER, glossary_text or "")
+                  .replace(SOURCE_PLACEHOLDER, source_text or "")
+                  .replace(TRANSLATION_PLACEHOLDER, translation_text or ""))
+
+USAGE_METERS_MAX = 1000  # sessions whose current project is metered; the oldest are dropped first
+_usage_meters = {}  # session key -> usage.UsageMeter of the session's current project
+
+def session_key(request):
+    return f"session-{request.session_hash}" if request else None
+
+def session_user(request):
+    return getattr(request, "username", None) or session_key(request)
+
+@contextlib.contextmanager
+def scheduler_job(request, size=0):
+    """Runs the enclosed model calls as the signed-in user or browser session (scheduler.py).
+
+    The session's Cancel buttons cancel the job (cancel_run); the calls are
+    metered for the project archive (usage.py).
+    """
+    with scheduler.job(session_user(request), size=size, cancel_key=session_key(request)) as cancel_token, \
+            usage.metering(_usage_meters.get(session_key(request))):
+        yield cancel_token
+
+def cancel_run(request: gr.Request = None):
+    """Handles the Cancel buttons: stops the session's model calls at once, freeing their slots."""
+    if scheduler.cancel(session_key(request)):
+        gr.Info("Cancelled. Chunks that were already finished are reused if you run it again.")
+
+def active_glossary(glossary_key):
+    """The project's compiled glossary, or None if its client has no terms for the language pair."""
+    return glossary.get_glossary(*glossary_key) if glossary_key else None
+
+def glossary_terms_for(glossary_key, text):
+    """Prompt block with the glossary entries that occur in `text` ("" without a glossary)."""
+    project_glossary = active_glossary(glossary_key)
+    return project_glossary.prompt_block(text) if project_glossary else ""
+
+NEW_PROJECT = ""  # revision dropdown value for a fresh project
+
+def revision_choices(source_lang, target_lang):
+    """Dropdown choices: a new project, or a revision of a delivered project for the language pair."""
+    return [("New project", NEW_PROJECT)] + [
+        (f"{name} · {client} · {time.strftime('%Y-%m-%d %H:%M', time.localtime(created_at))}", str(project_id))
+        for project_id, name, client, created_at in tm.list_projects(source_lang, target_lang)
+    ]
+
+def refresh_revisions(source_lang, target_lang):
+    return gr.Dropdown(choices=revision_choices(source_lang, target_lang), value=NEW_PROJECT)
+
+
+# --- Document Viewer ---
+# One viewer is the single place documents are displayed. It only ever sends
+# one paragraph range of the source and of the selected version to the browser.
+VIEWER_VERSIONS = ["Step 4 Translation", "Step 5 Edit", "Step 6 Proofread", "Final"]
+
+def render_viewer(start, page_size, version, source_text, translation_4, translation_5, translation_6, final_text):
+    """Returns the viewer updates for the page starting at paragraph `start` (1-based)."""
+    versions = dict(zip(VIEWER_VERSIONS, [translation_4, translation_5, translation_6, final_text]))
+    target_text = versions.get(version)
+    page_size = int(page_size or doc_viewer.PAGE_SIZE)
+    total = max(doc_viewer.paragraph_count(source_text), doc_viewer.paragraph_count(target_text))
+    first = doc_viewer.clamp_start(int(start or 1) - 1, total, page_size)
+    return {
+        viewer_start: first + 1,
+        viewer_info: doc_viewer.page_label(first, page_size, total),
+        viewer_source_text: doc_viewer.paragraph_range(source_text, first, page_size),
+        viewer_target_text: doc_viewer.paragraph_range(target_text, first, page_size),
+    }
+
+def turn_viewer_page(direction, start, page_size, version, source_text, translation_4, translation_5, translation_6, final_text):
+    """Handles the viewer's previous/next page buttons."""
+    start = int(start or 1) + direction * int(page_size or doc_viewer.PAGE_SIZE)
+    return render_viewer(start, page_size, version, source_text, translation_4, translation_5, translation_6, final_text)
 
 
 # --- Gradio Event Handlers ---
 
-def start_project(source_file, en_files, pt_files, source_lang, target_lang):
+def start_project(source_file, en_files, pt_files, source_lang, target_lang, client, revision_of, request: gr.Request = None):
     """Handles the 'Start Project' button click."""
     
     # 1. Check API Key and Source File
     api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
+    if not api_key and not service_client.enabled():  # thin clients call the translation service
         raise gr.Error("❌ Gemini API Key not found in .env file.")
     if not source_file:
         raise gr.Error("❌ Please upload a source file to translate.")
@@ -153,11 +232,37 @@ def start_project(source_file, en_files, pt_files, source_lang, target_lang):
         raise gr.Error("Failed to read source file.")
 
     # 3. Generate Stats and Prompts
-    word_count = len(source_text.split())
-    word_count_md = f"**Project Scope:** {word_count} words"
+    # Repetition and TM match analysis for quoting (no LLM calls)
+    word_count_md = analysis.format_analysis(analysis.analyze(source_text, tm.get_memory(source_lang, target_lang)))
     gold_status_md = "✔️ Gold standard samples have been loaded." if gold_prompt else "ℹ️ No gold standard samples loaded."
+    glossary_key = (source_lang, target_lang, client or glossary.DEFAULT_CLIENT)
+    project_glossary = active_glossary(glossary_key)
+    if project_glossary:
+        found = len(project_glossary.find_terms(source_text))
+        gold_status_md += f"\n\n📚 Glossary '{glossary_key[2]}': {len(project_glossary)} terms, {found} found in the source."
+    else:
+        gold_status_md += f"\n\nℹ️ No glossary for client '{glossary_key[2]}' ({source_lang} → {target_lang})."
+
+    # Revision of a delivered project: only new or modified paragraphs will be translated
+    revision_plan = None
+    if revision_of:
+        project = tm.get_project(int(revision_of))
+        if project:
+            revision_plan = revision.plan_revision(project["source_text"], project["final_text"], source_text, project["name"])
+        if revision_plan:
+            revision_plan["project_id"] = project["id"]
+            gold_status_md += "\n\n" + revision.format_plan(revision_plan)
+        else:
+            gold_status_md += "\n\n⚠️ The previous project's paragraphs do not line up; this revision is translated in full."
     
-    prompt_4 = generate_step_4_prompt(source_lang, target_lang, gold_prompt, source_text)
+    prompt_4 = generate_step_4_prompt(source_lang, target_lang, REFERENCE_PLACEHOLDERS, SOURCE_PLACEHOLDER)
+
+    # Tokens and latency of this project, for the archive (Step 10)
+    if request:
+        _usage_meters.pop(session_key(request), None)
+        _usage_meters[session_key(request)] = usage.UsageMeter()
+        while len(_usage_meters) > USAGE_METERS_MAX:
+            _usage_meters.pop(next(iter(_usage_meters)))
     
     # 4. Return dictionary to update all UI components
     return {
@@ -166,27 +271,23 @@ def start_project(source_file, en_files, pt_files, source_lang, target_lang):
         source_text_state: source_text,
         gold_prompt_state: gold_prompt,
         source_file_obj_state: source_file,
+        glossary_key_state: glossary_key,
+        revision_plan_state: revision_plan,
         
         # Update Step 2 (Preparation)
         word_count_label: word_count_md,
         gold_status_label: gold_status_md,
-        source_text_widget: source_text,
         
         # Update Step 4
         step_4_prompt_text: prompt_4,
-        step_4_source_text: source_text,
-        
-        # Update Step 5
-        step_5_source_text: source_text,
-        
-        # Update Step 6
-        step_6_source_text: source_text,
 
-        # Update Step 9
-        final_source_widget: source_text,
+        # Document Viewer (first page of the source)
+        viewer_version_radio: VIEWER_VERSIONS[0],
+        **render_viewer(1, doc_viewer.PAGE_SIZE, VIEWER_VERSIONS[0], source_text, None, None, None, None),
         
         # Make workflow visible
         step_2_accordion: gr.Accordion(visible=True),
+        viewer_accordion: gr.Accordion(visible=True),
         step_3_accordion: gr.Accordion(visible=True),
         step_4_accordion: gr.Accordion(visible=True),
         step_5_accordion: gr.Accordion(visible=True),
@@ -202,68 +303,240 @@ def start_project(source_file, en_files, pt_files, source_lang, target_lang):
         gold_pt_upload: gr.File(interactive=False),
         source_lang_dd: gr.Dropdown(interactive=False),
         target_lang_dd: gr.Dropdown(interactive=False),
+        client_tb: gr.Textbox(interactive=False),
+        revision_dd: gr.Dropdown(interactive=False),
         start_button: gr.Button(interactive=False),
     }
 
-def run_step_4(prompt_4, model_name, api_key, source_lang, target_lang, source_text, gold_prompt):
+def run_step_4(prompt_4, model_name, api_key, source_lang, target_lang, source_text, gold_prompt, glossary_key, page_size, request: gr.Request = None):
     """Handles the 'Run Translation (Step 4)' button click."""
-    translation = call_gemini(api_key, model_name, prompt_4, "translating")
+    # Repeated segments are translated once and expanded back (dedupe.py)
+    with scheduler_job(request, len(source_text or "")):
+        translation, plan = dedupe.run(source_text, lambda text: call_gemini(
+            api_key, model_name,
+            expand_prompt(prompt_4, gold_prompt, text, glossary_text=glossary_terms_for(glossary_key, text)),
+            "translating", "translate", text,
+        ))
     
     if translation:
-        # Generate next prompt
-        prompt_5 = generate_step_5_prompt(source_lang, target_lang, gold_prompt, source_text, translation)
+        gr.Info(analysis.format_dedupe(plan))
+        # Generate next prompts (documents are filled in when they run)
+        prompt_5 = generate_step_5_prompt(source_lang, target_lang, REFERENCE_PLACEHOLDERS, SOURCE_PLACEHOLDER, TRANSLATION_PLACEHOLDER)
+        prompt_6 = generate_step_6_prompt(target_lang, TRANSLATION_PLACEHOLDER)
+        gr.Info("Translation complete.")
         
         return {
             translation_step_4_state: translation,
             final_text_state: translation,
-            step_4_target_text: translation,
-            step_5_target_text: translation,
-            final_translation_widget: translation,
+            step_5_target_text: translation, # Full text only where it can be edited
             step_5_prompt_text: prompt_5, # Update step 5 prompt
+            step_6_prompt_text: prompt_6,
+            viewer_version_radio: "Step 4 Translation",
+            **render_viewer(1, page_size, "Step 4 Translation", source_text, translation, None, None, translation),
         }
     return {} # No update on failure
 
-def run_step_5_ai(prompt_5, model_name, api_key, target_lang, final_text_state):
+def run_pipeline_steps(mode, model_name, api_key, source_lang, target_lang, source_text, gold_prompt, glossary_key, revision_plan, page_size, request: gr.Request = None, progress=gr.Progress()):
+    """Handles the 'Run Steps 4-6 Automatically' button click (pipelined or fused mode).
+
+    For a revision, only the new or modified paragraphs go through the pipeline.
+    With AFRIDE_API_URL set, the translation service does the work.
+    """
+    if not api_key:
+        raise gr.Error("Error: Invalid Gemini API Key. Please check your .env file.")
+    on_chunk = lambda done, total: progress((done, total), desc="Chunks completed")
+
+    def run(text):
+        return pipeline.run_mode(
+            mode, api_key, model_name, source_lang, target_lang, gold_prompt, text,
+            on_chunk=on_chunk, glossary=active_glossary(glossary_key),
+        )
+
+    try:
+        with scheduler_job(request, len(source_text or "")):
+            if service_client.enabled():
+                versions, summary = service_client.translate(
+                    mode, model_name, source_lang, target_lang, gold_prompt, source_text,
+                    client=glossary_key[2] if glossary_key else None,
+                    revision_of=revision_plan["project_id"] if revision_plan else None, on_chunk=on_chunk,
+                )
+            elif revision_plan:
+                versions = revision.run(revision_plan, source_text, lambda text: run(text)[0], pipeline.FUSED_VERSIONS)
+                summary = revision.format_plan(revision_plan)
+            else:
+                versions, plan = run(source_text)
+                summary = analysis.format_dedupe(plan)
+    except scheduler.Cancelled as e:
+        raise gr.Error(str(e))
+    except Exception as e:
+        if "API_KEY_INVALID" in str(e) or "PERMISSION_DENIED" in str(e):
+             raise gr.Error("Error: Invalid Gemini API Key. Please check your .env file.")
+        raise gr.Error(f"Error communicating with Gemini: {e}")
+
+    translation, edited, proofread = versions["translation"], versions["edited"], versions["proofread"]
+    gr.Info("Translation, edit and proofread complete.")
+    gr.Info(summary)
+    return {
+        translation_step_4_state: translation,
+        translation_step_5_state: edited,
+        translation_step_6_state: proofread,
+        final_text_state: proofread,
+        step_5_target_text: edited,
+        step_5_prompt_text: generate_step_5_prompt(source_lang, target_lang, REFERENCE_PLACEHOLDERS, SOURCE_PLACEHOLDER, TRANSLATION_PLACEHOLDER),
+        step_6_prompt_text: generate_step_6_prompt(target_lang, TRANSLATION_PLACEHOLDER),
+        viewer_version_radio: "Step 6 Proofread",
+        **render_viewer(1, page_size, "Step 6 Proofread", source_text, translation, edited, proofread, proofread),
+    }
+
+def run_multi_target(target_langs, mode, model_name, api_key, source_lang, source_text, gold_prompt, glossary_key, source_file_obj, request: gr.Request = None, progress=gr.Progress()):
+    """Handles the 'Translate Into All Selected' button: Steps 4-6 into several languages at once.
+
+    The source extracted in Step 1 and its dedupe plan are shared; each
+    language gets its own pipeline and glossary, under one call limit.
+    """
+    if not api_key:
+        raise gr.Error("Error: Invalid Gemini API Key. Please check your .env file.")
+    target_langs = [lang for lang in target_langs or [] if lang != source_lang]
+    if not target_langs:
+        raise gr.Error("Select at least one target language other than the source language.")
+
+    client = glossary_key[2] if glossary_key else glossary.DEFAULT_CLIENT
+    on_chunk = lambda done, total: progress((done, total), desc="Chunks completed (all languages)")
+    # Every language is another pass over the source, so the job is sized by all of them
+    with scheduler_job(request, len(source_text or "") * len(target_langs)):
+        if service_client.enabled():
+            try:
+                results, errors, summary = service_client.translate_targets(
+                    mode, model_name, source_lang, target_langs, gold_prompt, source_text, client, on_chunk
+                )
+            except Exception as e:
+                raise gr.Error(f"Error communicating with the translation service: {e}")
+        else:
+            results, errors, plan = pipeline.run_targets(
+                mode, api_key, model_name, source_lang, target_langs, gold_prompt, source_text, on_chunk=on_chunk,
+                glossaries={lang: glossary.get_glossary(source_lang, lang, client) for lang in target_langs},
+            )
+            summary = analysis.format_dedupe(plan)
+
+    lines = [f"- ✔️ {lang}" for lang in target_langs if lang in results]
+    lines += [f"- ❌ {lang}: {error}" for lang, error in errors.items()]
+    lines += ["", summary]
+    bundle_path = None
+    if results:
+        base_name = os.path.splitext(os.path.basename(source_file_obj.name))[0] if source_file_obj else "project"
+        bundle = create_delivery_bundle({lang: results[lang]["proofread"] for lang in target_langs if lang in results}, base_name)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".zip", prefix=f"translated_{base_name}_") as temp_f:
+            temp_f.write(bundle)
+            bundle_path = temp_f.name
+        gr.Info(f"Translated into {len(results)} language(s).")
+    return {
+        multi_target_md: "\n".join(lines),
+        multi_target_file: gr.File(value=bundle_path, label="Delivery Bundle (.zip)"),
+    }
+
+def run_step_5_ai(prompt_5, model_name, api_key, source_text, gold_prompt, glossary_key, translation_4, page_size, request: gr.Request = None):
     """Handles the 'Ask Gemini to Edit/Review (Step 5)' button click."""
-    edited_translation = call_gemini(api_key, model_name, prompt_5, "editing")
+    prompt = expand_prompt(prompt_5, gold_prompt, source_text, translation_4, glossary_terms_for(glossary_key, source_text))
+    with scheduler_job(request, len(source_text or "")):
+        edited_translation = call_gemini(api_key, model_name, prompt, "editing", "edit", source_text, translation_4)
     
     if edited_translation:
-        # Generate next prompt
-        prompt_6 = generate_step_6_prompt(target_lang, edited_translation)
-        
+        gr.Info("Edit complete.")
         return {
             translation_step_5_state: edited_translation,
             final_text_state: edited_translation,
             step_5_target_text: edited_translation,
-            final_translation_widget: edited_translation,
-            step_6_prompt_text: prompt_6, # Update step 6 prompt
+            viewer_version_radio: "Step 5 Edit",
+            **render_viewer(1, page_size, "Step 5 Edit", source_text, translation_4, edited_translation, None, edited_translation),
         }
     return {}
 
-def on_manual_edit(manual_text, target_lang, final_text_state):
+def on_manual_edit(manual_text):
     """Handles live manual editing in Step 5."""
-    # Generate next prompt based on the manual edit
-    prompt_6 = generate_step_6_prompt(target_lang, manual_text)
-    
+    # The Step 6 prompt references the final text by placeholder, so nothing else needs re-sending
     return {
+        translation_step_5_state: manual_text,
         final_text_state: manual_text,
-        final_translation_widget: manual_text,
-        step_6_prompt_text: prompt_6, # Update step 6 prompt in real-time
     }
 
-def run_step_6(prompt_6, model_name, api_key):
+def proofread_flagged(prompt_6, model_name, api_key, final_text, source_text, glossary_key):
+    """Proofreads only the segments local QA flags; returns (text, status message) or (None, None)."""
+    report = qa.check_document(source_text, final_text, active_glossary(glossary_key))
+    indices = report["flagged"]
+    if not report["issues"]:
+        return final_text, f"Local QA found no issues in {report['segments']} segments; no proofreading call was needed."
+    if not indices:
+        # Only document-level issues (e.g. paragraph counts differ): no segment to pick, so proofread it all
+        prompt = expand_prompt(prompt_6, translation_text=final_text)
+        result = call_gemini(api_key, model_name, prompt, "proofreading", "proofread", final_text,
+                             qa_failures=len(report["issues"]))
+        return result, "Local QA found document-level issues but no single flagged segment; proofread the full document."
+
+    flagged_text = qa.extract_segments(final_text, indices)
+    prompt = expand_prompt(prompt_6, translation_text=flagged_text)
+    # The flagged segments failed local QA: routing starts them on a stronger model
+    qa_failures = len(report["issues"])
+    result = call_gemini(api_key, model_name, prompt, "proofreading", "proofread", flagged_text, qa_failures=qa_failures)
+    if not result:
+        return None, None
+    merged = qa.merge_segments(final_text, indices, result)
+    if merged is None and len(alignment.paragraphs(flagged_text)) == len(indices):
+        # Paragraphs were merged or split: ask again for just these segments, numbered
+        prompt = alignment.numbered_prompt(prompt, (flagged_text,), flagged_text)
+        result = call_gemini(api_key, model_name, prompt, "proofreading", "proofread", flagged_text,
+                             qa_failures=qa_failures + 1)
+        if not result:
+            return None, None
+        segments = alignment.parse_numbered(result, len(indices))
+        merged = segments and qa.merge_segments(final_text, indices, "\n".join(segments))
+    if merged is None:
+        # Still misaligned; the full document is the safe fallback
+        gr.Warning("Proofread segments did not line up; proofreading the full document instead.")
+        prompt = expand_prompt(prompt_6, translation_text=final_text)
+        return call_gemini(api_key, model_name, prompt, "proofreading", "proofread", final_text), None
+    return merged, f"Sent {len(indices)} of {report['segments']} segments flagged by local QA to the proofreader."
+
+def run_step_6(prompt_6, flagged_only, model_name, api_key, final_text, source_text, glossary_key, translation_4, translation_5, page_size, request: gr.Request = None):
     """Handles the 'Final Proofread (Step 6)' button click."""
-    proofread_text = call_gemini(api_key, model_name, prompt_6, "proofreading")
+    with scheduler_job(request, len(final_text or "")):
+        if flagged_only:
+            proofread_text, status = proofread_flagged(prompt_6, model_name, api_key, final_text, source_text, glossary_key)
+        else:
+            prompt = expand_prompt(prompt_6, translation_text=final_text)
+            proofread_text = call_gemini(api_key, model_name, prompt, "proofreading", "proofread", final_text)
+            status = "Proofread the full document."
     
     if proofread_text:
+        gr.Info("Proofreading complete.")
         return {
             translation_step_6_state: proofread_text,
             final_text_state: proofread_text,
-            step_6_target_text: proofread_text,
-            final_translation_widget: proofread_text,
+            step_6_qa_info: status or "",
+            qa_report_md: run_qa_report(source_text, proofread_text, glossary_key),
+            viewer_version_radio: "Step 6 Proofread",
+            **render_viewer(1, page_size, "Step 6 Proofread", source_text, translation_4, translation_5, proofread_text, proofread_text),
         }
     return {}
 
+def run_qa_report(source_text, final_text, glossary_key):
+    """Handles the 'Run QA Checks' button click (Step 8)."""
+    if not final_text:
+        return "No translation to check yet."
+    return qa.format_report(qa.check_document(source_text, final_text, active_glossary(glossary_key)))
+
+def import_glossary(glossary_file, source_lang, target_lang, client):
+    """Handles the glossary 'Import Terms' button click."""
+    if not glossary_file:
+        raise gr.Error("Please upload a glossary file (two columns: source term, target term).")
+    try:
+        pairs = glossary.parse_glossary_file(glossary_file.name)
+    except Exception as e:
+        raise gr.Error(f"Could not read glossary file: {e}")
+    client = client or glossary.DEFAULT_CLIENT
+    count = glossary.import_terms(source_lang, target_lang, client, pairs)
+    total = len(active_glossary((source_lang, target_lang, client)) or ())
+    return f"✔️ Imported {count} terms into '{client}' ({source_lang} → {target_lang}); {total} terms in total."
+
 def download_docx(final_text, source_file_obj):
     """Creates the .docx file and returns its path for download."""
     if not final_text:
@@ -287,8 +560,24 @@ def download_docx(final_text, source_file_obj):
     except Exception as e:
         raise gr.Error(f"Error creating .docx file for download: {e}")
 
-def archive_project():
-    """Resets the entire UI to its initial state."""
+def archive_project(source_text, final_text, glossary_key, source_file_obj, translation_4, translation_5, translation_6,
+                    rating, feedback, request: gr.Request = None):
+    """Keeps the delivered project (TM, revision baseline and analytics archive) and resets the entire UI."""
+    name = os.path.basename(source_file_obj.name) if source_file_obj else "project"
+    tm_project_id = 0
+    if source_text and final_text and glossary_key:
+        tm_project_id, added = tm.save_project(name, *glossary_key, source_text, final_text)
+        if not added:
+            gr.Warning("Source and final paragraphs do not line up; the TM was not updated.")
+    if source_text and glossary_key:
+        source_lang, target_lang, client = glossary_key
+        texts = {"source": source_text, "translation": translation_4, "edited": translation_5,
+                 "proofread": translation_6, "final": final_text}
+        try:
+            archive.archive_project(name, session_user(request), client, source_lang, target_lang, texts,
+                                    _usage_meters.pop(session_key(request), None), rating, feedback, tm_project_id)
+        except Exception as e:
+            gr.Warning(f"The project could not be added to the analytics archive: {e}")
     gr.Info("Project archived. Ready for new project.")
     return {
         # Reset State
@@ -296,6 +585,8 @@ def archive_project():
         source_text_state: None,
         gold_prompt_state: "",
         source_file_obj_state: None,
+        glossary_key_state: None,
+        revision_plan_state: None,
         translation_step_4_state: None,
         translation_step_5_state: None,
         translation_step_6_state: None,
@@ -307,31 +598,41 @@ def archive_project():
         gold_pt_upload: gr.File(value=None, interactive=True),
         source_lang_dd: gr.Dropdown(value="English", interactive=True),
         target_lang_dd: gr.Dropdown(value="Portuguese", interactive=True),
+        client_tb: gr.Textbox(interactive=True),
+        revision_dd: gr.Dropdown(choices=revision_choices("English", "Portuguese"), value=NEW_PROJECT, interactive=True),
         start_button: gr.Button(interactive=True),
 
         # Reset Step 2
         word_count_label: "",
         gold_status_label: "",
-        source_text_widget: "",
+
+        # Reset Document Viewer
+        viewer_version_radio: VIEWER_VERSIONS[0],
+        viewer_start: 1,
+        viewer_info: "",
+        viewer_source_text: "",
+        viewer_target_text: "",
         
         # Reset Step 4
         step_4_prompt_text: "",
-        step_4_source_text: "",
-        step_4_target_text: "",
         
+        # Reset Multi-target
+        multi_target_cb: [],
+        multi_target_md: "",
+        multi_target_file: gr.File(value=None, label="Delivery Bundle (.zip)"),
+
         # Reset Step 5
         step_5_prompt_text: "",
-        step_5_source_text: "",
         step_5_target_text: "",
         
         # Reset Step 6
         step_6_prompt_text: "",
-        step_6_source_text: "",
-        step_6_target_text: "",
+        step_6_qa_info: "",
+
+        # Reset Step 8
+        qa_report_md: "",
 
         # Reset Step 9
-        final_source_widget: "",
-        final_translation_widget: "",
         download_file_widget: gr.File(value=None, label="Download Final Translation (.docx)"),
         
         # Reset Step 10
@@ -340,6 +641,7 @@ def archive_project():
 
         # Hide workflow
         step_2_accordion: gr.Accordion(visible=False),
+        viewer_accordion: gr.Accordion(visible=False),
         step_3_accordion: gr.Accordion(visible=False),
         step_4_accordion: gr.Accordion(visible=False),
         step_5_accordion: gr.Accordion(visible=False),
@@ -352,200 +654,345 @@ def archive_project():
 
 # --- Gradio UI Layout ---
 
-with gr.Blocks(theme=gr.themes.Soft(), title="Professional Translation Workflow") as demo:
+def build_demo():
+    """Builds the Gradio UI. Called on first access to `demo`, not at import time."""
+    # Event handlers return {component: update} dicts, so components live at module level
+    global demo
+    global api_key_state, source_text_state, gold_prompt_state, source_file_obj_state
+    global translation_step_4_state, translation_step_5_state, translation_step_6_state, final_text_state
+    global api_key_status, model_name_dd, gold_en_upload, gold_pt_upload
+    global glossary_key_state, revision_plan_state, revision_dd, client_tb, glossary_upload, glossary_import_button, glossary_status
+    global metrics_json, metrics_refresh_button, archive_report_md, archive_refresh_button
+    global source_file_upload, source_lang_dd, target_lang_dd, start_button
+    global word_count_label, gold_status_label
+    global viewer_accordion, viewer_version_radio, viewer_page_size_dd, viewer_start
+    global viewer_prev_button, viewer_info, viewer_next_button, viewer_source_text, viewer_target_text
+    global step_4_prompt_text, step_4_button, pipeline_mode_radio, pipeline_button, step_4_cancel_button
+    global multi_target_cb, multi_target_button, multi_target_md, multi_target_file
+    global step_5_prompt_text, step_5_button, step_5_cancel_button, step_5_target_text
+    global step_6_prompt_text, step_6_flagged_only, step_6_button, step_6_cancel_button, step_6_qa_info
+    global qa_button, qa_report_md
+    global prepare_download_button, download_file_widget
+    global feedback_slider, feedback_text, archive_button
+    global step_2_accordion, step_3_accordion, step_4_accordion, step_5_accordion, step_6_accordion
+    global step_7_accordion, step_8_accordion, step_9_accordion, step_10_accordion
+
+    with gr.Blocks(theme=gr.themes.Soft(), title="Professional Translation Workflow") as demo:
     
-    # --- Define State Variables ---
-    api_key_state = gr.State(None)
-    source_text_state = gr.State(None)
-    gold_prompt_state = gr.State("")
-    source_file_obj_state = gr.State(None)
-    translation_step_4_state = gr.State(None)
-    translation_step_5_state = gr.State(None)
-    translation_step_6_state = gr.State(None)
-    final_text_state = gr.State(None)
-
-    with gr.Row():
-        # --- Sidebar ---
-        with gr.Column(scale=1, min_width=350):
-            with gr.Group():
-                gr.Markdown("## ⚙️ Configuration")
-                api_key_status = gr.Markdown("✅ Gemini API Key loaded from .env" if os.getenv("GEMINI_API_KEY") else "❌ Gemini API Key not found in .env")
+        # --- Define State Variables ---
+        api_key_state = gr.State(None)
+        source_text_state = gr.State(None)
+        gold_prompt_state = gr.State("")
+        source_file_obj_state = gr.State(None)
+        glossary_key_state = gr.State(None)  # (source_lang, target_lang, client) of the project
+        revision_plan_state = gr.State(None)  # revision.plan_revision() result when revising a delivered project
+        translation_step_4_state = gr.State(None)
+        translation_step_5_state = gr.State(None)
+        translation_step_6_state = gr.State(None)
+        final_text_state = gr.State(None)
+
+        with gr.Row():
+            # --- Sidebar ---
+            with gr.Column(scale=1, min_width=350):
+                with gr.Group():
+                    gr.Markdown("## ⚙️ Configuration")
+                    api_key_status = gr.Markdown("✅ Gemini API Key loaded from .env" if os.getenv("GEMINI_API_KEY") else "❌ Gemini API Key not found in .env")
                 
-                gr.Markdown("### Select Model")
-                model_name_dd = gr.Dropdown(
-                    ['gemini-1.5-flash-latest', 'gemini-1.5-pro-latest'], 
-                    label="Gemini Model", 
-                    value='gemini-1.5-flash-latest'
-                )
-
-            with gr.Group():
-                gr.Markdown("## 🥇 Gold Standard Samples")
-                gr.Markdown("Upload paired EN/PT files for examples.")
-                gold_en_upload = gr.File(label="Upload English (EN) Files", file_count="multiple", file_types=[".txt", ".pdf", ".docx"])
-                gold_pt_upload = gr.File(label="Upload Portuguese (PT) Files", file_count="multiple", file_types=[".txt", ".pdf", ".docx"])
-
-        # --- Main Content ---
-        with gr.Column(scale=3):
-            gr.Markdown("# 🌐 Professional Translation Workflow Simulator")
-            gr.Markdown("This app simulates a 10-step translation process using Google Gemini.")
+                    gr.Markdown("### Select Model")
+                    model_name_dd = gr.Dropdown(
+                        [routing.AUTO_MODEL, *routing.MODEL_TIERS, 'gemini-1.5-flash-latest', 'gemini-1.5-pro-latest'], 
+                        label="Gemini Model", 
+                        value=routing.AUTO_MODEL,
+                        info="'auto' uses the cheapest model that passes local checks, escalating only when needed."
+                    )
+
+                with gr.Accordion("📈 Metrics", open=False):
+                    metrics_json = gr.JSON(label="Service Metrics")
+                    metrics_refresh_button = gr.Button("Refresh Metrics", size="sm")
+
+                with gr.Accordion("🗃️ Project Archive", open=False):
+                    archive_report_md = gr.Markdown()
+                    archive_refresh_button = gr.Button("Analytics (last 365 days)", size="sm")
+
+                with gr.Group():
+                    gr.Markdown("## 🥇 Gold Standard Samples")
+                    gr.Markdown("Upload paired EN/PT files for examples.")
+                    gold_en_upload = gr.File(label="Upload English (EN) Files", file_count="multiple", file_types=[".txt", ".pdf", ".docx"])
+                    gold_pt_upload = gr.File(label="Upload Portuguese (PT) Files", file_count="multiple", file_types=[".txt", ".pdf", ".docx"])
+
+                with gr.Group():
+                    gr.Markdown("## 📚 Glossary")
+                    gr.Markdown("Two-column CSV/TSV (source term, target term) for the selected languages and client.")
+                    glossary_upload = gr.File(label="Upload Glossary", file_types=list(glossary.SUPPORTED_EXTENSIONS))
+                    glossary_import_button = gr.Button("Import Terms", size="sm")
+                    glossary_status = gr.Markdown()
+
+            # --- Main Content ---
+            with gr.Column(scale=3):
+                gr.Markdown("# 🌐 Professional Translation Workflow Simulator")
+                gr.Markdown("This app simulates a 10-step translation process using Google Gemini.")
             
-            # --- Step 1: Inquiry ---
-            with gr.Accordion("1. Client Inquiry & Project Analysis", open=True):
-                with gr.Row():
-                    with gr.Column():
-                        source_file_upload = gr.File(label="Upload your source document", file_types=[".txt", ".pdf", ".docx"])
-                    with gr.Column():
-                        lang_list = ["English", "Portuguese", "Spanish", "French", "German"]
-                        source_lang_dd = gr.Dropdown(lang_list, label="Source Language", value="English")
-                        target_lang_dd = gr.Dropdown(lang_list, label="Target Language", value="Portuguese")
-                start_button = gr.Button("🚀 Start Project & Analyze", variant="primary")
+                # --- Step 1: Inquiry ---
+                with gr.Accordion("1. Client Inquiry & Project Analysis", open=True):
+                    with gr.Row():
+                        with gr.Column():
+                            source_file_upload = gr.File(label="Upload your source document", file_types=[".txt", ".pdf", ".docx"])
+                        with gr.Column():
+                            lang_list = ["English", "Portuguese", "Spanish", "French", "German"]
+                            source_lang_dd = gr.Dropdown(lang_list, label="Source Language", value="English")
+                            target_lang_dd = gr.Dropdown(lang_list, label="Target Language", value="Portuguese")
+                            client_tb = gr.Textbox(label="Client (selects the glossary)", value=glossary.DEFAULT_CLIENT)
+                            revision_dd = gr.Dropdown(
+                                revision_choices("English", "Portuguese"), value=NEW_PROJECT, label="Revision of",
+                                info="Reuses the approved translations of unchanged paragraphs from a delivered project.",
+                            )
+                    start_button = gr.Button("🚀 Start Project & Analyze", variant="primary")
             
-            # --- Steps 2-10 (Initially Hidden) ---
-            with gr.Accordion("2. Project Preparation", open=True, visible=False) as step_2_accordion:
-                word_count_label = gr.Markdown("**Project Scope:** 0 words")
-                gold_status_label = gr.Markdown("ℹ️ No gold standard samples loaded.")
-                gr.Markdown("### Extracted Source Text (Preview)")
-                source_text_widget = gr.Textbox(label="Source Text", lines=8, interactive=False)
-
-            with gr.Accordion("3. Translator Selection", visible=False) as step_3_accordion:
-                gr.Info("🤖 Qualified native linguist (Gemini) has been assigned.")
-
-            with gr.Accordion("4. Translation Phase", visible=False) as step_4_accordion:
-                step_4_prompt_text = gr.Textbox(label="Step 4 Prompt (Editable)", lines=8, interactive=True)
-                step_4_button = gr.Button("Run Translation (Step 4)", variant="secondary")
-                with gr.Row():
-                    step_4_source_text = gr.Textbox(label="Source Text", lines=10, interactive=False)
-                    step_4_target_text = gr.Textbox(label="Initial Translation (from Gemini)", lines=10, interactive=False)
-
-            with gr.Accordion("5. Editing (Second Linguist Review)", visible=False) as step_5_accordion:
-                step_5_prompt_text = gr.Textbox(label="Step 5 Prompt (Editable)", lines=8, interactive=True)
-                step_5_button = gr.Button("🤖 Ask Gemini to Edit/Review (Step 5)", variant="secondary")
-                with gr.Row():
-                    step_5_source_text = gr.Textbox(label="Source Text", lines=10, interactive=False)
+                # --- Steps 2-10 (Initially Hidden) ---
+                with gr.Accordion("2. Project Preparation", open=True, visible=False) as step_2_accordion:
+                    word_count_label = gr.Markdown("**Project Scope:** 0 words")
+                    gold_status_label = gr.Markdown("ℹ️ No gold standard samples loaded.")
+
+                # --- Document Viewer (single place documents are displayed, one page at a time) ---
+                with gr.Accordion("📄 Document Viewer", open=True, visible=False) as viewer_accordion:
+                    with gr.Row():
+                        viewer_version_radio = gr.Radio(VIEWER_VERSIONS, value=VIEWER_VERSIONS[0], label="Compare Source With")
+                        viewer_page_size_dd = gr.Dropdown(doc_viewer.PAGE_SIZES, value=doc_viewer.PAGE_SIZE, label="Paragraphs per Page")
+                        viewer_start = gr.Number(value=1, precision=0, minimum=1, label="From Paragraph")
+                    with gr.Row():
+                        viewer_prev_button = gr.Button("‹ Previous")
+                        viewer_info = gr.Markdown("")
+                        viewer_next_button = gr.Button("Next ›")
+                    with gr.Row():
+                        viewer_source_text = gr.Textbox(label="Source Text", lines=12, interactive=False)
+                        viewer_target_text = gr.Textbox(label="Translation", lines=12, interactive=False)
+
+                with gr.Accordion("3. Translator Selection", visible=False) as step_3_accordion:
+                    gr.Info("🤖 Qualified native linguist (Gemini) has been assigned.")
+
+                with gr.Accordion("4. Translation Phase", visible=False) as step_4_accordion:
+                    step_4_prompt_text = gr.Textbox(label="Step 4 Prompt (Editable)", lines=8, interactive=True)
+                    step_4_button = gr.Button("Run Translation (Step 4)", variant="secondary")
+                    gr.Markdown("ℹ️ The translation opens in the Document Viewer.")
+                    pipeline_mode_radio = gr.Radio(list(pipeline.PIPELINE_MODES), value=pipeline.PIPELINE_MODES[0], label="Automatic Steps 4-6")
+                    pipeline_button = gr.Button("⚡ Run Steps 4-6 Automatically", variant="secondary")
+                    step_4_cancel_button = gr.Button("⏹️ Cancel", variant="stop", size="sm")
+                    gr.Markdown("ℹ️ Pipelined mode edits and proofreads each chunk as soon as it is translated; fused mode returns all three versions in one call per chunk. Use the separate steps when an audit trail of each prompt is needed.")
+                    with gr.Group():
+                        gr.Markdown("### 🌍 Multi-target")
+                        multi_target_cb = gr.CheckboxGroup(lang_list, label="Also Deliver In (Steps 4-6, mode above)")
+                        multi_target_button = gr.Button("🌍 Translate Into All Selected", variant="secondary")
+                        multi_target_md = gr.Markdown()
+                        multi_target_file = gr.File(label="Delivery Bundle (.zip)")
+
+                with gr.Accordion("5. Editing (Second Linguist Review)", visible=False) as step_5_accordion:
+                    step_5_prompt_text = gr.Textbox(label="Step 5 Prompt (Editable)", lines=8, interactive=True)
+                    step_5_button = gr.Button("🤖 Ask Gemini to Edit/Review (Step 5)", variant="secondary")
+                    step_5_cancel_button = gr.Button("⏹️ Cancel", variant="stop", size="sm")
                     step_5_target_text = gr.Textbox(label="Manually Edit Translation", lines=10, interactive=True) # <-- MANUAL EDITING
 
-            with gr.Accordion("6. Proofreading / QA", visible=False) as step_6_accordion:
-                step_6_prompt_text = gr.Textbox(label="Step 6 Prompt (Editable)", lines=8, interactive=True)
-                step_6_button = gr.Button("🤖 Ask Gemini for Final Proofread (Step 6)", variant="secondary")
-                with gr.Row():
-                    step_6_source_text = gr.Textbox(label="Source Text", lines=10, interactive=False)
-                    step_6_target_text = gr.Textbox(label="Final Proofread Text", lines=10, interactive=False)
+                with gr.Accordion("6. Proofreading / QA", visible=False) as step_6_accordion:
+                    step_6_prompt_text = gr.Textbox(label="Step 6 Prompt (Editable)", lines=8, interactive=True)
+                    step_6_flagged_only = gr.Checkbox(value=True, label="Only proofread segments flagged by local QA")
+                    step_6_button = gr.Button("🤖 Ask Gemini for Final Proofread (Step 6)", variant="secondary")
+                    step_6_cancel_button = gr.Button("⏹️ Cancel", variant="stop", size="sm")
+                    step_6_qa_info = gr.Markdown()
 
-            with gr.Accordion("7. Desktop Publishing (DTP)", visible=False) as step_7_accordion:
-                gr.Info("ℹ️ DTP would occur here. This app delivers a clean .docx file.")
+                with gr.Accordion("7. Desktop Publishing (DTP)", visible=False) as step_7_accordion:
+                    gr.Info("ℹ️ DTP would occur here. This app delivers a clean .docx file.")
 
-            with gr.Accordion("8. Final Quality Control", visible=False) as step_8_accordion:
-                gr.Success("✔️ PM final check complete.")
+                with gr.Accordion("8. Final Quality Control", visible=False) as step_8_accordion:
+                    qa_button = gr.Button("🔎 Run QA Checks", variant="secondary")
+                    qa_report_md = gr.Markdown()
 
-            with gr.Accordion("9. Delivery", visible=False) as step_9_accordion:
-                gr.Markdown("## 🎉 Final Deliverable Ready")
-                with gr.Row():
-                    final_source_widget = gr.Textbox(label="Final Source Text", lines=12, interactive=False)
-                    final_translation_widget = gr.Textbox(label="Final Translation", lines=12, interactive=False)
+                with gr.Accordion("9. Delivery", visible=False) as step_9_accordion:
+                    gr.Markdown("## 🎉 Final Deliverable Ready")
+                    gr.Markdown("Review the final text in the Document Viewer by selecting **Final**.")
                 
-                prepare_download_button = gr.Button("⬇️ Prepare Download (.docx)")
-                download_file_widget = gr.File(label="Download Final Translation (.docx)")
+                    prepare_download_button = gr.Button("⬇️ Prepare Download (.docx)")
+                    download_file_widget = gr.File(label="Download Final Translation (.docx)")
+
+                with gr.Accordion("10. Client Feedback & Archiving", visible=False) as step_10_accordion:
+                    feedback_slider = gr.Slider(1, 5, value=4, step=1, label="Please rate this translation:")
+                    feedback_text = gr.Textbox(label="Provide any feedback (optional):", lines=3)
+                    archive_button = gr.Button("Submit Feedback & Archive Project")
 
-            with gr.Accordion("10. Client Feedback & Archiving", visible=False) as step_10_accordion:
-                feedback_slider = gr.Slider(1, 5, value=4, step=1, label="Please rate this translation:")
-                feedback_text = gr.Textbox(label="Provide any feedback (optional):", lines=3)
-                archive_button = gr.Button("Submit Feedback & Archive Project")
+        # --- Wire up Event Handlers ---
 
-    # --- Wire up Event Handlers ---
+        # Metrics (Gemini connection reuse, latencies, caches)
+        metrics_refresh_button.click(fn=metrics.snapshot, inputs=None, outputs=[metrics_json])
+        archive_refresh_button.click(fn=archive.format_report, inputs=None, outputs=[archive_report_md])
     
-    # Step 1
-    start_button.click(
-        fn=start_project,
-        inputs=[source_file_upload, gold_en_upload, gold_pt_upload, source_lang_dd, target_lang_dd],
-        outputs=[
-            api_key_state, source_text_state, gold_prompt_state, source_file_obj_state,
-            word_count_label, gold_status_label, source_text_widget,
-            step_4_prompt_text, step_4_source_text,
-            step_5_source_text,
-            step_6_source_text,
-            final_source_widget,
-            step_2_accordion, step_3_accordion, step_4_accordion, step_5_accordion,
-            step_6_accordion, step_7_accordion, step_8_accordion, step_9_accordion, step_10_accordion,
-            source_file_upload, gold_en_upload, gold_pt_upload, source_lang_dd, target_lang_dd, start_button
-        ]
-    )
+        # Step 1
+        start_button.click(
+            fn=start_project,
+            inputs=[source_file_upload, gold_en_upload, gold_pt_upload, source_lang_dd, target_lang_dd, client_tb, revision_dd],
+            outputs=[
+                api_key_state, source_text_state, gold_prompt_state, source_file_obj_state, glossary_key_state, revision_plan_state,
+                word_count_label, gold_status_label,
+                step_4_prompt_text,
+                viewer_version_radio, viewer_start, viewer_info, viewer_source_text, viewer_target_text,
+                step_2_accordion, viewer_accordion, step_3_accordion, step_4_accordion, step_5_accordion,
+                step_6_accordion, step_7_accordion, step_8_accordion, step_9_accordion, step_10_accordion,
+                source_file_upload, gold_en_upload, gold_pt_upload, source_lang_dd, target_lang_dd, client_tb, revision_dd, start_button
+            ]
+        )
+        source_lang_dd.change(fn=refresh_revisions, inputs=[source_lang_dd, target_lang_dd], outputs=[revision_dd])
+        target_lang_dd.change(fn=refresh_revisions, inputs=[source_lang_dd, target_lang_dd], outputs=[revision_dd])
+
+        # Glossary
+        glossary_import_button.click(
+            fn=import_glossary,
+            inputs=[glossary_upload, source_lang_dd, target_lang_dd, client_tb],
+            outputs=[glossary_status]
+        )
     
-    # Step 4
-    step_4_button.click(
-        fn=run_step_4,
-        inputs=[
-            step_4_prompt_text, model_name_dd, api_key_state, 
-            source_lang_dd, target_lang_dd, source_text_state, gold_prompt_state
-        ],
-        outputs=[
-            translation_step_4_state, final_text_state,
-            step_4_target_text, step_5_target_text, final_translation_widget,
-            step_5_prompt_text
-        ]
-    )
-
-    # Step 5 (AI)
-    step_5_button.click(
-        fn=run_step_5_ai,
-        inputs=[step_5_prompt_text, model_name_dd, api_key_state, target_lang_dd, final_text_state],
-        outputs=[
-            translation_step_5_state, final_text_state,
-            step_5_target_text, final_translation_widget,
-            step_6_prompt_text
-        ]
-    )
+        # Document Viewer (all document states are server-side inputs; only one page goes out)
+        viewer_outputs = [viewer_start, viewer_info, viewer_source_text, viewer_target_text]
+        viewer_texts = [source_text_state, translation_step_4_state, translation_step_5_state, translation_step_6_state, final_text_state]
+        viewer_inputs = [viewer_start, viewer_page_size_dd, viewer_version_radio] + viewer_texts
+
+        viewer_version_radio.input(fn=lambda *args: render_viewer(1, *args[1:]), inputs=viewer_inputs, outputs=viewer_outputs)
+        viewer_page_size_dd.input(fn=render_viewer, inputs=viewer_inputs, outputs=viewer_outputs)
+        viewer_start.submit(fn=render_viewer, inputs=viewer_inputs, outputs=viewer_outputs)
+        viewer_prev_button.click(fn=functools.partial(turn_viewer_page, -1), inputs=viewer_inputs, outputs=viewer_outputs)
+        viewer_next_button.click(fn=functools.partial(turn_viewer_page, 1), inputs=viewer_inputs, outputs=viewer_outputs)
+
+        # Step 4
+        step_4_event = step_4_button.click(
+            fn=run_step_4,
+            inputs=[
+                step_4_prompt_text, model_name_dd, api_key_state, 
+                source_lang_dd, target_lang_dd, source_text_state, gold_prompt_state, glossary_key_state, viewer_page_size_dd
+            ],
+            outputs=[
+                translation_step_4_state, final_text_state,
+                step_5_target_text, step_5_prompt_text, step_6_prompt_text,
+                viewer_version_radio, *viewer_outputs
+            ]
+        )
+
+        # Steps 4-6 (pipelined or fused)
+        pipeline_event = pipeline_button.click(
+            fn=run_pipeline_steps,
+            inputs=[
+                pipeline_mode_radio, model_name_dd, api_key_state,
+                source_lang_dd, target_lang_dd, source_text_state, gold_prompt_state, glossary_key_state, revision_plan_state,
+                viewer_page_size_dd
+            ],
+            outputs=[
+                translation_step_4_state, translation_step_5_state, translation_step_6_state, final_text_state,
+                step_5_target_text, step_5_prompt_text, step_6_prompt_text,
+                viewer_version_radio, *viewer_outputs
+            ]
+        )
+
+        # Multi-target (one source, several languages)
+        multi_target_event = multi_target_button.click(
+            fn=run_multi_target,
+            inputs=[
+                multi_target_cb, pipeline_mode_radio, model_name_dd, api_key_state,
+                source_lang_dd, source_text_state, gold_prompt_state, glossary_key_state, source_file_obj_state
+            ],
+            outputs=[multi_target_md, multi_target_file]
+        )
+
+        # Step 5 (AI)
+        step_5_event = step_5_button.click(
+            fn=run_step_5_ai,
+            inputs=[
+                step_5_prompt_text, model_name_dd, api_key_state,
+                source_text_state, gold_prompt_state, glossary_key_state, translation_step_4_state, viewer_page_size_dd
+            ],
+            outputs=[
+                translation_step_5_state, final_text_state,
+                step_5_target_text, viewer_version_radio, *viewer_outputs
+            ]
+        )
     
-    # Step 5 (Manual Edit)
-    step_5_target_text.input(
-        fn=on_manual_edit,
-        inputs=[step_5_target_text, target_lang_dd, final_text_state],
-        outputs=[final_text_state, final_translation_widget, step_6_prompt_text]
-    )
+        # Step 5 (Manual Edit)
+        step_5_target_text.input(
+            fn=on_manual_edit,
+            inputs=[step_5_target_text],
+            outputs=[translation_step_5_state, final_text_state]
+        )
     
-    # Step 6
-    step_6_button.click(
-        fn=run_step_6,
-        inputs=[step_6_prompt_text, model_name_dd, api_key_state],
-        outputs=[
-            translation_step_6_state, final_text_state,
-            step_6_target_text, final_translation_widget
-        ]
-    )
+        # Step 6
+        step_6_event = step_6_button.click(
+            fn=run_step_6,
+            inputs=[
+                step_6_prompt_text, step_6_flagged_only, model_name_dd, api_key_state, final_text_state,
+                source_text_state, glossary_key_state, translation_step_4_state, translation_step_5_state, viewer_page_size_dd
+            ],
+            outputs=[
+                translation_step_6_state, final_text_state, step_6_qa_info, qa_report_md,
+                viewer_version_radio, *viewer_outputs
+            ]
+        )
+
+        # Cancel: ends the UI event and cancels the session's model calls (scheduler.py)
+        step_4_cancel_button.click(fn=cancel_run, inputs=None, outputs=None, cancels=[step_4_event, pipeline_event, multi_target_event])
+        step_5_cancel_button.click(fn=cancel_run, inputs=None, outputs=None, cancels=[step_5_event])
+        step_6_cancel_button.click(fn=cancel_run, inputs=None, outputs=None, cancels=[step_6_event])
+
+        # Step 8
+        qa_button.click(fn=run_qa_report, inputs=[source_text_state, final_text_state, glossary_key_state], outputs=[qa_report_md])
     
-    # Step 9
-    prepare_download_button.click(
-        fn=download_docx,
-        inputs=[final_text_state, source_file_obj_state],
-        outputs=[download_file_widget]
-    )
-
-    # Step 10
-    archive_button.click(
-        fn=archive_project,
-        inputs=None,
-        outputs=[
-            # State
-            api_key_state, source_text_state, gold_prompt_state, source_file_obj_state,
-            translation_step_4_state, translation_step_5_state, translation_step_6_state, final_text_state,
-            # Step 1
-            source_file_upload, gold_en_upload, gold_pt_upload, source_lang_dd, target_lang_dd, start_button,
-            # Step 2
-            word_count_label, gold_status_label, source_text_widget,
-            # Step 4
-            step_4_prompt_text, step_4_source_text, step_4_target_text,
-            # Step 5
-            step_5_prompt_text, step_5_source_text, step_5_target_text,
-            # Step 6
-            step_6_prompt_text, step_6_source_text, step_6_target_text,
-            # Step 9
-            final_source_widget, final_translation_widget, download_file_widget,
-            # Step 10
-            feedback_slider, feedback_text,
-            # Accordions
-            step_2_accordion, step_3_accordion, step_4_accordion, step_5_accordion,
-            step_6_accordion, step_7_accordion, step_8_accordion, step_9_accordion, step_10_accordion,
-        ]
-    )
+        # Step 9
+        prepare_download_button.click(
+            fn=download_docx,
+            inputs=[final_text_state, source_file_obj_state],
+            outputs=[download_file_widget]
+        )
+
+        # Step 10
+        archive_button.click(
+            fn=archive_project,
+            inputs=[
+                source_text_state, final_text_state, glossary_key_state, source_file_obj_state,
+                translation_step_4_state, translation_step_5_state, translation_step_6_state, feedback_slider, feedback_text,
+            ],
+            outputs=[
+                # State
+                api_key_state, source_text_state, gold_prompt_state, source_file_obj_state, glossary_key_state, revision_plan_state,
+                translation_step_4_state, translation_step_5_state, translation_step_6_state, final_text_state,
+                # Step 1
+                source_file_upload, gold_en_upload, gold_pt_upload, source_lang_dd, target_lang_dd, client_tb, revision_dd, start_button,
+                # Step 2
+                word_count_label, gold_status_label,
+                # Document Viewer
+                viewer_version_radio, viewer_start, viewer_info, viewer_source_text, viewer_target_text,
+                # Step 4
+                step_4_prompt_text,
+                # Multi-target
+                multi_target_cb, multi_target_md, multi_target_file,
+                # Step 5
+                step_5_prompt_text, step_5_target_text,
+                # Step 6
+                step_6_prompt_text, step_6_qa_info,
+                # Step 8
+                qa_report_md,
+                # Step 9
+                download_file_widget,
+                # Step 10
+                feedback_slider, feedback_text,
+                # Accordions
+                step_2_accordion, viewer_accordion, step_3_accordion, step_4_accordion, step_5_accordion,
+                step_6_accordion, step_7_accordion, step_8_accordion, step_9_accordion, step_10_accordion,
+            ]
+        )
+
+    return demo
+
+def __getattr__(name):
+    # `demo` is built lazily so importing this module (tools, tests, `gradio` CLI) stays cheap
+    if name == "demo":
+        return build_demo()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    demo.launch()
\ No newline at end of file
+    demo = build_demo()
+    demo.launch(prevent_thread_lock=True)
+    # Server is accepting traffic; preload parsers, model client and gold corpus in the background
+    warmup.start_background_warmup()
+    demo.block_thread()
\ No newline at end of file
@@ -1,13 +1,31 @@
 import streamlit as st
-import google.generativeai as genai
-import pdfplumber
-import docx  # Used for reading and creating .docx files
-import io
+import contextlib
 import os
-import json
+import threading
+import time
 import datetime
 from dotenv import load_dotenv
-
+import user_store
+import access_log
+import blob_store
+import alignment
+import analysis
+import archive
+import dedupe
+import delivery
+import extraction
+import glossary
+import gold_cache
+import metrics
+import pipeline
+import qa
+import revision
+import routing
+import scheduler
+import service_client
+import tm
+import usage
+import warmup
 # ====================================================
 #              🔐 AUTHENTICATION SYSTEM
 # ====================================================
@@ -15,56 +33,33 @@ from dotenv import load_dotenv
 # --- Load .env variables (for ADMIN_PASSWORD and GEMINI_API_KEY) ---
 load_dotenv()
 
-USER_DB_FILE = "users.json"
-LOG_FILE = "access_log.txt"
+USER_DB_FILE = user_store.USER_DB_PATH
 SESSION_TIMEOUT_MIN = 15
+BACKGROUND_POLL_S = 0.25  # how often a running job's status is redrawn (and a Cancel click noticed)
 
 # --- Auth Utility Functions ---
 
 def load_users():
-    """Load user database from JSON file."""
-    if os.path.exists(USER_DB_FILE):
-        with open(USER_DB_FILE, "r") as f:
-            return json.load(f)
-    else:
-        # Create an empty users.json if it doesn't exist
-        save_users({})
-        return {}
+    """Load the user database (cached in-process, refreshed when the store changes)."""
+    return user_store.get_all_users(USER_DB_FILE)
 
 def save_users(users):
-    """Save user database to JSON file."""
-    with open(USER_DB_FILE, "w") as f:
-        json.dump(users, f, indent=4)
+    """Save user records to the database (insert or update, never a whole-file rewrite)."""
+    user_store.upsert_users(users, USER_DB_FILE)
 
 def log_event(username, event):
-    """Append a timestamped event to access_log.txt."""
+    """Queue a timestamped event for the buffered, rotating access log."""
     try:
-        with open(LOG_FILE, "a") as f:
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            f.write(f"[{timestamp}] {username}: {event}\n")
+        access_log.log_event(username, event)
     except Exception as e:
         print(f"Error writing to log: {e}")
 
-def read_logs():
-    """Read logs into a list of dicts."""
-    if not os.path.exists(LOG_FILE):
-        return []
-    with open(LOG_FILE, "r") as f:
-        lines = f.readlines()
-    logs = []
-    for line in lines:
-        try:
-            timestamp, rest = line.strip().split("] ", 1)
-            timestamp = timestamp.strip("[")
-            username, event = rest.split(":", 1)
-            logs.append({
-                "timestamp": timestamp,
-                "username": username.strip(),
-                "event": event.strip()
-            })
-        except Exception:
-            continue
-    return logs
+def read_logs(start=None, end=None, username=None, kind=None, offset=0, limit=None):
+    """Read (filtered, paginated) log records, newest first, as a list of dicts."""
+    records, _ = access_log.query_logs(
+        start=start, end=end, username=username, kind=kind, offset=offset, limit=limit
+    )
+    return [{"timestamp": r["timestamp"], "username": r["username"], "event": r["event"]} for r in records]
 
 def is_session_expired():
     if "last_activity" not in st.session_state:
@@ -84,12 +79,20 @@ def login_ui():
     password = st.text_input("Password", type="password")
 
     if st.button("Login"):
-        users = load_users()
+        user = user_store.get_user(username, USER_DB_FILE)
         
         # Check password directly (plaintext)
-        if username in users and users[username]["password"] == password:
+        if user and user["password"] == password:
+            if service_client.enabled():
+                # The translation service authenticates this user with a token of their own
+                try:
+                    st.session_state.service_token = service_client.login(username, password)
+                except Exception as e:
+                    st.error(f"Could not sign in to the translation service: {e}")
+                    st.stop()
             st.session_state.authenticated = True
             st.session_state.username = username
+            st.session_state.role = user["role"]
             update_activity()
             st.success(f"Welcome {username} 👋")
             log_event(username, "Logged in")
@@ -139,17 +142,76 @@ def admin_panel():
     new_pass = st.text_input("New password", type="password")
     role = st.selectbox("Role", ["user", "admin"])
     if st.button("Add User"):
-        if new_user in users:
-            st.error("User already exists.")
-        elif not new_user or not new_pass:
+        if not new_user or not new_pass:
             st.error("Please fill in all fields.")
+        elif not user_store.add_user(new_user, new_pass, role, USER_DB_FILE):
+            st.error("User already exists.")
         else:
-            users[new_user] = {"password": new_pass, "role": role}
-            save_users(users)
             log_event("ADMIN", f"Created new user: {new_user}")
             st.success(f"User '{new_user}' added successfully.")
             st.rerun()
-    # ... (rest of admin panel logic for delete users and view logs) ...
+
+    st.write("### 📈 Metrics")
+    st.json(metrics.snapshot(), expanded=False)
+
+    st.write("### 🧭 Model Routing")
+    routing_stats = routing.summarize()
+    if routing_stats:
+        st.table([{"Step / Model": key, **entry} for key, entry in routing_stats.items()])
+    else:
+        st.info(f"No routed calls logged in the last {routing.ROUTING_SUMMARY_DAYS:g} days.")
+
+    st.write("### 🗃️ Project Archive")
+    days = st.number_input("Analytics period (days)", 1, 3650, 365)
+    st.markdown(archive.format_report(days))
+
+    log_viewer()
+
+def log_viewer(page_size=50):
+    """Tail-following, paginated access log view with incrementally updated counts."""
+    st.write("### 📜 Access Logs")
+
+    # Counts are folded in from the last stored offset, so this only reads new bytes
+    aggregates = access_log.update_aggregates()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Events", aggregates["events"])
+    col2.metric("Logins", sum(aggregates["logins_per_user"].values()))
+    col3.metric("Translations", sum(aggregates["translations_per_pair"].values()))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("Logins per user")
+        st.table(sorted(
+            ({"Username": u, "Logins": n} for u, n in aggregates["logins_per_user"].items()),
+            key=lambda row: -row["Logins"],
+        ))
+    with col2:
+        st.caption("Translations per language pair")
+        st.table(sorted(
+            ({"Language Pair": p, "Translations": n} for p, n in aggregates["translations_per_pair"].items()),
+            key=lambda row: -row["Translations"],
+        ))
+
+    # Stack of cursors for the pages we have walked back through; [None] = newest
+    if "log_cursors" not in st.session_state:
+        st.session_state.log_cursors = [None]
+    cursors = st.session_state.log_cursors
+
+    records, next_cursor = access_log.tail_page(cursors[-1], limit=page_size)
+
+    nav1, nav2, nav3 = st.columns(3)
+    if nav1.button("⏮ Newest", disabled=len(cursors) == 1):
+        st.session_state.log_cursors = [None]
+        st.rerun()
+    if nav2.button("‹ Newer", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if nav3.button("Older ›", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+
+    st.caption(f"Page {len(cursors)} — {len(records)} entries, newest first")
+    st.table([{"Timestamp": r["timestamp"], "Username": r["username"], "Event": r["event"]} for r in records])
 
 
 # ====================================================
@@ -168,32 +230,17 @@ st.set_page_config(
 def read_file(uploaded_file):
     """Reads the content of an uploaded file (txt, pdf, docx)."""
     try:
-        file_type = uploaded_file.type
         file_name = uploaded_file.name
 
-        if file_type == "text/plain":
-            return uploaded_file.getvalue().decode("utf-8")
-        
-        elif file_type == "application/pdf":
-            with pdfplumber.open(uploaded_file) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                return text
-        
-        elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document" or file_name.endswith('.docx'):
-            doc = docx.Document(uploaded_file)
-            text = ""
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-            return text
-        
-        else:
-            st.error(f"Unsupported file format: {file_type} ({file_name})")
-            return None
-            
+        # Extraction runs on the translation service when one is configured
+        if service_client.enabled():
+            uploaded_file.seek(0)
+            return service_client.extract(uploaded_file, file_name)
+
+        # Parsed from the upload's own buffer (no copy); large files are spooled to disk
+        # and parsed in a worker process (extraction.py)
+        return extraction.extract_upload(uploaded_file.getbuffer(), file_name)
+
     except Exception as e:
         st.error(f"Error reading file {uploaded_file.name}: {e}")
         return None
@@ -207,48 +254,247 @@ def build_gold_standard_prompt(en_files, pt_files):
     if len(en_files) != len(pt_files):
         st.sidebar.warning("Warning: The number of English and Portuguese gold standard files does not match. Using the minimum common number.")
 
-    prompt = "\n\nHere are some 'gold standard' examples of English-to-Portuguese translations to guide your tone and terminology. Follow these examples closely:\n"
-    
-    for i, (en_file, pt_file) in enumerate(zip(en_files, pt_files)):
-        en_text = read_file(en_file)
-        pt_text = read_file(pt_file)
-        
-        if en_text and pt_text:
-            prompt += f"\n--- Gold Standard Example {i+1} ---\n"
-            prompt += f"[English]:\n{en_text}\n"
-            prompt += f"[Portuguese]:\n{pt_text}\n"
-            prompt += "--- End Example ---\n"
-            
-    return prompt
+    # Sessions using the same gold set share one cached prompt, keyed by file contents
+    pairs = list(zip(en_files, pt_files))
+    key = [(gold_cache.content_hash(en_file.getbuffer()), gold_cache.content_hash(pt_file.getbuffer())) for en_file, pt_file in pairs]
+    return gold_cache.get_or_build(key, lambda: gold_cache.format_gold_prompt(
+        (read_file(en_file), read_file(pt_file)) for en_file, pt_file in pairs
+    ))
+
+@st.cache_resource
+def start_warmup():
+    """Preloads parsers, the model client and the gold corpus in the background, once per process."""
+    return warmup.start_background_warmup()
+
+def call_gemini(api_key, prompt, task_description, step, segment_text, reference_text=None, qa_failures=0):
+    """Generic function to call the Gemini API with error handling (through the translation service when one is configured)."""
+    def generate(on_chunk):
+        if service_client.enabled():
+            return service_client.generate(routing.AUTO_MODEL, step, prompt, segment_text, reference_text, qa_failures)
+        return pipeline.call_model(api_key, routing.AUTO_MODEL, step, prompt, segment_text, reference_text,
+                                   qa_failures=qa_failures)
 
-def call_gemini(api_key, prompt, task_description):
-    """Generic function to call the Gemini API with error handling."""
     try:
-        genai.configure(api_key=api_key)
-        
-        # Using your specified model name
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        with st.spinner(f"Gemini is {task_description}..."):
-            response = model.generate_content(prompt, request_options={'timeout': 600})
-            return response.text
+        # The routing cascade picks the cheapest model that passes local checks (routing.py)
+        with scheduler_job(len(segment_text or "")):
+            return run_in_background(generate, f"Gemini is {task_description}...")
+    except Exception as e:
+        if "API_KEY_INVALID" in str(e) or "PERMISSION_DENIED" in str(e):
+             st.error("Error: Invalid Gemini API Key. Please check your .env file.")
+        else:
+            st.error(f"Error communicating with Gemini: {e}")
+        return None
+
+@contextlib.contextmanager
+def scheduler_job(size=0):
+    """Runs the enclosed model calls as the logged-in user, for fair-share scheduling (scheduler.py).
+
+    The calls are also metered for the project archive (usage.py).
+    """
+    with scheduler.job(
+        st.session_state.get("username"), st.session_state.get("role"), size=size, cancel_token=scheduler.CancelToken()
+    ) as cancel_token, usage.metering(st.session_state.get("usage_meter")):
+        yield cancel_token
+
+def run_in_background(work, text):
+    """Runs work(on_chunk) in a worker thread under the current scheduler job and waits for it.
+
+    Streamlit only interrupts a script at its next st call, so the status is
+    redrawn while waiting: Cancel (or Stop, or any other widget) then ends the
+    run at once, and the job is cancelled, freeing its call slots.
+    """
+    status, cancel_slot = st.empty(), st.empty()
+    state = {"done": 0, "total": 0}
+    outcome = {}
+    finished = threading.Event()
+
+    def on_chunk(done, total):
+        state.update(done=done, total=total)
+
+    def run():
+        try:
+            outcome["result"] = work(on_chunk)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            finished.set()
+
+    cancel_token = scheduler.current_job().cancel
+    cancel_slot.button("⏹️ Cancel", key=f"cancel_{id(finished)}")
+    threading.Thread(target=scheduler.propagate(run), name="streamlit-job", daemon=True).start()
+    start = time.monotonic()
+    try:
+        while not finished.wait(BACKGROUND_POLL_S):
+            elapsed = f"{time.monotonic() - start:.0f} s"
+            if state["total"]:
+                status.progress(state["done"] / state["total"], text=f"{state['done']}/{state['total']} chunks completed · {elapsed}")
+            else:
+                status.info(f"⏳ {text} ({elapsed})")
+    except BaseException:
+        # Interrupted by a click: stop the job and tell the user on the next run
+        if cancel_token is not None:
+            cancel_token.cancel()
+        st.session_state.run_cancelled = True
+        raise
+    status.empty()
+    cancel_slot.empty()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+def revision_plan():
+    """Diff of the source against the delivered project being revised, or None."""
+    project = tm.get_project(st.session_state.revision_of) if st.session_state.get("revision_of") else None
+    if not project:
+        return None
+    return revision.plan_revision(project["source_text"], project["final_text"], get_text("source_text"), project["name"])
+
+def run_pipeline(api_key, mode, source_lang, target_lang, project_glossary=None, client=None):
+    """Steps 4-6 per chunk, pipelined or fused; returns the three versions or None.
+
+    For a revision, only the new or modified paragraphs go through the pipeline.
+    With AFRIDE_API_URL set, the translation service does the work.
+    """
+    try:
+        # Session state is only readable from the script thread
+        source_text, gold_prompt = get_text("source_text"), get_text("gold_standard_prompt")
+        revision_of, plan = st.session_state.get("revision_of"), revision_plan()
+
+        def work(on_chunk):
+            def run(text):
+                return pipeline.run_mode(
+                    mode, api_key, routing.AUTO_MODEL, source_lang, target_lang,
+                    gold_prompt, text, on_chunk=on_chunk, glossary=project_glossary,
+                )
+
+            if service_client.enabled():
+                return service_client.translate(
+                    mode, routing.AUTO_MODEL, source_lang, target_lang, gold_prompt, source_text,
+                    client=client, revision_of=revision_of, on_chunk=on_chunk,
+                )
+            if plan:
+                versions = revision.run(plan, source_text, lambda text: run(text)[0], pipeline.FUSED_VERSIONS)
+                return versions, revision.format_plan(plan)
+            versions, dedupe_plan = run(source_text)
+            return versions, analysis.format_dedupe(dedupe_plan)
+
+        with scheduler_job(len(source_text)):
+            versions, summary = run_in_background(work, "Gemini is translating, editing and proofreading...")
+        st.info(summary)
+        return versions
     except Exception as e:
         if "API_KEY_INVALID" in str(e) or "PERMISSION_DENIED" in str(e):
-             st.error(f"Error: Invalid Gemini API Key. Please check your .env file.")
+             st.error("Error: Invalid Gemini API Key. Please check your .env file.")
         else:
             st.error(f"Error communicating with Gemini: {e}")
         return None
 
+def run_multi_target(api_key, mode, source_lang, target_langs, client):
+    """Steps 4-6 into several languages from the one extracted source; returns {target_lang: final text}."""
+    source_text, gold_prompt = get_text("source_text"), get_text("gold_standard_prompt")
+
+    def work(on_chunk):
+        if service_client.enabled():
+            return service_client.translate_targets(
+                mode, routing.AUTO_MODEL, source_lang, target_langs, gold_prompt, source_text, client, on_chunk,
+            )
+        results, errors, plan = pipeline.run_targets(
+            mode, api_key, routing.AUTO_MODEL, source_lang, target_langs, gold_prompt, source_text, on_chunk=on_chunk,
+            glossaries={lang: glossary.get_glossary(source_lang, lang, client) for lang in target_langs},
+        )
+        return results, errors, analysis.format_dedupe(plan)
+
+    # Every language is another pass over the source, so the job is sized by all of them
+    with scheduler_job(len(source_text) * len(target_langs)):
+        try:
+            results, errors, summary = run_in_background(work, "Gemini is translating into all selected languages...")
+        except Exception as e:
+            target = "the translation service" if service_client.enabled() else "Gemini"
+            st.error(f"Error communicating with {target}: {e}")
+            return {}
+    for lang, error in errors.items():
+        st.error(f"{lang}: error communicating with Gemini: {error}")
+    st.info(summary)
+    return {lang: results[lang]["proofread"] for lang in target_langs if lang in results}
+
+def step_prompt(step, source_lang, target_lang, gold_prompt="", source_text="", translation="", project_glossary=None):
+    """The prompt of Step 4, 5 or 6 (pipeline.step_prompt), built by the translation service when one is configured."""
+    if service_client.enabled():
+        return service_client.step_prompt(step, source_lang, target_lang, gold_prompt, source_text, translation, project_glossary)
+    return pipeline.step_prompt(step, source_lang, target_lang, gold_prompt, source_text, translation, project_glossary)
+
+def proofread_prompt(target_lang, text):
+    return step_prompt("proofread", "", target_lang, translation=text)
+
+def run_proofread(api_key, target_lang, text, flagged_only, project_glossary=None):
+    """Step 6: proofreads the text, or only the segments local QA flags; returns the result or None."""
+    if flagged_only:
+        report = qa.check_document(get_text("source_text"), text, project_glossary)
+        indices = report["flagged"]
+        if not report["issues"]:
+            st.info(f"Local QA found no issues in {report['segments']} segments; no proofreading call was needed.")
+            return text
+        if not indices:
+            # Only document-level issues (e.g. paragraph counts differ): no segment to pick, so proofread it all
+            st.warning("Local QA found document-level issues but no single flagged segment; proofreading the full document.")
+            return call_gemini(api_key, proofread_prompt(target_lang, text), "proofreading", "proofread", text,
+                               qa_failures=len(report["issues"]))
+        flagged_text = qa.extract_segments(text, indices)
+        # The flagged segments failed local QA: routing starts them on a stronger model
+        qa_failures = len(report["issues"])
+        result = call_gemini(api_key, proofread_prompt(target_lang, flagged_text), "proofreading", "proofread", flagged_text,
+                             qa_failures=qa_failures)
+        if not result:
+            return None
+        merged = qa.merge_segments(text, indices, result)
+        if merged is None and len(alignment.paragraphs(flagged_text)) == len(indices):
+            # Paragraphs were merged or split: ask again for just these segments, numbered
+            prompt = alignment.numbered_prompt(proofread_prompt(target_lang, flagged_text), (flagged_text,), flagged_text)
+            result = call_gemini(api_key, prompt, "proofreading", "proofread", flagged_text, qa_failures=qa_failures + 1)
+            if not result:
+                return None
+            segments = alignment.parse_numbered(result, len(indices))
+            merged = segments and qa.merge_segments(text, indices, "\n".join(segments))
+        if merged is not None:
+            st.info(f"Sent {len(indices)} of {report['segments']} segments flagged by local QA to the proofreader.")
+            return merged
+        # Still misaligned; the full document is the safe fallback
+        st.warning("Proofread segments did not line up; proofreading the full document instead.")
+    return call_gemini(api_key, proofread_prompt(target_lang, text), "proofreading", "proofread", text)
+
 def create_word_document(text_content):
-    """Creates a .docx file in memory from a string."""
-    doc = docx.Document()
-    for para in text_content.split('\n'):
-        doc.add_paragraph(para)
-        
-    file_stream = io.BytesIO()
-    doc.save(file_stream)
-    file_stream.seek(0)
-    return file_stream.getvalue()
+    """Creates a .docx file in memory from a string (on the translation service when one is configured)."""
+    if service_client.enabled():
+        return service_client.word_document(text_content)
+    return delivery.word_document(text_content)
+
+def create_delivery_bundle(final_texts, base_name):
+    """A .zip (bytes) with one translated .docx per target language."""
+    if service_client.enabled():
+        return service_client.delivery_bundle(final_texts, base_name)
+    return delivery.delivery_bundle(final_texts, base_name)
+
+# Session state keys of the step texts archived with each project (archive.py)
+ARCHIVE_TEXTS = {
+    "source": "source_text", "translation": "translation_step_4", "edited": "translation_step_5",
+    "proofread": "translation_step_6", "final": "final_text",
+}
+
+# --- Large Session Texts ---
+# Session state only holds TextRefs; the texts live once per process in the blob store
+
+def get_text(key):
+    """Returns a large session text, resolving it from the shared blob store."""
+    try:
+        return blob_store.resolve(st.session_state.get(key))
+    except KeyError:
+        st.session_state[key] = None
+        st.error("⚠️ A stored text from this session is no longer available. Please re-upload the file or re-run the step.")
+        return None
+
+def set_text(key, text):
+    """Stores a large session text in the blob store, keeping only its reference in session state."""
+    st.session_state[key] = blob_store.store(text)
 
 # ====================================================
 #              🚀 APP EXECUTION
@@ -270,6 +516,10 @@ if not st.session_state.authenticated:
 
 # --- If we get here, user IS authenticated ---
 update_activity() # Update activity timer
+service_client.use_token(st.session_state.get("service_token"))
+
+# --- Background Warm-up (once per process, after the first request arrives) ---
+start_warmup()
 
 # --- 2. App Session State Initialization ---
 if "project_started" not in st.session_state:
@@ -293,7 +543,9 @@ with st.sidebar:
     # --- App Config ---
     st.header("⚙️ Configuration")
     
-    if st.session_state.api_key:
+    if service_client.enabled():
+        st.success(f"✅ Translation service: {service_client.API_URL}")
+    elif st.session_state.api_key:
         st.success("✅ Gemini API Key loaded from .env")
     else:
         st.error("❌ Gemini API Key not found.")
@@ -316,9 +568,16 @@ with st.sidebar:
         key="gold_pt"
     )
 
+    st.markdown("---")
+    st.header("📚 Glossary")
+    st.caption("Two-column CSV/TSV (source term, target term) for the project's languages and client.")
+    glossary_file = st.file_uploader("Upload Glossary", type=["csv", "tsv", "txt"], key="glossary_file")
+
 # --- 4. Main App UI ---
 st.title("🌐 Professional Translation Workflow Simulator")
 st.markdown("This app simulates a 10-step translation process using Google Gemini for linguistic tasks.")
+if st.session_state.pop("run_cancelled", False):
+    st.toast("⏹️ Cancelled. Chunks that were already finished are reused if you run it again.")
 st.markdown("---")
 
 # --- Step 1: Inquiry ---
@@ -333,13 +592,32 @@ with col1:
 with col2:
     source_lang = st.selectbox("Source Language", ["English", "Portuguese", "Spanish", "French", "German"])
     target_lang = st.selectbox("Target Language", ["Portuguese", "English", "Spanish", "French", "German"])
+    client = st.text_input("Client (selects the glossary)", glossary.DEFAULT_CLIENT) or glossary.DEFAULT_CLIENT
+    previous_projects = {
+        f"{name} · {project_client} · {datetime.datetime.fromtimestamp(created_at):%Y-%m-%d %H:%M}": project_id
+        for project_id, name, project_client, created_at in tm.list_projects(source_lang, target_lang)
+    }
+    revision_of = st.selectbox(
+        "Revision of", ["New project", *previous_projects],
+        help="Reuses the approved translations of unchanged paragraphs from a delivered project.",
+    )
+
+# Import a newly uploaded glossary once; the compiled glossary is cached per process
+if glossary_file is not None and st.session_state.get("glossary_imported") != glossary_file.file_id:
+    try:
+        count = glossary.import_terms(source_lang, target_lang, client, glossary.parse_glossary_file(glossary_file.getvalue()))
+        st.sidebar.success(f"✔️ Imported {count} terms into '{client}' ({source_lang} → {target_lang}).")
+    except Exception as e:
+        st.sidebar.error(f"Could not read glossary file: {e}")
+    st.session_state.glossary_imported = glossary_file.file_id
+project_glossary = glossary.get_glossary(source_lang, target_lang, client)
 
 start_button = st.button("🚀 Start Project & Analyze", type="primary")
 
 # --- Workflow Execution ---
 if start_button or st.session_state.project_started:
     
-    if not st.session_state.api_key:
+    if not st.session_state.api_key and not service_client.enabled():
         st.error("❌ Please provide your Gemini API Key in the `.env` file to begin.")
         st.stop()
         
@@ -348,109 +626,137 @@ if start_button or st.session_state.project_started:
         st.stop()
         
     st.session_state.project_started = True
+    if "usage_meter" not in st.session_state:
+        st.session_state.usage_meter = usage.UsageMeter()  # tokens and latency of this project, for the archive
 
     # --- Step 2: Preparation ---
     with st.expander("2. Project Preparation", expanded=True):
         if st.session_state.source_text is None: 
             with st.spinner("Assigning PM, preparing files, setting up TM..."):
-                st.session_state.source_text = read_file(source_file)
-                st.session_state.gold_standard_prompt = build_gold_standard_prompt(gold_en_files, gold_pt_files)
+                set_text("source_text", read_file(source_file))
+                set_text("gold_standard_prompt", build_gold_standard_prompt(gold_en_files, gold_pt_files))
                 
                 if st.session_state.source_text:
                     st.success("✔️ Files prepared. Project Manager assigned.")
-                    word_count = len(st.session_state.source_text.split())
-                    st.metric("Project Scope", f"{word_count} words")
+                    # Repetition and TM match analysis for quoting (no LLM calls)
+                    report = analysis.analyze(get_text("source_text"), tm.get_memory(source_lang, target_lang))
+                    st.metric("Project Scope", f"{report['words']} words", f"{report['billable_words']} billable", delta_color="off")
+                    st.markdown(analysis.format_analysis(report))
+                    # Revision of a delivered project: only new or modified paragraphs will be translated
+                    st.session_state.revision_of = previous_projects.get(revision_of)
+                    if st.session_state.revision_of:
+                        plan = revision_plan()
+                        if plan:
+                            st.info(revision.format_plan(plan))
+                        else:
+                            st.warning("⚠️ The previous project's paragraphs do not line up; this revision is translated in full.")
+                            st.session_state.revision_of = None
                     if st.session_state.gold_standard_prompt:
                         st.info("✔️ Gold standard samples have been loaded and will be used.")
+                    if project_glossary:
+                        found = len(project_glossary.find_terms(get_text("source_text")))
+                        st.info(f"📚 Glossary '{client}': {len(project_glossary)} terms, {found} found in the source.")
                 else:
                     st.error("Failed to read source file. Please check the file format.")
                     st.stop()
         
-        st.text_area("Extracted Source Text (Preview)", st.session_state.source_text, height=150, disabled=True)
+        st.text_area("Extracted Source Text (Preview)", get_text("source_text"), height=150, disabled=True)
 
     # --- Step 3: Translator Selection ---
     with st.expander("3. Translator Selection"):
-        st.info("🤖 Qualified native linguist (Gemini 2.5 Flash) has been assigned based on subject matter.")
+        st.info(f"🤖 Qualified native linguist ({routing.AUTO_MODEL}: routed per step across "
+                f"{', '.join(routing.MODEL_TIERS)}) has been assigned based on subject matter.")
 
     # --- Step 4: Translation ---
     with st.expander("4. Translation Phase", expanded=True):
+        if not st.session_state.translation_step_4:
+            pipeline_mode = st.radio("Automatic Steps 4-6", pipeline.PIPELINE_MODES, horizontal=True)
+            if st.button("⚡ Run Steps 4-6 Automatically", help="Pipelined mode edits and proofreads each chunk as soon as it is translated; fused mode returns all three versions in one call per chunk. Use the separate steps for an audit trail of each prompt."):
+                versions = run_pipeline(st.session_state.api_key, pipeline_mode, source_lang, target_lang, project_glossary, client)
+                if versions:
+                    set_text("translation_step_4", versions["translation"])
+                    set_text("translation_step_5", versions["edited"])
+                    set_text("translation_step_6", versions["proofread"])
+                    set_text("final_text", versions["proofread"])
+                    st.success("Translation, edit and proofread complete.")
+
+            # Multi-target: the same extracted source into several languages at once
+            target_langs = st.multiselect(
+                "🌍 Also deliver in",
+                [lang for lang in ["English", "Portuguese", "Spanish", "French", "German"] if lang != source_lang],
+                help="Runs Steps 4-6 (mode above) into each selected language concurrently, sharing the source preparation.",
+            )
+            if target_langs and st.button("🌍 Translate Into All Selected"):
+                finals = run_multi_target(st.session_state.api_key, pipeline_mode, source_lang, target_langs, client)
+                for lang, text in finals.items():
+                    set_text(f"multi_target_{lang}", text)
+                st.session_state.multi_target_langs = list(finals)
+
+        if st.session_state.get("multi_target_langs"):
+            base_name = os.path.splitext(source_file.name)[0]
+            st.download_button(
+                label=f"⬇️ Download Delivery Bundle (.zip, {', '.join(st.session_state.multi_target_langs)})",
+                data=create_delivery_bundle({lang: get_text(f"multi_target_{lang}") for lang in st.session_state.multi_target_langs}, base_name),
+                file_name=f"translated_{base_name}_bundle.zip",
+                mime="application/zip",
+            )
+
         if st.button("Run Translation (Step 4)") or st.session_state.translation_step_4:
             if not st.session_state.translation_step_4: 
-                prompt = f"""You are a professional {source_lang}-to-{target_lang} translator.
-                Translate the following text. Maintain a professional tone and ensure accuracy.
-                Preserve paragraph breaks (indicated by newlines).
-                {st.session_state.gold_standard_prompt}
-                ---
-                Source Text to Translate:
-                {st.session_state.source_text}
-                ---
-                {target_lang} Translation:"""
-                
-                translation = call_gemini(st.session_state.api_key, prompt, "translating")
+                def translate(text):
+                    prompt = step_prompt("translate", source_lang, target_lang, get_text("gold_standard_prompt"), text,
+                                         project_glossary=project_glossary)
+                    return call_gemini(st.session_state.api_key, prompt, "translating", "translate", text)
+
+                # Repeated segments are translated once and expanded back (dedupe.py)
+                translation, plan = dedupe.run(get_text("source_text"), translate)
                 if translation:
-                    st.session_state.translation_step_4 = translation
-                    st.session_state.final_text = translation 
+                    set_text("translation_step_4", translation)
+                    set_text("final_text", translation)
                     st.success("Translation complete.")
+                    st.info(analysis.format_dedupe(plan))
                 
             if st.session_state.translation_step_4:
-                st.text_area("Initial Translation (from Gemini)", st.session_state.translation_step_4, height=200)
+                st.text_area("Initial Translation (from Gemini)", get_text("translation_step_4"), height=200)
 
     # --- Step 5: Editing ---
     with st.expander("5. Editing (Second Linguist Review)"):
         if st.session_state.translation_step_4:
             if st.button("🤖 Ask Gemini to Edit/Review (Step 5)"):
-                prompt = f"""You are a professional editor. Review the following translation from {source_lang} to {target_lang}.
-                Compare it against the source text for accuracy, terminology, and tone.
-                Correct any stylistic or grammatical issues to improve fluency. Preserve paragraph breaks.
-                {st.session_state.gold_standard_prompt}
-                ---
-                Source Text:
-                {st.session_state.source_text}
-                ---
-                Initial Translation to Review:
-                {st.session_state.translation_step_4}
-                ---
-                Provide only the final, improved {target_lang} translation:"""
+                prompt = step_prompt("edit", source_lang, target_lang, get_text("gold_standard_prompt"), get_text("source_text"),
+                                     get_text("translation_step_4"), project_glossary)
                 
-                edited_translation = call_gemini(st.session_state.api_key, prompt, "editing")
+                edited_translation = call_gemini(st.session_state.api_key, prompt, "editing", "edit", get_text("source_text"), get_text("translation_step_4"))
                 if edited_translation:
-                    st.session_state.translation_step_5 = edited_translation
-                    st.session_state.final_text = edited_translation 
+                    set_text("translation_step_5", edited_translation)
+                    set_text("final_text", edited_translation)
                     st.success("Edit complete.")
             
-            default_text = st.session_state.translation_step_5 or st.session_state.translation_step_4
+            default_text = get_text("translation_step_5") or get_text("translation_step_4")
             manual_edit = st.text_area("Manually Edit Translation:", default_text, height=200, key="manual_edit")
             
             if manual_edit != default_text:
-                st.session_state.translation_step_5 = manual_edit
-                st.session_state.final_text = manual_edit
+                set_text("translation_step_5", manual_edit)
+                set_text("final_text", manual_edit)
                 st.info("Manual edit saved.")
         else:
             st.warning("Please complete Step 4 (Translation) first.")
 
     # --- Step 6: Proofreading / QA ---
     with st.expander("6. Proofreading / QA"):
-        current_text_for_proofread = st.session_state.translation_step_5 or st.session_state.translation_step_4
+        current_text_for_proofread = get_text("translation_step_5") or get_text("translation_step_4")
         
         if current_text_for_proofread:
+            flagged_only = st.checkbox("Only proofread segments flagged by local QA", value=True)
             if st.button("🤖 Ask Gemini for Final Proofread (Step 6)"):
-                prompt = f"""You are a meticulous proofreader. Perform a final check on the following {target_lang} text.
-                Correct only objective errors (typos, grammar, punctuation). Preserve paragraph breaks.
-                Do NOT change the style or word choice unless it's grammatically incorrect.
-                ---
-                Text to Proofread:
-                {current_text_for_proofread}
-                ---
-                Provide only the final, proofread text:"""
-                
-                proofread_text = call_gemini(st.session_state.api_key, prompt, "proofreading")
+                proofread_text = run_proofread(st.session_state.api_key, target_lang, current_text_for_proofread, flagged_only, project_glossary)
                 if proofread_text:
-                    st.session_state.translation_step_6 = proofread_text
-                    st.session_state.final_text = proofread_text 
+                    set_text("translation_step_6", proofread_text)
+                    set_text("final_text", proofread_text)
                     st.success("Proofreading complete.")
 
             if st.session_state.translation_step_6:
-                 st.text_area("Final Proofread Text", st.session_state.translation_step_6, height=200, disabled=True)
+                 st.text_area("Final Proofread Text", get_text("translation_step_6"), height=200, disabled=True)
         else:
             st.warning("Please complete Step 4 or 5 first.")
 
@@ -460,7 +766,8 @@ if start_button or st.session_state.project_started:
             st.info("ℹ️ DTP would occur here. This app delivers a clean .docx file, but manual layout adjustments would be needed for complex formats.")
 
         with st.expander("8. Final Quality Control"):
-            st.success("✔️ PM final check complete. Files, naming conventions, and deliverables match client specifications.")
+            # Local rule-based checks on the final text (numbers, punctuation, untranslated segments, ...)
+            st.markdown(qa.format_report(qa.check_document(get_text("source_text"), get_text("final_text"), project_glossary)))
 
         with st.expander("9. Delivery", expanded=True):
             st.subheader("🎉 Final Deliverable Ready")
@@ -473,10 +780,10 @@ if start_button or st.session_state.project_started:
             
             st.markdown(f"The final translated text ({target_lang}) is below:")
             
-            st.text_area("Final Text", st.session_state.final_text, height=300, disabled=True)
+            st.text_area("Final Text", get_text("final_text"), height=300, disabled=True)
             
             try:
-                doc_data = create_word_document(st.session_state.final_text)
+                doc_data = create_word_document(get_text("final_text"))
                 base_name = os.path.splitext(source_file.name)[0]
                 download_file_name = f"translated_{base_name}.docx"
                 
@@ -484,17 +791,32 @@ if start_button or st.session_state.project_started:
                     label="⬇️ Download Final Translation (.docx)",
                     data=doc_data,
                     file_name=download_file_name,
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    mime=delivery.DOCX_MIME,
                 )
             except Exception as e:
                 st.error(f"Error creating .docx file for download: {e}")
 
     # --- Step 10: Feedback ---
     with st.expander("10. Client Feedback & Archiving"):
-        st.slider("Please rate this translation:", 1, 5, 4)
-        st.text_area("Provide any feedback (optional):")
+        rating = st.slider("Please rate this translation:", 1, 5, 4)
+        feedback = st.text_area("Provide any feedback (optional):")
         
         if st.button("Submit Feedback & Archive Project"):
+            tm_project_id = 0
+            if st.session_state.final_text:
+                tm_project_id, added = tm.save_project(
+                    source_file.name, source_lang, target_lang, client, get_text("source_text"), get_text("final_text")
+                )
+                if not added:
+                    st.warning("Source and final paragraphs do not line up; the TM was not updated.")
+            try:
+                archive.archive_project(
+                    source_file.name, st.session_state.username, client, source_lang, target_lang,
+                    {version: get_text(key) for version, key in ARCHIVE_TEXTS.items()},
+                    st.session_state.get("usage_meter"), rating, feedback, tm_project_id,
+                )
+            except Exception as e:
+                st.warning(f"The project could not be added to the analytics archive: {e}")
             st.success("Thank you for your feedback! The project has been securely archived. The TM and glossary have been updated.")
             log_event(st.session_state.username, "Submitted feedback and archived project.")
             
@@ -505,7 +827,7 @@ if start_button or st.session_state.project_started:
             last_activity = st.session_state.last_activity
             
             for key in list(st.session_state.keys()):
-                if key not in ['api_key', 'username', 'authenticated', 'last_activity']:
+                if key not in ['api_key', 'username', 'role', 'authenticated', 'last_activity', 'service_token']:
                     del st.session_state[key]
             
             # Re-initialize project state
@@ -0,0 +1,328 @@
+import argparse
+import datetime
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import metrics
+from lazy_imports import lazy_import
+
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+ds = lazy_import("pyarrow.dataset")
+pd = lazy_import("pandas")
+
+# ====================================================
+#       🗃️ COLUMNAR PROJECT ARCHIVE & ANALYTICS
+# ====================================================
+# Step 10 appends every completed project to a Parquet archive: one row per
+# project (metadata, the hash of each step's text, token counts, latency,
+# models, rating, feedback) in "projects", one row per Gemini request in
+# "calls" (usage.py), and each step's text once per content hash in "texts".
+# "projects" and "calls" are partitioned by year and month (hive layout), so a
+# date-range query only opens the partitions it covers and only reads the
+# columns it needs. Every append writes new files; once a partition holds
+# COMPACT_FILES of them they are merged into one. The analytics (throughput,
+# cost per word, latency per model, rating trends) are vectorized pandas
+# group-bys over those columns.
+#
+#     python archive.py --days 365      # analytics report for the last year
+
+ARCHIVE_DIR = os.getenv("PROJECT_ARCHIVE_DIR", "archive")
+COMPACT_FILES = int(os.getenv("PROJECT_ARCHIVE_COMPACT_FILES", 64))  # files per partition before merging
+COMPACT_LOCK_STALE_S = 600
+STEP_VERSIONS = ("source", "translation", "edited", "proofread", "final")
+
+# USD per million (input, output) tokens; ARCHIVE_MODEL_PRICES overrides or adds, e.g. '{"gemini-2.5-pro": [1.25, 10]}'
+MODEL_PRICES = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+    **{model: tuple(prices) for model, prices in json.loads(os.getenv("ARCHIVE_MODEL_PRICES", "{}")).items()},
+}
+
+_KEYS = {"projects": ["project_id"], "calls": ["project_id", "seq"], "texts": ["hash"]}
+_PARTITIONED = ("projects", "calls")
+
+_write_lock = threading.Lock()
+_known_hashes = None  # hashes already in "texts", loaded on the first append
+
+@functools.cache
+def _schemas():
+    timestamp = pa.timestamp("ms", tz="UTC")
+    return {
+        "projects": pa.schema([
+            ("project_id", pa.string()), ("tm_project_id", pa.int64()),
+            ("started_at", timestamp), ("archived_at", timestamp), ("wall_s", pa.float64()),
+            ("name", pa.string()), ("user", pa.string()), ("client", pa.string()),
+            ("source_lang", pa.string()), ("target_lang", pa.string()),
+            ("source_words", pa.int32()), ("final_words", pa.int32()),
+            *((f"{version}_hash", pa.string()) for version in STEP_VERSIONS),
+            ("model", pa.string()), ("models", pa.list_(pa.string())),
+            ("calls", pa.int32()), ("prompt_tokens", pa.int64()), ("output_tokens", pa.int64()),
+            ("model_latency_s", pa.float64()),
+            ("rating", pa.int8()), ("feedback", pa.string()),
+            ("year", pa.int16()), ("month", pa.int8()),
+        ]),
+        "calls": pa.schema([
+            ("project_id", pa.string()), ("seq", pa.int32()), ("archived_at", timestamp),
+            ("model", pa.string()), ("latency_s", pa.float64()),
+            ("prompt_tokens", pa.int32()), ("output_tokens", pa.int32()), ("ok", pa.bool_()),
+            ("year", pa.int16()), ("month", pa.int8()),
+        ]),
+        "texts": pa.schema([("hash", pa.string()), ("chars", pa.int32()), ("text", pa.large_string())]),
+    }
+
+def _partitioning():
+    return ds.partitioning(pa.schema([("year", pa.int16()), ("month", pa.int8())]), flavor="hive")
+
+def content_hash(text):
+    """sha256 of the text, the same reference the blob store uses."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# --- Appending ---
+
+def archive_project(name, user, client, source_lang, target_lang, texts, meter=None,
+                    rating=None, feedback="", tm_project_id=0, archived_at=None):
+    """Appends one completed project; `texts` maps STEP_VERSIONS to the step's text (missing steps are None).
+
+    `meter` is the project's usage.UsageMeter. Returns the archive's project id.
+    """
+    start = time.perf_counter()
+    archived_at = archived_at or datetime.datetime.now(datetime.timezone.utc)
+    project_id = uuid.uuid4().hex
+    calls = list(meter.calls) if meter else []
+    hashes = {version: content_hash(texts[version]) if texts.get(version) else None for version in STEP_VERSIONS}
+    output_by_model = {}
+    for call in calls:
+        output_by_model[call.model] = output_by_model.get(call.model, 0) + call.output_tokens
+    partition = {"year": archived_at.year, "month": archived_at.month}
+
+    project = {
+        "project_id": project_id, "tm_project_id": tm_project_id or 0,
+        "started_at": datetime.datetime.fromtimestamp(meter.started_at, datetime.timezone.utc) if meter else archived_at,
+        "archived_at": archived_at,
+        "wall_s": archived_at.timestamp() - meter.started_at if meter else 0.0,
+        "name": name, "user": user, "client": client, "source_lang": source_lang, "target_lang": target_lang,
+        "source_words": len((texts.get("source") or "").split()), "final_words": len((texts.get("final") or "").split()),
+        **{f"{version}_hash": hashes[version] for version in STEP_VERSIONS},
+        "model": max(output_by_model, key=output_by_model.get) if output_by_model else "",
+        "models": sorted(output_by_model),
+        "calls": len(calls),
+        "prompt_tokens": sum(c.prompt_tokens for c in calls), "output_tokens": sum(c.output_tokens for c in calls),
+        "model_latency_s": sum(c.latency_s for c in calls),
+        "rating": rating, "feedback": feedback or "",
+        **partition,
+    }
+    call_rows = [
+        {"project_id": project_id, "seq": seq, "archived_at": archived_at, **call._asdict(), **partition}
+        for seq, call in enumerate(calls)
+    ]
+    with _write_lock:
+        new_texts = {hashes[v]: texts[v] for v in STEP_VERSIONS if hashes[v] and hashes[v] not in _text_hashes()}
+        _append("projects", pa.Table.from_pylist([project], _schemas()["projects"]))
+        if call_rows:
+            _append("calls", pa.Table.from_pylist(call_rows, _schemas()["calls"]))
+        if new_texts:
+            _append("texts", pa.Table.from_pylist(
+                [{"hash": h, "chars": len(text), "text": text} for h, text in new_texts.items()], _schemas()["texts"]
+            ))
+            _known_hashes.update(new_texts)
+    metrics.incr("archive.projects")
+    metrics.observe("archive.append", time.perf_counter() - start)
+    return project_id
+
+def _text_hashes():
+    global _known_hashes
+    if _known_hashes is None:
+        _known_hashes = set(load("texts", columns=["hash"])["hash"])
+    return _known_hashes
+
+def _append(table_name, table):
+    """Writes `table` as new files of the archive table, then compacts the partitions it touched."""
+    base_dir = os.path.join(ARCHIVE_DIR, table_name)
+    partitioned = table_name in _PARTITIONED
+    written = []
+    ds.write_dataset(
+        table, base_dir, format="parquet",
+        partitioning=_partitioning() if partitioned else None,
+        basename_template=f"{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_visitor=lambda written_file: written.append(written_file.path),
+    )
+    for directory in {os.path.dirname(path) for path in written}:
+        _compact(directory)
+
+def _compact(directory):
+    """Merges a partition's files into one once there are COMPACT_FILES of them."""
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".parquet") and f[0] not in "._")
+    if len(files) < COMPACT_FILES:
+        return
+    lock_path = os.path.join(directory, "_compacting.lock")
+    try:
+        if time.time() - os.path.getmtime(lock_path) > COMPACT_LOCK_STALE_S:
+            os.remove(lock_path)  # left behind by a process that died while compacting
+    except OSError:
+        pass
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return  # another process is compacting this partition
+    try:
+        merged = ds.dataset(files, format="parquet").to_table()
+        # Files starting with "_" are invisible to readers until renamed
+        temp_path = os.path.join(directory, f"_{uuid.uuid4().hex}.parquet")
+        pq.write_table(merged, temp_path, compression="zstd")
+        os.replace(temp_path, os.path.join(directory, f"compacted-{uuid.uuid4().hex}.parquet"))
+        for path in files:
+            os.remove(path)
+        metrics.incr("archive.compactions")
+    finally:
+        os.remove(lock_path)
+
+# --- Reading ---
+
+def _utc(moment):
+    return moment if moment.tzinfo else moment.replace(tzinfo=datetime.timezone.utc)
+
+def _time_filter(since, until):
+    """archived_at in [since, until), with the year/month conditions that let whole partitions be skipped."""
+    year, month, archived_at = ds.field("year"), ds.field("month"), ds.field("archived_at")
+    expression = None
+    if since is not None:
+        since = _utc(since)
+        expression = ((year > since.year) | ((year == since.year) & (month >= since.month))) & (
+            archived_at >= pa.scalar(since, pa.timestamp("ms", tz="UTC")))
+    if until is not None:
+        until = _utc(until)
+        bound = ((year < until.year) | ((year == until.year) & (month <= until.month))) & (
+            archived_at < pa.scalar(until, pa.timestamp("ms", tz="UTC")))
+        expression = bound if expression is None else expression & bound
+    return expression
+
+def load(table_name, since=None, until=None, columns=None):
+    """Rows of an archive table as a DataFrame; `projects`/`calls` can be limited to archived_at in [since, until)."""
+    schema = _schemas()[table_name]
+    if columns is not None:
+        columns = list(dict.fromkeys([*_KEYS[table_name], *columns]))
+    base_dir = os.path.join(ARCHIVE_DIR, table_name)
+    dataset = None
+    if os.path.isdir(base_dir):
+        dataset = ds.dataset(base_dir, schema=schema, format="parquet",
+                             partitioning=_partitioning() if table_name in _PARTITIONED else None)
+    if dataset is None or not dataset.files:
+        empty = schema.empty_table()
+        return (empty.select(columns) if columns else empty).to_pandas()
+    expression = _time_filter(since, until) if table_name in _PARTITIONED else None
+    frame = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    # A compaction in progress can briefly show a file's rows twice
+    return frame.drop_duplicates(_KEYS[table_name], ignore_index=True)
+
+def get_text(text_hash):
+    """An archived step text by its content hash, or None."""
+    base_dir = os.path.join(ARCHIVE_DIR, "texts")
+    if not os.path.isdir(base_dir):
+        return None
+    rows = ds.dataset(base_dir, schema=_schemas()["texts"], format="parquet").to_table(
+        columns=["text"], filter=ds.field("hash") == text_hash
+    )
+    return rows["text"][0].as_py() if rows.num_rows else None
+
+# --- Analytics ---
+
+def throughput(since=None, until=None, freq="W"):
+    """Per period (pandas frequency, e.g. "W", "MS"): projects, words delivered and turnaround."""
+    projects = load("projects", since, until, ["archived_at", "source_words", "wall_s", "model_latency_s"])
+    grouped = projects.groupby(pd.Grouper(key="archived_at", freq=freq))
+    frame = grouped.agg(
+        projects=("project_id", "size"), source_words=("source_words", "sum"),
+        median_turnaround_h=("wall_s", "median"), model_time_s=("model_latency_s", "sum"),
+    )
+    frame["median_turnaround_h"] /= 3600
+    frame["words_per_model_s"] = frame["source_words"] / frame["model_time_s"].where(frame["model_time_s"] > 0)
+    return frame[frame["projects"] > 0]
+
+def cost_per_word(since=None, until=None, by="client"):
+    """Model cost (MODEL_PRICES) and tokens per source word, grouped by a projects column (client, target_lang, user, model...)."""
+    calls = load("calls", since, until, ["model", "prompt_tokens", "output_tokens"])
+    prices = pd.DataFrame.from_dict(MODEL_PRICES, orient="index", columns=["input_usd", "output_usd"])
+    calls = calls.join(prices, on="model")
+    calls["cost_usd"] = (calls["prompt_tokens"] * calls["input_usd"] + calls["output_tokens"] * calls["output_usd"]) / 1e6
+    calls["tokens"] = calls["prompt_tokens"] + calls["output_tokens"]
+    calls["unpriced"] = calls["input_usd"].isna()
+    per_project = calls.groupby("project_id").agg(
+        cost_usd=("cost_usd", "sum"), tokens=("tokens", "sum"), unpriced_calls=("unpriced", "sum"),
+    )
+    projects = load("projects", since, until, [by, "source_words"]).join(per_project, on="project_id")
+    projects[["cost_usd", "tokens", "unpriced_calls"]] = projects[["cost_usd", "tokens", "unpriced_calls"]].fillna(0)
+    frame = projects.groupby(by).agg(
+        projects=("project_id", "size"), source_words=("source_words", "sum"), cost_usd=("cost_usd", "sum"),
+        tokens=("tokens", "sum"), unpriced_calls=("unpriced_calls", "sum"),
+    )
+    words = frame["source_words"].where(frame["source_words"] > 0)
+    frame["cost_per_word_usd"] = frame["cost_usd"] / words
+    frame["tokens_per_word"] = frame["tokens"] / words
+    return frame.sort_values("cost_usd", ascending=False)
+
+def latency_per_model(since=None, until=None):
+    """Per model: requests, error rate, latency percentiles (s) and output tokens per second."""
+    calls = load("calls", since, until, ["model", "latency_s", "output_tokens", "ok"])
+    calls["failed"] = ~calls["ok"]
+    grouped = calls.groupby("model")
+    frame = grouped.agg(
+        calls=("latency_s", "size"), error_rate=("failed", "mean"), mean_s=("latency_s", "mean"),
+        output_tokens=("output_tokens", "sum"), total_s=("latency_s", "sum"),
+    )
+    frame["p50_s"] = grouped["latency_s"].median()
+    frame["p95_s"] = grouped["latency_s"].quantile(0.95)
+    frame["output_tokens_per_s"] = frame.pop("output_tokens") / frame.pop("total_s").where(lambda s: s > 0)
+    return frame.sort_values("calls", ascending=False)
+
+def rating_trend(since=None, until=None, freq="MS"):
+    """Per period: rated projects, mean rating, share of 1-2 ratings and a 3-period rolling mean."""
+    projects = load("projects", since, until, ["archived_at", "rating"]).dropna(subset=["rating"])
+    projects["low"] = projects["rating"] <= 2
+    frame = projects.groupby(pd.Grouper(key="archived_at", freq=freq)).agg(
+        ratings=("rating", "size"), mean_rating=("rating", "mean"), low_share=("low", "mean"),
+    )
+    frame = frame[frame["ratings"] > 0]
+    frame["rolling_mean"] = frame["mean_rating"].rolling(3, min_periods=1).mean()
+    return frame
+
+# --- Report ---
+
+def _markdown_table(frame, index_name):
+    if frame.empty:
+        return "_No archived projects in this period._"
+    lines = [f"| {index_name} | " + " | ".join(frame.columns) + " |", "|---" * (len(frame.columns) + 1) + "|"]
+    for index, row in frame.iterrows():
+        label = index.date() if hasattr(index, "date") else index
+        cells = [f"{v:,.0f}" if isinstance(v, (int, float)) and abs(v) >= 100 else f"{v:.4g}" if isinstance(v, float)
+                 else str(v) for v in row.tolist()]
+        lines.append(f"| {label} | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+def format_report(days=365):
+    """Markdown analytics over the projects archived in the last `days` days."""
+    start = time.perf_counter()
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+    sections = [
+        ("Throughput per week", throughput(since), "Week ending"),
+        ("Cost per word by client", cost_per_word(since), "Client"),
+        ("Latency per model", latency_per_model(since), "Model"),
+        ("Rating trend per month", rating_trend(since), "Month"),
+    ]
+    lines = []
+    for title, frame, index_name in sections:
+        lines += [f"#### {title}", _markdown_table(frame, index_name), ""]
+    lines.append(f"Last {days} days · computed in {time.perf_counter() - start:.2f} s.")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analytics over the project archive.")
+    parser.add_argument("--days", type=int, default=365)
+    print(format_report(parser.parse_args().days))
@@ -0,0 +1,81 @@
+"""Speed of the Step 2 repetition/TM match analysis on a large synthetic project.
+
+Builds a TM of --tm-units segments and a source document of --words words in
+which roughly 20% of segments are TM exact matches, 15% are one-word edits of
+TM segments (fuzzy matches), 10% repeat earlier segments and the rest are new.
+Reports the TM index build time and the median analysis time.
+
+    python benchmarks/bench_analysis.py --words 100000 --tm-units 20000 --runs 5
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis  # noqa: E402
+import tm  # noqa: E402
+
+def make_corpus(words, tm_units, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(20000)]
+    # A few very common words, like real text
+    vocabulary[:20] = ["the", "of", "and", "to", "in", "a", "is", "for", "on", "that",
+                       "with", "as", "by", "at", "be", "this", "are", "from", "or", "it"]
+    weights = [50] * 20 + [1] * (len(vocabulary) - 20)
+
+    def sentence():
+        return " ".join(rng.choices(vocabulary, weights, k=rng.randint(8, 30))).capitalize() + "."
+
+    memory = [sentence() for _ in range(tm_units)]
+    document, count = [], 0
+    while count < words:
+        roll = rng.random()
+        if roll < 0.2:
+            segment = rng.choice(memory)
+        elif roll < 0.35:
+            tokens = rng.choice(memory).split()
+            tokens[rng.randrange(len(tokens))] = rng.choice(vocabulary)
+            segment = " ".join(tokens)
+        elif roll < 0.45 and document:
+            segment = rng.choice(document)
+        else:
+            segment = sentence()
+        document.append(segment)
+        count += len(segment.split())
+    return memory, "\n".join(document)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=100000)
+    parser.add_argument("--tm-units", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    memory, text = make_corpus(args.words, args.tm_units)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "tm.db")
+        tm.add_units("English", "Portuguese", [(s, s.upper()) for s in memory], db_path=db_path)
+        start = time.perf_counter()
+        index = tm.get_memory("English", "Portuguese", db_path=db_path)
+        build = time.perf_counter() - start
+
+        timings, report = [], None
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            report = analysis.analyze(text, index)
+            timings.append(time.perf_counter() - start)
+
+    print(f"TM: {len(index)} units indexed in {build * 1000:.0f} ms")
+    print(f"source: {report['words']} words in {report['segments']} segments, {args.runs} runs")
+    print(f"median analysis {statistics.median(timings) * 1000:.0f} ms")
+    for band in analysis.BANDS:
+        print(f"  {band:>11}: {report['bands'][band]['segments']:>6} segments {report['bands'][band]['words']:>8} words")
+
+if __name__ == "__main__":
+    main()
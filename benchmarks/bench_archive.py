@@ -0,0 +1,102 @@
+"""Analytics over a year of archived projects (archive.py).
+
+Fills a temporary archive with --projects synthetic projects spread over the
+last 365 days (--calls Gemini requests each), written one month at a time the
+way appends plus compaction leave it, then times a few single-project appends
+and each analytics query over the whole year.
+
+    python benchmarks/bench_archive.py --projects 20000 --calls 30
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive  # noqa: E402
+import usage  # noqa: E402
+
+MODELS = ("gemini-2.5-flash-lite", "gemini-2.5-flash", "gemini-2.5-pro")
+CLIENTS = ("Default", "AfriGO", "Ministry", "NGO")
+
+def synthetic_month(rng, year, month, projects, calls):
+    """(project rows, call rows) for one month."""
+    project_rows, call_rows = [], []
+    for _ in range(projects):
+        archived_at = datetime.datetime(year, month, rng.randint(1, 28), rng.randint(0, 23), tzinfo=datetime.timezone.utc)
+        project_id = uuid.uuid4().hex
+        words = rng.randint(200, 60_000)
+        latencies = [rng.lognormvariate(1, 0.6) for _ in range(calls)]
+        models = [rng.choices(MODELS, (70, 25, 5))[0] for _ in range(calls)]
+        prompt_tokens = [rng.randint(500, 12_000) for _ in range(calls)]
+        output_tokens = [rng.randint(300, 8000) for _ in range(calls)]
+        project_rows.append({
+            "project_id": project_id, "tm_project_id": 0,
+            "started_at": archived_at - datetime.timedelta(hours=2), "archived_at": archived_at, "wall_s": 7200.0,
+            "name": f"doc-{project_id[:6]}.docx", "user": f"user{rng.randint(1, 40)}", "client": rng.choice(CLIENTS),
+            "source_lang": "English", "target_lang": rng.choice(("Portuguese", "French", "Swahili")),
+            "source_words": words, "final_words": int(words * 1.1),
+            **{f"{version}_hash": uuid.uuid4().hex for version in archive.STEP_VERSIONS},
+            "model": "gemini-2.5-flash-lite", "models": sorted(set(models)), "calls": calls,
+            "prompt_tokens": sum(prompt_tokens), "output_tokens": sum(output_tokens), "model_latency_s": sum(latencies),
+            "rating": rng.randint(1, 5), "feedback": "", "year": year, "month": month,
+        })
+        call_rows += [
+            {"project_id": project_id, "seq": seq, "archived_at": archived_at, "model": models[seq],
+             "latency_s": latencies[seq], "prompt_tokens": prompt_tokens[seq], "output_tokens": output_tokens[seq],
+             "ok": rng.random() > 0.02, "year": year, "month": month}
+            for seq in range(calls)
+        ]
+    return project_rows, call_rows
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<28} {time.perf_counter() - start:7.3f} s")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=20_000, help="projects over the year")
+    parser.add_argument("--calls", type=int, default=30, help="Gemini requests per project")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    archive.ARCHIVE_DIR = tempfile.mkdtemp(prefix="afride-archive-")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    months = [((now.year * 12 + now.month - 1 - back) // 12, (now.month - 1 - back) % 12 + 1) for back in range(12)]
+    start = time.perf_counter()
+    for year, month in months:
+        project_rows, call_rows = synthetic_month(rng, year, month, args.projects // 12, args.calls)
+        archive._append("projects", archive.pa.Table.from_pylist(project_rows, archive._schemas()["projects"]))
+        archive._append("calls", archive.pa.Table.from_pylist(call_rows, archive._schemas()["calls"]))
+    print(f"archive: {args.projects} projects, {args.projects * args.calls:,} calls "
+          f"({time.perf_counter() - start:.1f} s to generate) in {archive.ARCHIVE_DIR}")
+
+    meter = usage.UsageMeter()
+    for _ in range(args.calls):
+        meter.record("gemini-2.5-flash-lite", 1.2, 4000, 3000)
+    texts = {version: f"{version} text " * 2000 for version in archive.STEP_VERSIONS}
+    timed("archive_project (x10)", lambda: [
+        archive.archive_project("doc.docx", "bench", "Default", "English", "Portuguese", texts, meter, rating=5)
+        for _ in range(10)
+    ])
+
+    since = now - datetime.timedelta(days=365)
+    timed("throughput (weekly)", lambda: archive.throughput(since))
+    timed("cost_per_word (by client)", lambda: archive.cost_per_word(since))
+    timed("latency_per_model", lambda: archive.latency_per_model(since))
+    timed("rating_trend (monthly)", lambda: archive.rating_trend(since))
+    timed("last 30 days, all four", lambda: [
+        fn(now - datetime.timedelta(days=30))
+        for fn in (archive.throughput, archive.cost_per_word, archive.latency_per_model, archive.rating_trend)
+    ])
+    timed("format_report (365 days)", lambda: archive.format_report(365))
+
+if __name__ == "__main__":
+    main()
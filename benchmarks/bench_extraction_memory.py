@@ -0,0 +1,111 @@
+"""Peak RSS and time of extracting a large upload, before and after spooling/mmap/shared memory (extraction.py).
+
+Each case runs in a fresh interpreter on a --mb MB .txt file and reports
+the time and how much the process grew over its baseline (the interpreter,
+plus the upload bytes where an in-memory upload is simulated): peak RSS, and
+peak private memory (RssAnon, sampled every millisecond), which leaves out
+file-backed mmap pages and shared memory blocks, i.e. what copies cost:
+  upload-*   an upload held in memory (Streamlit): getvalue().decode() vs extract_upload(getbuffer())
+  file-*     an upload on disk (Gradio, the service): open().read() vs extract_file() (mmap)
+  worker-*   text handed back from a worker process: pickled result vs shared memory block
+
+    python benchmarks/bench_extraction_memory.py --mb 100
+"""
+import argparse
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extraction  # noqa: E402
+
+CASES = ("upload-before", "upload-after", "file-before", "file-after", "worker-before", "worker-after")
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+def anon_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+class AnonSampler(threading.Thread):
+    """Peak RssAnon while running."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = anon_mb()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.001):
+            self.peak = max(self.peak, anon_mb())
+
+def run_case(case, path):
+    upload = None
+    if case.startswith("upload"):
+        with open(path, "rb") as f:
+            upload = io.BytesIO(f.read())
+    pool = None
+    if case.startswith("worker"):
+        pool = concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+        pool.submit(int).result()  # start the worker outside the measurement
+        extraction._pool = pool
+    baseline, anon_baseline = peak_rss_mb(), anon_mb()
+    sampler = AnonSampler()
+    sampler.start()
+    start = time.perf_counter()
+    if case == "upload-before":
+        text = upload.getvalue().decode("utf-8")
+    elif case == "upload-after":
+        text = extraction.extract_upload(upload.getbuffer(), "upload.txt")
+    elif case == "file-before":
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    elif case == "file-after":
+        text = extraction.extract_file(path)
+    elif case == "worker-before":
+        text = pool.submit(extraction.extract_text, path).result()
+    else:
+        text = extraction._extract_in_worker(path, path)
+    seconds = time.perf_counter() - start
+    sampler.stopped.set()
+    sampler.join()
+    print(f"{case:<14} {seconds:6.3f} s   peak RSS +{peak_rss_mb() - baseline:6.1f} MB   "
+          f"peak private +{max(sampler.peak, anon_mb()) - anon_baseline:6.1f} MB   ({len(text) / 1e6:.0f} M chars)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=100)
+    parser.add_argument("--case", choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        run_case(args.case, args.path)
+        return
+
+    line = "Tradução profissional com parágrafos preservados, números 1.234,56 e termos do glossário.\n"
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    try:
+        # Written in pieces: peak RSS is inherited by child processes on Linux
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for _ in range(args.mb):
+                f.write(line * (1024 * 1024 // len(line.encode("utf-8"))))
+        print(f"{os.path.getsize(path) / 1e6:.0f} MB .txt")
+        for case in CASES:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--case", case, "--path", path], check=True)
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
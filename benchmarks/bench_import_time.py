@@ -0,0 +1,62 @@
+"""Cold import time of the app modules and their heavy dependencies.
+
+Each module is imported in a fresh interpreter (so nothing is cached) several
+times and the median wall time of the import statement is reported.
+Use --json to append a record to a file and track the numbers over time.
+
+    python benchmarks/bench_import_time.py --runs 5 --json bench_output.txt
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What a worker pays before it can serve a request, plus the lazily loaded extras
+TARGETS = [
+    ("app_gradio (import)", "import app_gradio"),
+    ("app_gradio (build UI)", "import app_gradio; app_gradio.build_demo()"),
+    ("gradio", "import gradio"),
+    ("streamlit", "import streamlit"),
+    ("google.generativeai", "import google.generativeai"),
+    ("pdfplumber", "import pdfplumber"),
+    ("pypdfium2", "import pypdfium2"),
+    ("docx", "import docx"),
+    ("warm-up (all heavy modules)", "import warmup, lazy_imports; lazy_imports.preload(*warmup.HEAVY_MODULES)"),
+]
+
+def time_statement(statement, runs):
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", metavar="FILE", help="append the results as one JSON line to FILE")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'target':<32}{'median s':>10}")
+    for name, statement in TARGETS:
+        seconds = time_statement(statement, args.runs)
+        results[name] = seconds
+        print(f"{name:<32}{'n/a' if seconds is None else f'{seconds:.3f}':>10}")
+
+    if args.json:
+        with open(args.json, "a") as f:
+            record = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                      "python": sys.version.split()[0], "runs": args.runs, "results": results}
+            f.write(json.dumps(record) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Speed and text fidelity of the PDF extraction backends (extraction.py), and of the probe's pick.
+
+Sample PDFs are written from the EN/PT documents in data/ (there are no PDFs
+in the repo, and no PDF writer in requirements, so a minimal one is here):
+  report    running text, one column
+  columns   the same text in two columns
+  table     EN/PT paragraph pairs in a ruled three-column table, drawn a
+            column at a time (as many generators do), not in reading order
+Fidelity is the word-sequence similarity (difflib ratio) of the extracted
+text to the text laid out, read line by line (a table row's lines across its
+columns). PDFs given with --pdf have no reference text; for them the
+similarity of each backend's lines to pdfplumber's is shown, with whitespace
+ignored (pdfplumber drops spaces in tightly set text).
+
+    python benchmarks/bench_pdf_extraction.py --runs 3 --pdf some.pdf
+"""
+import argparse
+import difflib
+import glob
+import os
+import statistics
+import sys
+import tempfile
+import textwrap
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import docx  # noqa: E402
+
+import extraction  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+PAGE_TOP, PAGE_BOTTOM, LINE_HEIGHT = 740, 60, 13
+
+# --- Sample PDFs ---
+
+def escape(text):
+    return text.encode("cp1252", "replace").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def text_ops(lines):
+    """Content stream drawing (x, y, text) lines in Helvetica 10, in the order given."""
+    return b"BT /F1 10 Tf " + b" ".join(b"1 0 0 1 %.1f %.1f Tm (%s) Tj" % (x, y, escape(t)) for x, y, t in lines) + b" ET"
+
+def write_pdf(path, contents):
+    """A Letter-size PDF with one page per content stream."""
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    pages_id = 2 + 2 * len(contents)
+    kids = []
+    for content in contents:
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 1 0 R >> >> "
+                       b"/Contents %d 0 R >>" % (pages_id, len(objects)))
+        kids.append(len(objects))
+    objects.append(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids)))
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def flow(paragraphs, width):
+    """Wrapped lines split into page-high columns: [[(y, line)]]."""
+    columns, column, y = [], [], PAGE_TOP
+    for paragraph in paragraphs:
+        for line in textwrap.wrap(paragraph, width):
+            if y < PAGE_BOTTOM:
+                columns.append(column)
+                column, y = [], PAGE_TOP
+            column.append((y, line))
+            y -= LINE_HEIGHT
+        y -= LINE_HEIGHT / 2
+    return columns + [column]
+
+def report_pdf(en, pt):
+    pages = [text_ops([(60, y, line) for y, line in column]) for column in flow(en, 95)]
+    return pages, " ".join(en)
+
+def columns_pdf(en, pt):
+    columns, pages = flow(en, 44), []
+    for i in range(0, len(columns), 2):
+        right = columns[i + 1] if i + 1 < len(columns) else []
+        pages.append(text_ops([(50, y, line) for y, line in columns[i]] + [(316, y, line) for y, line in right]))
+    return pages, " ".join(en)
+
+def table_pdf(en, pt):
+    pages, truth = [], []
+    cells, rules, y = ([], [], []), [], PAGE_TOP
+    for number, (source, target) in enumerate(zip(en, pt), 1):
+        left, right = textwrap.wrap(source, 45)[:3], textwrap.wrap(target, 45)[:3]
+        height = LINE_HEIGHT * max(len(left), len(right), 1) + 6
+        if y - height < PAGE_BOTTOM:
+            pages.append(text_ops(cells[0] + cells[1] + cells[2]) + b"\n0.5 w " + b" ".join(rules))
+            cells, rules, y = ([], [], []), [], PAGE_TOP
+        cells[0].append((44, y - 12, str(number)))
+        cells[1].extend((80, y - 12 - LINE_HEIGHT * k, line) for k, line in enumerate(left))
+        cells[2].extend((340, y - 12 - LINE_HEIGHT * k, line) for k, line in enumerate(right))
+        rules += [b"40 %.1f 490 %.1f re S" % (y - height, height),
+                  b"76 %.1f m 76 %.1f l S" % (y, y - height), b"336 %.1f m 336 %.1f l S" % (y, y - height)]
+        for k in range(max(len(left), len(right), 1)):  # the table read line by line across its columns
+            truth += [str(number)] * (k == 0) + left[k:k + 1] + right[k:k + 1]
+        y -= height
+    pages.append(text_ops(cells[0] + cells[1] + cells[2]) + b"\n0.5 w " + b" ".join(rules))
+    return pages, " ".join(truth)
+
+SAMPLES = {"report": report_pdf, "columns": columns_pdf, "table": table_pdf}
+
+def load_documents():
+    def paragraphs(path):
+        return [p.text.strip() for p in docx.Document(path).paragraphs if p.text.strip()]
+    en, pt = [], []
+    for en_path in sorted(glob.glob(os.path.join(DATA_DIR, "ENG_*.docx"))):
+        pt_path = os.path.join(DATA_DIR, os.path.basename(en_path).replace("ENG_", "PT_", 1))
+        if os.path.exists(pt_path):
+            en += paragraphs(en_path)
+            pt += paragraphs(pt_path)
+    return en, pt
+
+# --- Measurement ---
+
+def fidelity(reference, text):
+    return difflib.SequenceMatcher(None, reference.split(), text.split(), autojunk=False).ratio()
+
+def line_agreement(reference, text):
+    def lines(t):
+        return [joined for joined in ("".join(line.split()) for line in t.split("\n")) if joined]
+    return difflib.SequenceMatcher(None, lines(reference), lines(text), autojunk=False).ratio()
+
+def timed(backend, path, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        text = extraction.extract_pdf(path, backend)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), text
+
+def measure(name, path, runs, reference=None):
+    probe = extraction.probe_pdf(path)
+    results = {backend: timed(backend, path, runs) for backend in ["auto"] + extraction.pdf_backends()}
+    baseline = results["pdfplumber"][0]
+    print(f"{name}: {probe['pages']} pages, {probe['chars_per_page']} chars/page, "
+          f"{probe['rules_per_page']} rules/page -> {probe['backend']}")
+    for backend, (seconds, text) in results.items():
+        if reference is not None:
+            quality = f"fidelity {fidelity(reference, text):.3f}"
+        else:
+            quality = f"agreement with pdfplumber {line_agreement(results['pdfplumber'][1], text):.3f}"
+        print(f"  {backend:<11} {seconds * 1000:8.1f} ms  {baseline / seconds:5.1f}x  {quality}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--pdf", action="append", default=[], help="also measure this PDF (repeatable)")
+    args = parser.parse_args()
+
+    en, pt = load_documents()
+    if not en:
+        sys.exit(f"No ENG_/PT_ .docx pairs found in {DATA_DIR}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, build in SAMPLES.items():
+            pages, reference = build(en, pt)
+            path = os.path.join(directory, f"{name}.pdf")
+            write_pdf(path, pages)
+            measure(name, path, args.runs, reference)
+    for path in args.pdf:
+        measure(os.path.basename(path), path, args.runs)
+
+if __name__ == "__main__":
+    main()
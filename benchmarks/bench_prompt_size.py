@@ -0,0 +1,76 @@
+"""Model input per document for each mode, with the gold set in data/.
+
+Counts the prompt characters each mode sends for one source document: the
+step-by-step flow (three whole-document calls), and fused and pipelined
+modes with the whole gold block in every chunk prompt (the old behaviour)
+or a per-chunk gold excerpt (gold_cache.py). The source itself stands in for
+each translation, which is about the same length. Tokens are estimated at
+--chars-per-token; no model is called.
+
+    python benchmarks/bench_prompt_size.py --source data/ENG_ALL_TEXT_AfriGO_8_2.docx
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extraction  # noqa: E402
+import gold_cache  # noqa: E402
+import pipeline  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+def step_by_step_chars(gold_prompt, source):
+    """Steps 4-6 as the apps send them: the gold block goes with translate and edit."""
+    translate = len(gold_prompt) + len(source)
+    edit = len(gold_prompt) + 2 * len(source)
+    proofread = len(pipeline.proofread_prompt("Portuguese", source))
+    return translate + edit + proofread
+
+def fused_chars(gold_prompt, chunks):
+    return sum(len(pipeline.fused_prompt("English", "Portuguese", gold_prompt, chunk)) for chunk in chunks)
+
+def pipelined_chars(gold_prompt, chunks):
+    total = 0
+    for chunk in chunks:
+        total += len(pipeline.translate_prompt("English", "Portuguese", gold_prompt, chunk))
+        total += len(pipeline.edit_prompt("English", "Portuguese", gold_prompt, chunk, chunk))
+        total += len(pipeline.proofread_prompt("Portuguese", chunk))
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=os.path.join(DATA_DIR, "ENG_ALL_TEXT_AfriGO_8_2.docx"))
+    parser.add_argument("--chars-per-token", type=float, default=4.0)
+    args = parser.parse_args()
+
+    gold_prompt = gold_cache.prewarm(DATA_DIR)
+    if not gold_prompt:
+        sys.exit(f"No ENG_/PT_ gold pairs found in {DATA_DIR}")
+    source = extraction.extract_text(args.source)
+    chunks = pipeline.chunk_text(source)
+    print(f"gold prompt: {len(gold_prompt):,} chars; source: {len(source):,} chars in {len(chunks)} chunks; "
+          f"excerpt cap: {gold_cache.GOLD_EXCERPT_CHARS:,} chars per chunk")
+
+    start = time.perf_counter()
+    gold_cache.excerpt_index(gold_prompt)
+    print(f"excerpt index built in {time.perf_counter() - start:.3f}s")
+
+    excerpt_chars = gold_cache.GOLD_EXCERPT_CHARS
+    rows = [("step-by-step (baseline)", step_by_step_chars(gold_prompt, source))]
+    gold_cache.GOLD_EXCERPT_CHARS = len(gold_prompt)  # whole gold block per chunk
+    rows += [("fused, whole gold per chunk", fused_chars(gold_prompt, chunks)),
+             ("pipelined, whole gold per chunk", pipelined_chars(gold_prompt, chunks))]
+    gold_cache.GOLD_EXCERPT_CHARS = excerpt_chars
+    rows += [("fused, gold excerpt per chunk", fused_chars(gold_prompt, chunks)),
+             ("pipelined, gold excerpt per chunk", pipelined_chars(gold_prompt, chunks))]
+
+    baseline = rows[0][1]
+    for name, chars in rows:
+        print(f"{name:36s} {chars:>11,} chars  ~{chars / args.chars_per_token:>9,.0f} tokens  "
+              f"{chars / baseline:5.2f}x baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Throughput of the local QA engine on the EN/PT sample pairs in data/.
+
+Each ENG_/PT_ document pair is checked as one source/target document; the
+corpus is repeated until it has at least --segments segments. Reports the
+time per 1000 segments and how many segments would go to the proofreader.
+The sample documents are not paragraph-aligned (different layouts), so the
+flagged share is far higher than for a real translation; the timing is what
+this measures.
+
+    python benchmarks/bench_qa.py --segments 20000 --runs 5
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import docx  # noqa: E402
+
+import qa  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+def read_docx(path):
+    return "\n".join(p.text for p in docx.Document(path).paragraphs)
+
+def load_pairs():
+    pairs = []
+    for en_path in sorted(glob.glob(os.path.join(DATA_DIR, "ENG_*.docx"))):
+        pt_path = os.path.join(DATA_DIR, os.path.basename(en_path).replace("ENG_", "PT_", 1))
+        if os.path.exists(pt_path):
+            pairs.append((read_docx(en_path), read_docx(pt_path)))
+    return pairs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    pairs = load_pairs()
+    if not pairs:
+        sys.exit(f"No ENG_/PT_ .docx pairs found in {DATA_DIR}")
+
+    per_pass = sum(qa.check_document(s, t)["segments"] for s, t in pairs)
+    repeat = max(1, -(-args.segments // per_pass))
+    timings, flagged, segments = [], 0, 0
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        flagged = segments = 0
+        for _ in range(repeat):
+            for source, target in pairs:
+                report = qa.check_document(source, target)
+                flagged += len(report["flagged"])
+                segments += report["segments"]
+        timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    print(f"{len(pairs)} document pairs x {repeat} = {segments} segments per run, {args.runs} runs")
+    print(f"median {median * 1000:.1f} ms total, {median * 1000 / segments * 1000:.2f} ms per 1000 segments")
+    print(f"flagged for proofreading: {flagged} of {segments} segments ({flagged / segments:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Speed of planning an incremental re-translation (revision.py) on the sample documents.
+
+Every ENG_ document in data/ is concatenated (repeated until it has at least
+--paragraphs paragraphs, each copy tagged so paragraphs stay distinct as in a
+real long document) and treated as a delivered project; a revision is
+simulated by editing, inserting and deleting --changed percent of the
+paragraphs. Reports the diff time and how much of the document would go
+back through Steps 4-6.
+
+    python benchmarks/bench_revision.py --paragraphs 20000 --changed 2 --runs 5
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import docx  # noqa: E402
+
+import revision  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+def load_paragraphs():
+    paragraphs = []
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, "ENG_*.docx"))):
+        paragraphs += [p.text for p in docx.Document(path).paragraphs]
+    return paragraphs
+
+def revise(paragraphs, percent, seed=0):
+    rng = random.Random(seed)
+    revised = list(paragraphs)
+    for _ in range(max(1, len(paragraphs) * percent // 100)):
+        i = rng.randrange(len(revised))
+        action = rng.random()
+        if action < 0.6:
+            revised[i] = revised[i] + " (revised)"
+        elif action < 0.8:
+            revised.insert(i, "Inserted paragraph %d." % i)
+        else:
+            del revised[i]
+    return revised
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=20000)
+    parser.add_argument("--changed", type=int, default=2, help="percent of paragraphs edited/inserted/deleted")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    paragraphs = load_paragraphs()
+    if not paragraphs:
+        sys.exit(f"No ENG_ .docx files found in {DATA_DIR}")
+    copies = -(-args.paragraphs // len(paragraphs))
+    paragraphs = [f"{p} [{copy}]" if p.strip() else p for copy in range(copies) for p in paragraphs][:args.paragraphs]
+    old_source = "\n".join(paragraphs)
+    old_final = old_source.upper()  # stands in for the delivered translation
+    new_source = "\n".join(revise(paragraphs, args.changed))
+
+    timings, plan = [], None
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        plan = revision.plan_revision(old_source, old_final, new_source, "sample")
+        timings.append(time.perf_counter() - start)
+
+    changed_chars = len(revision.changed_text(plan))
+    print(f"{len(paragraphs)} paragraphs, {args.changed}% revised, {args.runs} runs")
+    print(f"median diff {statistics.median(timings) * 1000:.1f} ms")
+    print(f"reused {len(plan['reused'])} paragraphs; {len(plan['changed'])} to translate "
+          f"({changed_chars / max(1, len(new_source)):.1%} of the source characters)")
+
+if __name__ == "__main__":
+    main()
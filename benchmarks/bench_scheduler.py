@@ -0,0 +1,88 @@
+"""Interactive latency under a batch flood: fair-share scheduler (scheduler.py) vs. a FIFO semaphore.
+
+Simulated calls sleep instead of calling Gemini. Two batch users keep
+--batch-threads threads each busy with long chunk calls (a large pipelined
+job); --interactive users each run one-page jobs (three short calls, one per
+step) back to back with a little think time. Reports the interactive job
+latency percentiles and the batch throughput for both gates.
+
+    python benchmarks/bench_scheduler.py --slots 8 --seconds 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheduler  # noqa: E402
+
+class FifoGate:
+    """The previous gate: first come, first served."""
+
+    def __init__(self, slots):
+        self._slots = threading.BoundedSemaphore(slots)
+
+    def slot(self, cost=0):
+        return self._slots
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, round(q / 100 * (len(samples) - 1)))]
+
+def simulate(gate, args):
+    stop = threading.Event()
+    latencies, batch_calls = [], [0]
+    lock = threading.Lock()
+
+    def batch_worker(user):
+        with scheduler.job(user, tier=scheduler.BATCH):
+            while not stop.is_set():
+                with gate.slot(6000):
+                    time.sleep(args.batch_call_s)
+                with lock:
+                    batch_calls[0] += 1
+
+    def interactive_user(user):
+        with scheduler.job(user, tier=scheduler.INTERACTIVE):
+            while not stop.is_set():
+                start = time.perf_counter()
+                for _ in range(3):  # translate, edit, proofread
+                    with gate.slot(1500):
+                        time.sleep(args.interactive_call_s)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                time.sleep(args.think_s)
+
+    threads = [threading.Thread(target=batch_worker, args=(f"batch-{b}",)) for b in range(2) for _ in range(args.batch_threads)]
+    threads += [threading.Thread(target=interactive_user, args=(f"user-{i}",)) for i in range(args.interactive)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, batch_calls[0] / args.seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch-threads", type=int, default=12, help="per batch user (4 workers x 3 stages)")
+    parser.add_argument("--interactive", type=int, default=4)
+    parser.add_argument("--batch-call-s", type=float, default=0.4)
+    parser.add_argument("--interactive-call-s", type=float, default=0.1)
+    parser.add_argument("--think-s", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"{args.slots} slots, 2 batch users x {args.batch_threads} threads, {args.interactive} interactive users")
+    print(f"idle one-page job: {3 * args.interactive_call_s:.2f} s")
+    for name, gate in (("fifo", FifoGate(args.slots)), ("fair", scheduler.FairScheduler(args.slots))):
+        latencies, throughput = simulate(gate, args)
+        print(f"{name}: interactive jobs {len(latencies)}, p50 {statistics.median(latencies):.2f} s, "
+              f"p95 {percentile(latencies, 95):.2f} s; batch {throughput:.1f} calls/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Memory per session: full strings in session state vs. TextRefs into the blob store.
+
+Simulates N logged-in Streamlit sessions that each hold a gold prompt, a source
+text and the step 4/5/6/final outputs, and reports traced memory per session.
+
+    python benchmarks/bench_session_memory.py --sessions 50 --memory-cap-mb 64
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import docx  # noqa: E402
+
+import blob_store  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+def load_corpus():
+    texts = []
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, "*.docx"))):
+        texts.append("\n".join(p.text for p in docx.Document(path).paragraphs))
+    return texts
+
+def build_session_texts(corpus, i):
+    """Every session builds its own copies, like the apps do; sources differ per session."""
+    gold = "".join(f"\n--- Gold Standard Example {n+1} ---\n{t}\n" for n, t in enumerate(corpus))
+    source = corpus[i % len(corpus)] + f"\n[session {i}]"
+    step_4 = source.upper()
+    step_5 = step_4 + " (edited)"
+    step_6 = step_5 + " (proofread)"
+    return {
+        "gold_standard_prompt": gold,
+        "source_text": source,
+        "translation_step_4": step_4,
+        "translation_step_5": step_5,
+        "translation_step_6": step_6,
+        "final_text": step_6,
+    }
+
+def measure(corpus, sessions, use_blob_store):
+    tracemalloc.start()
+    start = time.perf_counter()
+    states = []
+    for i in range(sessions):
+        texts = build_session_texts(corpus, i)
+        if use_blob_store:
+            texts = {k: blob_store.store(v) for k, v in texts.items()}
+        states.append(texts)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, peak, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--memory-cap-mb", type=float, default=64)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    print(f"Corpus: {len(corpus)} documents, {sum(map(len, corpus)) / 1e6:.2f}M chars")
+
+    base_current, base_peak, base_time = measure(corpus, args.sessions, use_blob_store=False)
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        blob_store._store = blob_store.BlobStore(
+            max_memory_bytes=int(args.memory_cap_mb * 1024 * 1024), hot_cache_bytes=0, spill_dir=spill_dir
+        )
+        blob_current, blob_peak, blob_time = measure(corpus, args.sessions, use_blob_store=True)
+        stats = blob_store.get_store().stats()
+
+    mb = 1024 * 1024
+    print(f"{'mode':<14}{'retained MB':>14}{'per session KB':>17}{'peak MB':>10}{'time s':>9}")
+    print(f"{'session_state':<14}{base_current / mb:>14.2f}{base_current / args.sessions / 1024:>17.1f}"
+          f"{base_peak / mb:>10.2f}{base_time:>9.2f}")
+    print(f"{'blob_store':<14}{blob_current / mb:>14.2f}{blob_current / args.sessions / 1024:>17.1f}"
+          f"{blob_peak / mb:>10.2f}{blob_time:>9.2f}")
+    print(f"Blob store: {stats['memory_blobs']} blobs in memory ({stats['memory_bytes'] / mb:.2f} MB), "
+          f"{stats['disk_blobs']} spilled, {stats.get('dedup_hits', 0)} dedup hits")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import atexit
+import collections
+import contextlib
+import hashlib
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import weakref
+import zlib
+
+import metrics
+
+# ====================================================
+#        🗄️ SHARED BLOB STORE FOR LARGE SESSION TEXTS
+# ====================================================
+# Source texts, gold prompts and step outputs can be megabytes each. Instead of
+# keeping a full copy per session, sessions hold a small TextRef and the text
+# lives once per process here: content-addressed (identical texts are stored
+# once), zlib-compressed, and bounded by a memory cap with LRU spill-to-disk.
+# The memory cap covers the compressed blobs and the hot cache of decompressed
+# texts together. Spilled blobs are bounded too: each process spills into its
+# own directory under SPILL_DIR, drops the least recently used files past
+# MAX_DISK_BYTES, removes the directory on exit, and removes directories left
+# behind by processes that are gone when it starts.
+#
+# A blob is pinned while any TextRef to it is alive (i.e. while a session
+# holds it) and is never dropped from disk then, even past MAX_DISK_BYTES.
+# When a session overwrites, resets or ends, its TextRefs are garbage
+# collected and their blobs become evictable again.
+
+MAX_MEMORY_BYTES = int(float(os.getenv("BLOB_STORE_MAX_MEMORY_MB", 256)) * 1024 * 1024)
+HOT_CACHE_BYTES = int(float(os.getenv("BLOB_STORE_HOT_CACHE_MB", 32)) * 1024 * 1024)  # part of MAX_MEMORY_BYTES
+MAX_DISK_BYTES = int(float(os.getenv("BLOB_STORE_MAX_DISK_MB", 2048)) * 1024 * 1024)
+SPILL_DIR = os.getenv("BLOB_STORE_SPILL_DIR", os.path.join(tempfile.gettempdir(), "afride-blobs"))
+COMPRESSION_LEVEL = 3
+
+class TextRef:
+    """Session-side handle to a text in the blob store. Truthy iff the text is non-empty."""
+
+    __slots__ = ("ref", "length", "__weakref__")
+
+    def __init__(self, ref, length):
+        self.ref = ref
+        self.length = length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        return isinstance(other, TextRef) and other.ref == self.ref
+
+    def __hash__(self):
+        return hash(self.ref)
+
+    def __repr__(self):
+        return f"TextRef({self.ref[:12]}…, {self.length} chars)"
+
+class BlobStore:
+    """Process-wide, thread-safe, compressed content-addressed text store."""
+
+    def __init__(self, max_memory_bytes=None, hot_cache_bytes=None, spill_dir=None, max_disk_bytes=None):
+        self.max_memory_bytes = MAX_MEMORY_BYTES if max_memory_bytes is None else max_memory_bytes
+        self.hot_cache_bytes = HOT_CACHE_BYTES if hot_cache_bytes is None else hot_cache_bytes
+        self.max_disk_bytes = MAX_DISK_BYTES if max_disk_bytes is None else max_disk_bytes
+        self.spill_root = spill_dir or SPILL_DIR
+        self.spill_dir = os.path.join(self.spill_root, str(os.getpid()))
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()  # ref -> compressed bytes (LRU order)
+        self._memory_bytes = 0
+        self._hot = collections.OrderedDict()  # ref -> decompressed str (LRU order)
+        self._hot_bytes = 0
+        self._on_disk = collections.OrderedDict()  # ref -> file size (LRU order)
+        self._disk_bytes = 0
+        self._pins = collections.Counter()  # ref -> live TextRefs
+        self._released = queue.SimpleQueue()  # refs whose TextRef died; unpinned under the lock
+        self._stats = collections.Counter()
+        _remove_stale_spill_dirs(self.spill_root)
+
+    # --- Public API ---
+
+    def put(self, text):
+        """Stores `text` (once per distinct content) and returns its TextRef."""
+        data = text.encode("utf-8")
+        ref = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._stats["puts"] += 1
+            if ref in self._memory:
+                self._memory.move_to_end(ref)
+                self._stats["dedup_hits"] += 1
+                return self._pinned_ref(ref, len(text))
+            if ref in self._on_disk:
+                self._on_disk.move_to_end(ref)
+                self._stats["dedup_hits"] += 1
+                return self._pinned_ref(ref, len(text))
+
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        with self._lock:
+            text_ref = self._pinned_ref(ref, len(text))
+            if ref not in self._memory:
+                self._stats["raw_bytes_in"] += len(data)
+                self._stats["compressed_bytes_in"] += len(compressed)
+                self._admit(ref, compressed)
+        return text_ref
+
+    def get(self, ref):
+        """Returns the text for a TextRef (or raw ref string)."""
+        ref = ref.ref if isinstance(ref, TextRef) else ref
+        with self._lock:
+            text = self._hot.get(ref)
+            if text is not None:
+                self._hot.move_to_end(ref)
+                self._stats["hot_hits"] += 1
+                return text
+            compressed = self._memory.get(ref)
+            if compressed is not None:
+                self._memory.move_to_end(ref)
+                self._stats["memory_hits"] += 1
+
+        if compressed is None:
+            compressed = self._read_spilled(ref)
+            with self._lock:
+                self._stats["disk_reads"] += 1
+                if ref in self._on_disk:
+                    self._on_disk.move_to_end(ref)
+                if ref not in self._memory:
+                    self._admit(ref, compressed)
+
+        text = zlib.decompress(compressed).decode("utf-8")
+        with self._lock:
+            self._remember_hot(ref, text)
+        return text
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(
+                memory_blobs=len(self._memory),
+                memory_bytes=self._memory_bytes,
+                hot_blobs=len(self._hot),
+                hot_bytes=self._hot_bytes,
+                disk_blobs=len(self._on_disk),
+                disk_bytes=self._disk_bytes,
+                pinned_blobs=len(self._pins),
+                max_memory_bytes=self.max_memory_bytes,
+                max_disk_bytes=self.max_disk_bytes,
+            )
+        return stats
+
+    def close(self):
+        """Deletes this process's spilled blobs; TextRefs to them stop resolving."""
+        with self._lock:
+            self._on_disk.clear()
+            self._disk_bytes = 0
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    # --- Internals (called with the lock held) ---
+
+    def _pinned_ref(self, ref, length):
+        text_ref = TextRef(ref, length)
+        self._pins[ref] += 1
+        # The finalizer may run in any thread, even one holding the lock, so it only queues the ref
+        weakref.finalize(text_ref, self._released.put, ref)
+        return text_ref
+
+    def _drain_released(self):
+        while True:
+            try:
+                ref = self._released.get_nowait()
+            except queue.Empty:
+                return
+            self._pins[ref] -= 1
+            if self._pins[ref] <= 0:
+                del self._pins[ref]
+
+    def _admit(self, ref, compressed):
+        self._memory[ref] = compressed
+        self._memory_bytes += len(compressed)
+        self._enforce_memory_cap()
+
+    def _enforce_memory_cap(self):
+        # Hot texts go first: they can be decompressed again from the blobs
+        while self._memory_bytes + self._hot_bytes > self.max_memory_bytes and self._hot:
+            _, old_text = self._hot.popitem(last=False)
+            self._hot_bytes -= sys.getsizeof(old_text)
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            old_ref, old_data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_data)
+            self._spill(old_ref, old_data)
+
+    def _spill(self, ref, compressed):
+        if ref in self._on_disk:
+            self._on_disk.move_to_end(ref)
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, ref + ".z")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp, path)
+        self._on_disk[ref] = len(compressed)
+        self._disk_bytes += len(compressed)
+        self._stats["spills"] += 1
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        self._drain_released()
+        # Least recently used first; blobs a session still references are kept
+        for old_ref in [r for r in self._on_disk if r != ref and not self._pins.get(r)]:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._disk_bytes -= self._on_disk.pop(old_ref)
+            self._stats["disk_evictions"] += 1
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.spill_dir, old_ref + ".z"))
+        if self._disk_bytes > self.max_disk_bytes:
+            self._stats["disk_over_cap_pinned"] += 1
+
+    def _read_spilled(self, ref):
+        try:
+            with open(os.path.join(self.spill_dir, ref + ".z"), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(f"Blob {ref} is no longer available") from None
+
+    def _remember_hot(self, ref, text):
+        size = sys.getsizeof(text)  # what the str really takes: 1, 2 or 4 bytes per char
+        if size > self.hot_cache_bytes or ref in self._hot:
+            return
+        self._hot[ref] = text
+        self._hot_bytes += size
+        while self._hot_bytes > self.hot_cache_bytes:
+            _, old_text = self._hot.popitem(last=False)
+            self._hot_bytes -= sys.getsizeof(old_text)
+        self._enforce_memory_cap()
+
+def _remove_stale_spill_dirs(spill_root):
+    """Removes spill directories of processes that no longer run (and pre-per-process spill files)."""
+    try:
+        entries = os.listdir(spill_root)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        path = os.path.join(spill_root, entry)
+        if entry.isdigit():
+            if int(entry) != os.getpid() and not _process_alive(int(entry)):
+                shutil.rmtree(path, ignore_errors=True)
+        elif entry.endswith((".z", ".tmp")):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # someone else's process
+    return True
+
+# --- Process-wide Store ---
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BlobStore()
+                metrics.register_provider("blob_store", _store.stats)
+                atexit.register(_store.close)
+    return _store
+
+def store(text):
+    """Returns a TextRef for non-empty text; None and "" pass through unchanged."""
+    if not text:
+        return text
+    return get_store().put(text)
+
+def resolve(value):
+    """Inverse of store(): TextRef -> str, anything else passes through unchanged."""
+    if isinstance(value, TextRef):
+        return get_store().get(value)
+    return value
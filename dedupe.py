@@ -0,0 +1,88 @@
+import re
+
+import metrics
+
+# ====================================================
+#        ♻️ IN-DOCUMENT SEGMENT DEDUPLICATION
+# ====================================================
+# Source documents repeat headers, disclaimers and table labels many times.
+# Before translation, each segment (paragraph line) is normalized and hashed;
+# only the first occurrence of each distinct segment goes to the model, and the
+# translations are expanded back into every occurrence afterwards, keeping the
+# original paragraph order and breaks. If the model does not return one line
+# per unique segment, callers fall back to translating the full text.
+
+MIN_SAVED_SEGMENTS = 1  # dedupe only when at least this many segments repeat
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def _key(segment):
+    # Case is kept: "NOTE" and "Note" may need different translations
+    return _WHITESPACE_RE.sub(" ", segment).strip()
+
+def dedupe(text):
+    """Plan dict: the unique segments to translate ("text") and how to expand them back.
+
+    `slots` has one entry per source line: the index of its unique segment, or
+    None for a blank line (kept as a paragraph break).
+    """
+    text = text or ""
+    unique_index, unique, slots = {}, [], []
+    for line in text.split("\n"):
+        key = _key(line)
+        if not key:
+            slots.append(None)
+            continue
+        index = unique_index.get(key)
+        if index is None:
+            index = unique_index[key] = len(unique)
+            unique.append(key)
+        slots.append(index)
+    segments = sum(slot is not None for slot in slots)
+    unique_text = "\n".join(unique)
+    return {
+        "text": unique_text,
+        "slots": slots,
+        "segments": segments,
+        "unique": len(unique),
+        "source_chars": len(text),
+        "unique_chars": len(unique_text),
+    }
+
+def worthwhile(plan):
+    return plan["segments"] - plan["unique"] >= MIN_SAVED_SEGMENTS
+
+def expand(plan, translated_text):
+    """Full-document text from the translation of plan["text"]; None if the lines do not line up."""
+    lines = [line.strip() for line in (translated_text or "").split("\n") if line.strip()]
+    if len(lines) != plan["unique"]:
+        return None
+    return "\n".join("" if slot is None else lines[slot] for slot in plan["slots"])
+
+def run(text, translate_fn, plan=None):
+    """(result, plan): translate_fn applied to the deduplicated text, expanded back.
+
+    translate_fn(text) returns a translation, a dict of translations (e.g. the
+    three pipeline versions) or None on failure. When nothing repeats, or a
+    result does not line up, translate_fn gets the original text instead.
+    A plan already made for `text` can be passed in to share it between runs;
+    it is never modified (a run that falls back returns a marked copy).
+    """
+    plan = plan or dedupe(text)
+    if not worthwhile(plan):
+        return translate_fn(text), plan
+    result = translate_fn(plan["text"])
+    if result is None:
+        return None, plan
+    if isinstance(result, dict):
+        expanded = {name: expand(plan, version) for name, version in result.items()}
+        passes = len(expanded) if all(v is not None for v in expanded.values()) else 0
+    else:
+        expanded = expand(plan, result)
+        passes = 1 if expanded is not None else 0
+    if not passes:
+        metrics.incr("dedupe.fallbacks")
+        return translate_fn(text), dict(plan, fallback=True)
+    metrics.incr("dedupe.segments_saved", passes * (plan["segments"] - plan["unique"]))
+    metrics.incr("dedupe.chars_saved", passes * (plan["source_chars"] - plan["unique_chars"]))
+    return expanded, plan
@@ -0,0 +1,34 @@
+import io
+import zipfile
+
+from lazy_imports import lazy_import
+
+docx = lazy_import("docx")
+
+# ====================================================
+#        📦 DELIVERABLES (.docx and bundles)
+# ====================================================
+# The files a project is delivered as: one .docx per translation, with one
+# paragraph per line, and a .zip bundle of them for multi-target runs. Built
+# by the UIs, or by the translation service (POST /export) when they are thin
+# clients.
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+def word_document(text):
+    """A .docx (bytes) with one paragraph per line of `text`."""
+    document = docx.Document()
+    if text:
+        for paragraph in text.split("\n"):
+            document.add_paragraph(paragraph)
+    stream = io.BytesIO()
+    document.save(stream)
+    return stream.getvalue()
+
+def delivery_bundle(final_texts, base_name):
+    """A .zip (bytes) with one translated .docx per target language."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for target_lang, text in final_texts.items():
+            bundle.writestr(f"translated_{base_name}_{target_lang}.docx", word_document(text))
+    return buffer.getvalue()
@@ -0,0 +1,79 @@
+import collections
+import hashlib
+import threading
+
+# ====================================================
+#          📄 PAGINATED DOCUMENT VIEWER HELPERS
+# ====================================================
+# The UIs show documents one paragraph range at a time instead of pushing the
+# whole text into several widgets. Paragraphs are newline-separated lines, the
+# same unit read_file() produces and create_word_document() writes.
+
+PAGE_SIZE = 25
+PAGE_SIZES = [10, 25, 50, 100]
+LINE_STARTS_CACHE_SIZE = 64
+
+# Keyed on a digest of the text, not the text itself, so the cache does not
+# keep large documents alive after the blob store has spilled them
+_starts_cache = collections.OrderedDict()  # digest -> paragraph offsets (LRU order)
+_starts_lock = threading.Lock()
+
+def _line_starts(text):
+    """Offsets at which each paragraph begins, cached per distinct text."""
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _starts_lock:
+        starts = _starts_cache.get(key)
+        if starts is not None:
+            _starts_cache.move_to_end(key)
+            return starts
+    starts = _find_line_starts(text)
+    with _starts_lock:
+        _starts_cache[key] = starts
+        while len(_starts_cache) > LINE_STARTS_CACHE_SIZE:
+            _starts_cache.popitem(last=False)
+    return starts
+
+def _find_line_starts(text):
+    starts = [0]
+    find = text.find
+    pos = find("\n")
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = find("\n", pos + 1)
+    return tuple(starts)
+
+def paragraph_count(text):
+    if not text:
+        return 0
+    starts = _line_starts(text)
+    # A trailing newline does not start a new paragraph
+    return len(starts) - 1 if starts[-1] == len(text) else len(starts)
+
+def clamp_start(start, total, page_size=PAGE_SIZE):
+    """Keeps a 0-based paragraph index on a valid page boundary."""
+    start = int(start or 0)
+    if total <= 0:
+        return 0
+    last_page_start = ((total - 1) // page_size) * page_size
+    return max(0, min(start, last_page_start))
+
+def paragraph_range(text, start, count=PAGE_SIZE):
+    """Returns paragraphs [start, start + count) of `text` as a newline-joined string."""
+    if not text or count <= 0:
+        return ""
+    starts = _line_starts(text)
+    total = paragraph_count(text)
+    if start >= total:
+        return ""
+    end = start + count
+    if end < total:
+        stop = starts[end] - 1
+    else:
+        stop = len(text) - 1 if text.endswith("\n") else len(text)
+    return text[starts[start]:stop]
+
+def page_label(start, page_size, total):
+    if total == 0:
+        return "No paragraphs to show."
+    end = min(start + page_size, total)
+    return f"Paragraphs **{start + 1}–{end}** of **{total}** (page {start // page_size + 1} of {(total - 1) // page_size + 1})"
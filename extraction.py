@@ -0,0 +1,255 @@
+import concurrent.futures
+import contextlib
+import io
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from multiprocessing import shared_memory
+
+from lazy_imports import lazy_import
+
+docx = lazy_import("docx")
+pdfium = lazy_import("pypdfium2")
+pdfplumber = lazy_import("pdfplumber")
+
+# ====================================================
+#             📄 TEXT EXTRACTION (shared)
+# ====================================================
+# UI-independent extraction used by background work (gold corpus warm-up,
+# services). The apps keep their own read_file() wrappers for error display.
+#
+# Large files (LARGE_FILE_BYTES and up) are never copied around whole:
+#   * uploads held in memory are spooled to a temporary file straight from
+#     the upload's buffer, and uploads already on disk are parsed in place;
+#   * .txt files are decoded straight from a memory map of the file;
+#   * PDF/DOCX parsing is CPU-bound and holds the GIL, so it runs in a small
+#     pool of worker processes (EXTRACT_PROCESSES). A worker gets the file's
+#     path, not its bytes, and hands the text back in a shared memory block
+#     that the caller decodes in place, instead of pickling it through a pipe.
+#
+# PDFs go through a registry of extractor backends (register_pdf_backend).
+# pdfplumber rebuilds lines from character positions: slow, but it reads
+# tables in visual order whatever order the PDF draws them in. pdfium reads
+# the text layer in drawing order, dozens of times faster, and is as good for
+# running text (better for multi-column pages, which pdfplumber interleaves
+# line by line). With EXTRACT_PDF_BACKEND=auto, probe_pdf() looks at a few
+# pages and keeps pdfplumber only for sparse pages (forms, slides, figures)
+# and ruled ones (tables).
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+
+LARGE_FILE_BYTES = int(float(os.getenv("EXTRACT_LARGE_FILE_MB", 4)) * 1024 * 1024)
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", 2))  # 0 parses everything in the calling thread
+SPOOL_DIR = os.getenv("EXTRACT_SPOOL_DIR") or None  # None: the system temp directory
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+EXTRACT_PDF_BACKEND = os.getenv("EXTRACT_PDF_BACKEND", "auto")  # "auto" or a registered backend name
+PDF_PROBE_PAGES = int(os.getenv("EXTRACT_PDF_PROBE_PAGES", 3))  # pages sampled, spread over the document
+PDF_MIN_CHARS_PER_PAGE = int(os.getenv("EXTRACT_PDF_MIN_CHARS_PER_PAGE", 200))  # sparser pages are layout-heavy
+PDF_MAX_RULES_PER_PAGE = int(os.getenv("EXTRACT_PDF_MAX_RULES_PER_PAGE", 10))  # more vector paths: tables, forms
+PDF_FAST_BACKEND = "pdfium"
+PDF_LAYOUT_BACKEND = "pdfplumber"
+
+_pool = None
+_pool_lock = threading.Lock()
+_pdf_backends = {}  # name -> fn(source) returning the text; source is a path or a binary file object
+_pdfium_lock = threading.Lock()  # pdfium is not thread-safe; every call into it holds this
+
+def extract_text(source, file_name=None):
+    """Extracts text from a path, raw bytes or a binary file object (txt, pdf, docx)."""
+    if isinstance(source, (str, os.PathLike)):
+        file_name = file_name or os.fspath(source)
+    if not file_name:
+        raise ValueError("A file name is needed to detect the file type.")
+
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == ".txt":
+        if isinstance(source, (str, os.PathLike)):
+            return _read_text_file(source)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return str(source, "utf-8")
+        return source.read().decode("utf-8")
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    if extension == ".pdf":
+        return extract_pdf(source)
+
+    if extension == ".docx":
+        return "".join(para.text + "\n" for para in docx.Document(source).paragraphs)
+
+    raise ValueError(f"Unsupported file format: {os.path.basename(file_name)}")
+
+def _read_text_file(path):
+    """UTF-8 text of a file, decoded from a memory map; newlines are normalized like open() does."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            text = str(mapped, "utf-8")
+    return text.replace("\r\n", "\n").replace("\r", "\n")  # no copy when there is nothing to replace
+
+# --- PDF Backends ---
+
+def register_pdf_backend(name, fn):
+    """Adds a PDF extractor that EXTRACT_PDF_BACKEND (or extract_pdf's `backend`) can name."""
+    _pdf_backends[name] = fn
+
+def pdf_backends():
+    return sorted(_pdf_backends)
+
+def extract_pdf(source, backend=None):
+    """Text of a PDF (a path or a binary file object) with the named backend, or the probe's pick for "auto"."""
+    backend = backend or EXTRACT_PDF_BACKEND
+    if backend == "auto":
+        backend = probe_pdf(source)["backend"]
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+    if backend not in _pdf_backends:
+        raise ValueError(f"Unknown PDF backend: {backend} (available: {', '.join(pdf_backends())})")
+    return _pdf_backends[backend](source)
+
+def probe_pdf(source):
+    """Page count and text density of a few sampled pages, and the backend suited to them.
+
+    Returns {"pages", "chars_per_page", "rules_per_page", "backend"}; the
+    per-page figures are averages over the sampled pages. A PDF that pdfium
+    cannot open goes to the layout backend.
+    """
+    pages, chars, rules, sampled = 0, 0, 0, 0
+    try:
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(source)
+            try:
+                pages = len(pdf)
+                count = min(PDF_PROBE_PAGES, pages)
+                for index in sorted({i * (pages - 1) // max(1, count - 1) for i in range(count)}):
+                    page = pdf[index]
+                    textpage = page.get_textpage()
+                    chars += textpage.count_chars()
+                    rules += sum(1 for _ in page.get_objects(filter=[pdfium.raw.FPDF_PAGEOBJ_PATH], max_depth=1))
+                    textpage.close()
+                    page.close()
+                    sampled += 1
+            finally:
+                pdf.close()
+    except pdfium.PdfiumError:
+        return {"pages": 0, "chars_per_page": 0, "rules_per_page": 0, "backend": PDF_LAYOUT_BACKEND}
+
+    chars_per_page, rules_per_page = chars / max(1, sampled), rules / max(1, sampled)
+    simple = sampled == 0 or (chars_per_page >= PDF_MIN_CHARS_PER_PAGE and rules_per_page <= PDF_MAX_RULES_PER_PAGE)
+    return {
+        "pages": pages,
+        "chars_per_page": round(chars_per_page),
+        "rules_per_page": round(rules_per_page, 1),
+        "backend": PDF_FAST_BACKEND if simple else PDF_LAYOUT_BACKEND,
+    }
+
+def _pdfplumber_text(source):
+    with pdfplumber.open(source) as pdf:
+        pages = (page.extract_text() for page in pdf.pages)
+        return "".join(text + "\n" for text in pages if text)
+
+def _pdfium_text(source):
+    texts = []
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(source)
+        try:
+            for index in range(len(pdf)):
+                page = pdf[index]
+                textpage = page.get_textpage()
+                texts.append(textpage.get_text_bounded())
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+    pages = (text.replace("\r\n", "\n").rstrip("\n") for text in texts)  # pdfium ends lines with \r\n
+    return "".join(text + "\n" for text in pages if text)
+
+register_pdf_backend("pdfplumber", _pdfplumber_text)
+register_pdf_backend("pdfium", _pdfium_text)
+
+# --- Large Files ---
+
+def extract_file(path, file_name=None):
+    """Text of a file on disk; large PDF/DOCX files are parsed in a worker process."""
+    file_name = file_name or os.fspath(path)
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in (".pdf", ".docx") and EXTRACT_PROCESSES > 0 and os.path.getsize(path) >= LARGE_FILE_BYTES:
+        return _extract_in_worker(os.fspath(path), file_name)
+    return extract_text(path, file_name)
+
+def extract_upload(source, file_name):
+    """Text of an upload: a bytes-like buffer (e.g. an upload's getbuffer()) or a binary file object.
+
+    Small uploads are parsed in memory; large ones are spooled to disk and
+    parsed from the file (extract_file).
+    """
+    in_memory = isinstance(source, (bytes, bytearray, memoryview))
+    if in_memory:
+        size = memoryview(source).nbytes
+    else:
+        size = source.seek(0, os.SEEK_END)
+        source.seek(0)
+    # Text in a buffer is decoded in place, whatever its size
+    if size < LARGE_FILE_BYTES or (in_memory and os.path.splitext(file_name)[1].lower() == ".txt"):
+        return extract_text(source, file_name)
+    with spooled(source, file_name) as path:
+        return extract_file(path, file_name)
+
+@contextlib.contextmanager
+def spooled(source, file_name):
+    """A temporary file holding `source` (a bytes-like buffer or binary file object), for the block.
+
+    Buffers are written out directly and streams copied in SPOOL_CHUNK_BYTES
+    pieces, so no whole in-memory copy is made.
+    """
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(file_name)[1], prefix="afride-upload-", dir=SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                f.write(source)
+            else:
+                shutil.copyfileobj(source, f, SPOOL_CHUNK_BYTES)
+        yield path
+    finally:
+        os.remove(path)
+
+def _worker_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the apps run many threads, and forking them is unsafe
+            _pool = concurrent.futures.ProcessPoolExecutor(EXTRACT_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _extract_in_worker(path, file_name):
+    global _pool
+    try:
+        name, size = _worker_pool().submit(_extract_to_shared_memory, path, file_name).result()
+    except concurrent.futures.process.BrokenProcessPool:
+        # A worker died (e.g. killed for memory); the next large file gets a fresh pool
+        with _pool_lock:
+            _pool = None
+        return extract_text(path, file_name)
+    block = shared_memory.SharedMemory(name)
+    try:
+        view = block.buf[:size]
+        try:
+            return str(view, "utf-8")
+        finally:
+            view.release()
+    finally:
+        block.close()
+        block.unlink()
+
+def _extract_to_shared_memory(path, file_name):
+    """Runs in a worker process: extracts the text into a new shared memory block; returns (name, size in bytes)."""
+    data = extract_text(path, file_name).encode("utf-8")
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    block.close()
+    return block.name, len(data)
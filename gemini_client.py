@@ -0,0 +1,191 @@
+import concurrent.futures
+import functools
+import hashlib
+import threading
+import time
+
+import metrics
+import usage
+from lazy_imports import lazy_import
+
+genai = lazy_import("google.generativeai")
+glm = lazy_import("google.ai.generativelanguage")
+grpc = lazy_import("grpc")
+core_exceptions = lazy_import("google.api_core.exceptions")
+routing_header = lazy_import("google.api_core.gapic_v1.routing_header")
+generation_types = lazy_import("google.generativeai.types.generation_types")
+
+# ====================================================
+#          🔌 POOLED, KEEP-ALIVE GEMINI TRANSPORT
+# ====================================================
+# genai.configure() swaps one global client, so concurrent sessions race on it
+# and every reconfigure can throw away the open channel. Instead, each API key
+# gets its own GenerativeServiceClient with a long-lived, keep-alive gRPC
+# channel, and GenerativeModel objects are bound to it per (key, model).
+# Clients and channels are thread-safe and shared by all sessions.
+#
+# Requests are sent as gRPC futures on that channel (start()), not through the
+# blocking generate_content(): the caller needs no thread per request, can wait
+# on several at once (hedging), and cancel() ends a request on the wire, so an
+# abandoned call stops using quota and its connection stream right away.
+
+DEFAULT_TIMEOUT_S = 600
+USER_ROLE = "user"
+
+# Keep idle connections open between calls (Step 6 makes many short requests)
+KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30_000),
+    ("grpc.keepalive_timeout_ms", 10_000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_connection_idle_ms", 30 * 60 * 1000),
+]
+
+def key_id(api_key):
+    """Short, non-reversible identifier for an API key (safe to show in metrics)."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:10]
+
+class GeminiClientPool:
+    """One persistent client per API key, one bound GenerativeModel per (key, model)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}  # key_id -> GenerativeServiceClient
+        self._models = {}  # (key_id, model_name) -> GenerativeModel
+
+    def _make_client(self, api_key):
+        transport_cls = glm.GenerativeServiceClient.get_transport_class("grpc")
+
+        def keepalive_channel(host, **kwargs):
+            kwargs["options"] = list(kwargs.get("options") or []) + KEEPALIVE_OPTIONS
+            return transport_cls.create_channel(host, **kwargs)
+
+        return glm.GenerativeServiceClient(
+            client_options={"api_key": api_key},
+            transport=functools.partial(transport_cls, channel=keepalive_channel),
+        )
+
+    def model(self, api_key, model_name):
+        """Returns the shared GenerativeModel for (api_key, model_name), creating it once."""
+        kid = key_id(api_key)
+        with self._lock:
+            model = self._models.get((kid, model_name))
+            if model is not None:
+                return model
+            client = self._clients.get(kid)
+            if client is None:
+                client = self._clients[kid] = self._make_client(api_key)
+                metrics.incr("gemini.clients_created")
+            model = genai.GenerativeModel(model_name)
+            model._client = client  # bind to our pooled client instead of the global default
+            self._models[(kid, model_name)] = model
+            return model
+
+    def start(self, api_key, model_name, prompt, timeout=DEFAULT_TIMEOUT_S, generation_config=None,
+              safety_settings=None, tools=None, tool_config=None):
+        """Sends a generate_content request on the pooled channel; returns its PendingCall.
+
+        There is no client-library retry on this path (the resilience layer
+        does its own); `timeout` is the request's gRPC deadline.
+        """
+        kid = key_id(api_key)
+        with self._lock:
+            reused = kid in self._clients
+        model = self.model(api_key, model_name)
+        # What GenerativeModel.generate_content() sends, minus its blocking call
+        request = model._prepare_request(
+            contents=prompt, generation_config=generation_config, safety_settings=safety_settings,
+            tools=tools, tool_config=tool_config,
+        )
+        if request.contents and not request.contents[-1].role:
+            request.contents[-1].role = USER_ROLE
+
+        metrics.incr("gemini.calls")
+        metrics.incr("gemini.connection_reuses" if reused else "gemini.connection_setups")
+        metadata = (routing_header.to_grpc_metadata((("model", request.model),)),)
+        future = model._client.transport.generate_content.future(request, timeout=timeout, metadata=metadata)
+        return PendingCall(model_name, future)
+
+    def generate(self, api_key, model_name, prompt, timeout=DEFAULT_TIMEOUT_S, **kwargs):
+        """start() and wait for the response."""
+        return self.start(api_key, model_name, prompt, timeout=timeout, **kwargs).result()
+
+    def warm(self, api_key, model_name):
+        """Creates the client and opens its channel ahead of the first request."""
+        model = self.model(api_key, model_name)
+        channel = model._client.transport.grpc_channel
+        try:
+            import grpc
+            grpc.channel_ready_future(channel).result(timeout=10)
+        except Exception:
+            pass  # connection is established lazily on the first call instead
+        return model
+
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self._clients), "models": len(self._models)}
+
+class PendingCall:
+    """One generate_content request in flight.
+
+    result() waits for the response (raising google.api_core exceptions,
+    which carry the HTTP status, like the client library); cancel() ends the
+    request on the wire. Metrics and the current project's usage meter are
+    updated once, by whichever of the two is called first, so call them from
+    the thread that started the request.
+    """
+
+    def __init__(self, model_name, future):
+        self.model_name = model_name
+        self._future = future
+        self._started = time.perf_counter()
+        self._recorded = False
+
+    def done(self):
+        return self._future.done()
+
+    def add_done_callback(self, fn):
+        """Calls fn(self) once the request has finished, been cancelled or failed (on a gRPC thread)."""
+        self._future.add_done_callback(lambda _: fn(self))
+
+    def cancel(self):
+        if self._future.cancel():
+            metrics.incr("gemini.cancelled")
+            self._record(None, observe=False)
+
+    def result(self):
+        try:
+            response = self._future.result()
+        except grpc.FutureCancelledError:
+            self._record(None, observe=False)
+            raise concurrent.futures.CancelledError() from None
+        except grpc.RpcError as e:
+            metrics.incr("gemini.errors")
+            self._record(None)
+            raise core_exceptions.from_grpc_error(e) from e
+        response = generation_types.GenerateContentResponse.from_response(response)
+        self._record(response)
+        return response
+
+    def _record(self, response, observe=True):
+        if self._recorded:
+            return
+        self._recorded = True
+        latency = time.perf_counter() - self._started
+        if observe:  # a cancelled call's time says nothing about the model's latency
+            metrics.observe(f"gemini.latency.{self.model_name}", latency)
+        usage.record(self.model_name, latency, response)  # the current project's meter, if any
+
+_pool = GeminiClientPool()
+metrics.register_provider("gemini_pool", _pool.stats)
+
+def get_pool():
+    return _pool
+
+def start(api_key, model_name, prompt, timeout=DEFAULT_TIMEOUT_S, **kwargs):
+    """Sends one request on the pooled client for api_key; returns its PendingCall."""
+    return _pool.start(api_key, model_name, prompt, timeout=timeout, **kwargs)
+
+def generate(api_key, model_name, prompt, timeout=DEFAULT_TIMEOUT_S, **kwargs):
+    """Pooled equivalent of genai.configure(api_key) + GenerativeModel(model_name).generate_content()."""
+    return _pool.generate(api_key, model_name, prompt, timeout=timeout, **kwargs)
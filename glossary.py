@@ -0,0 +1,270 @@
+import csv
+import io
+import os
+import sqlite3
+import threading
+
+# ====================================================
+#        📚 TERMINOLOGY GLOSSARY (SQLite + Aho-Corasick)
+# ====================================================
+# Term pairs are stored per (source language, target language, client). Each
+# glossary is compiled once into an Aho-Corasick automaton (cached until the
+# glossary changes), which finds every term in a chunk in a single linear pass.
+# Only the matching entries go into that chunk's prompt, and the QA engine
+# checks afterwards that the target uses the required translations, so a
+# glossary with tens of thousands of terms costs nothing per request.
+
+GLOSSARY_DB_PATH = os.getenv("GLOSSARY_DB_PATH", "glossary.db")
+DEFAULT_CLIENT = "default"
+SUPPORTED_EXTENSIONS = (".csv", ".tsv", ".txt")
+BUSY_TIMEOUT_MS = 5000
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths = set()
+
+_cache = {}  # (db_path, source_lang, target_lang, client) -> (version, Glossary)
+_cache_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS glossaries (
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    client      TEXT NOT NULL,
+    version     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source_lang, target_lang, client)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS terms (
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    client      TEXT NOT NULL,
+    source_term TEXT NOT NULL COLLATE NOCASE,
+    target_term TEXT NOT NULL,
+    PRIMARY KEY (source_lang, target_lang, client, source_term)
+) WITHOUT ROWID;
+"""
+
+# --- Aho-Corasick Automaton ---
+
+class AhoCorasick:
+    """Multi-pattern matcher: all occurrences of all patterns in one pass over the text."""
+
+    def __init__(self, patterns):
+        self._goto = [{}]  # state -> {char: next state}
+        self._fail = [0]
+        self._out = [()]  # state -> pattern indices ending here (including via fail links)
+        self.lengths = []
+        for index, pattern in enumerate(patterns):
+            self._add(pattern, index)
+        self._build_fail_links()
+
+    def _add(self, pattern, index):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + (index,)
+        self.lengths.append(len(pattern))
+
+    def _build_fail_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yields (start, end, pattern_index) for every occurrence, overlapping ones included."""
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self.lengths
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                yield position + 1 - lengths[index], position + 1, index
+
+# --- Glossary ---
+
+class Glossary:
+    """Compiled, read-only term list: finds terms in source text and checks target text."""
+
+    def __init__(self, pairs):
+        entries = {}
+        for source_term, target_term in pairs:
+            source_term, target_term = source_term.strip(), target_term.strip()
+            if source_term and target_term:
+                entries[source_term.lower()] = (source_term, target_term)
+        self._keys = list(entries)
+        self._entries = [entries[key] for key in self._keys]
+        self._automaton = AhoCorasick(self._keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find_terms(self, text):
+        """{source_term: target_term} for every glossary term found (as whole words) in text.
+
+        Where terms overlap, the longest one wins ("gold standard" over "standard").
+        """
+        lowered = (text or "").lower()
+        matches = [
+            (start, end, index) for start, end, index in self._automaton.iter_matches(lowered)
+            # whole words only: not preceded or followed by a letter/digit
+            if not (start > 0 and lowered[start - 1].isalnum()) and not (end < len(lowered) and lowered[end].isalnum())
+        ]
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        found, covered_to = {}, 0
+        for start, end, index in matches:
+            if start < covered_to:
+                continue
+            covered_to = end
+            source_term, target_term = self._entries[index]
+            found.setdefault(source_term, target_term)
+        return found
+
+    def prompt_block(self, text):
+        """Prompt section listing only the glossary entries that occur in `text` ("" if none)."""
+        terms = self.find_terms(text)
+        if not terms:
+            return ""
+        lines = "\n".join(f"- {source} → {target}" for source, target in terms.items())
+        return f"\nMandatory terminology (use these translations):\n{lines}\n"
+
+    def violations(self, source_text, target_text, terms=None):
+        """[(source_term, target_term)] found in the source whose translation is missing from the target."""
+        terms = self.find_terms(source_text) if terms is None else terms
+        target_lower = (target_text or "").lower()
+        return [(s, t) for s, t in terms.items() if t.lower() not in target_lower]
+
+# --- Connection Handling ---
+
+def _connect(db_path=None):
+    """Returns this thread's connection to the glossary database, creating it on first use."""
+    db_path = db_path or GLOSSARY_DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        connections[db_path] = conn
+        with _init_lock:
+            if db_path not in _initialized_paths:
+                conn.executescript(_SCHEMA)
+                _initialized_paths.add(db_path)
+    return conn
+
+# --- Store API ---
+
+def import_terms(source_lang, target_lang, client, pairs, replace=False, db_path=None):
+    """Adds (or updates) term pairs in one transaction; replace=True drops the old entries first."""
+    client = client or DEFAULT_CLIENT
+    rows = [(source_lang, target_lang, client, s.strip(), t.strip()) for s, t in pairs if s.strip() and t.strip()]
+    conn = _connect(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if replace:
+            conn.execute(
+                "DELETE FROM terms WHERE source_lang = ? AND target_lang = ? AND client = ?",
+                (source_lang, target_lang, client),
+            )
+        conn.executemany(
+            """INSERT INTO terms (source_lang, target_lang, client, source_term, target_term) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT DO UPDATE SET target_term = excluded.target_term""",
+            rows,
+        )
+        conn.execute(
+            """INSERT INTO glossaries (source_lang, target_lang, client, version) VALUES (?, ?, ?, 1)
+               ON CONFLICT DO UPDATE SET version = version + 1""",
+            (source_lang, target_lang, client),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+def list_glossaries(db_path=None):
+    """[(source_lang, target_lang, client, term_count)] for every stored glossary."""
+    return _connect(db_path).execute(
+        """SELECT g.source_lang, g.target_lang, g.client, COUNT(t.source_term)
+           FROM glossaries g LEFT JOIN terms t USING (source_lang, target_lang, client)
+           GROUP BY g.source_lang, g.target_lang, g.client ORDER BY 1, 2, 3"""
+    ).fetchall()
+
+def get_glossary(source_lang, target_lang, client=None, db_path=None):
+    """The compiled Glossary for a language pair and client, or None if it has no terms.
+
+    The automaton is built once per glossary version and shared by all sessions.
+    """
+    client = client or DEFAULT_CLIENT
+    db_path = db_path or GLOSSARY_DB_PATH
+    conn = _connect(db_path)
+    row = conn.execute(
+        "SELECT version FROM glossaries WHERE source_lang = ? AND target_lang = ? AND client = ?",
+        (source_lang, target_lang, client),
+    ).fetchone()
+    if row is None:
+        return None
+
+    key = (db_path, source_lang, target_lang, client)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == row[0]:
+            return cached[1]
+    pairs = conn.execute(
+        "SELECT source_term, target_term FROM terms WHERE source_lang = ? AND target_lang = ? AND client = ?",
+        (source_lang, target_lang, client),
+    ).fetchall()
+    glossary = Glossary(pairs) if pairs else None
+    with _cache_lock:
+        _cache[key] = (row[0], glossary)
+    return glossary
+
+# --- File Import ---
+
+def parse_glossary_file(source, file_name=None):
+    """[(source_term, target_term)] from a two-column CSV/TSV file (path, bytes or file object).
+
+    The delimiter is detected (tab, semicolon or comma); a header row such as
+    "source,target" is skipped.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            data = f.read()
+    elif isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    else:
+        data = source.read()
+    text = data.decode("utf-8-sig")
+
+    sample = text[:4096]
+    delimiter = max(("\t", ";", ","), key=sample.count)
+    pairs = []
+    for row in csv.reader(io.StringIO(text), delimiter=delimiter):
+        if len(row) < 2 or not row[0].strip() or not row[1].strip():
+            continue
+        pairs.append((row[0], row[1]))
+    if pairs and pairs[0][0].strip().lower() in ("source", "source term", "term", "en", "english"):
+        pairs = pairs[1:]
+    return pairs
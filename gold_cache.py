@@ -0,0 +1,320 @@
+import bisect
+import collections
+import glob
+import hashlib
+import itertools
+import math
+import os
+import re
+import threading
+
+import extraction
+import metrics
+
+# ====================================================
+#        🥇 PROCESS-WIDE GOLD-STANDARD PROMPT CACHE
+# ====================================================
+# Building the gold prompt means extracting every EN/PT file and concatenating
+# the texts. Sessions that use the same gold set share one immutable prompt
+# string, keyed by the ordered (EN hash, PT hash) pairs of the file contents.
+#
+# The chunked modes (pipeline.py) do not repeat that whole block in every
+# chunk's prompt: each chunk gets an excerpt of at most GOLD_EXCERPT_CHARS,
+# made of the passages of the gold examples that share the most (rare) words
+# with the chunk. The gold documents are not paragraph-aligned, so each
+# example is cut into windows of EN paragraphs, each paired with the PT
+# paragraphs sharing the most numbers and names with it; the window index is
+# built once per gold set.
+
+MAX_ENTRIES = int(os.getenv("GOLD_CACHE_MAX_ENTRIES", 8))
+GOLD_DATA_DIR = os.getenv("GOLD_DATA_DIR", "data")
+HASH_CHUNK_BYTES = 1024 * 1024
+
+GOLD_EXCERPT_CHARS = int(os.getenv("GOLD_EXCERPT_CHARS", 6000))  # gold text per chunk prompt
+EXCERPT_WINDOW_CHARS = int(os.getenv("GOLD_EXCERPT_WINDOW_CHARS", 800))  # EN text per window
+
+GOLD_PROMPT_HEADER = "\n\nHere are some 'gold standard' examples of English-to-Portuguese translations to guide your tone and terminology. Follow these examples closely:\n"
+
+# --- Content Hashing ---
+
+_file_hashes = {}  # (path, size, mtime_ns) -> sha256 hex
+_file_hashes_lock = threading.Lock()
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def file_hash(path):
+    """sha256 of a file's contents, remembered per (path, size, mtime) so re-hashing is free."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(key)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    with _file_hashes_lock:
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+# --- Prompt Formatting ---
+
+_EXAMPLE_RE = re.compile(
+    r"\n--- Gold Standard Example (\d+)( \(excerpt\))? ---\n\[English\]:\n(.*?)\n\[Portuguese\]:\n(.*?)\n--- End Example ---\n",
+    re.DOTALL,
+)
+_WORD_RE = re.compile(r"\w{3,}")
+_ANCHOR_RE = re.compile(r"\b(?:\d[\d.,:/-]*|[A-Z][\w’'-]{3,})")
+
+def format_example(number, en_text, pt_text, excerpt=False):
+    return (
+        f"\n--- Gold Standard Example {number}{' (excerpt)' if excerpt else ''} ---\n"
+        f"[English]:\n{en_text}\n"
+        f"[Portuguese]:\n{pt_text}\n"
+        "--- End Example ---\n"
+    )
+
+def format_gold_prompt(text_pairs):
+    """Builds the few-shot prompt from (en_text, pt_text) pairs in one join."""
+    parts = [GOLD_PROMPT_HEADER]
+    for i, (en_text, pt_text) in enumerate(text_pairs):
+        if en_text and pt_text:
+            parts.append(format_example(i + 1, en_text, pt_text))
+    return "".join(parts)
+
+def parse_gold_prompt(prompt):
+    """[(example number, en_text, pt_text)] of a prompt built by format_gold_prompt()."""
+    return [(int(m.group(1)), m.group(3), m.group(4)) for m in _EXAMPLE_RE.finditer(prompt or "")]
+
+_last_digest = (None, None)  # (prompt, digest): a job passes the same string for every chunk
+_last_digest_lock = threading.Lock()
+
+def prompt_digest(prompt):
+    """Short digest identifying a gold prompt."""
+    global _last_digest
+    with _last_digest_lock:
+        last_prompt, digest = _last_digest
+        if last_prompt is prompt:
+            return digest
+    digest = hashlib.blake2b((prompt or "").encode("utf-8"), digest_size=16).hexdigest()
+    with _last_digest_lock:
+        _last_digest = (prompt, digest)
+    return digest
+
+# --- LRU Cache ---
+
+class GoldPromptCache:
+    """Thread-safe LRU of built prompts. Each key is built at most once at a time."""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or MAX_ENTRIES
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._building = {}  # key -> lock held while that key is being built
+        self._stats = collections.Counter()
+
+    def get(self, key):
+        with self._lock:
+            prompt = self._entries.get(key)
+            if prompt is not None:
+                self._entries.move_to_end(key)
+            return prompt
+
+    def get_or_build(self, key, build):
+        """Returns the cached prompt for `key`, calling build() only on a miss."""
+        prompt = self.get(key)
+        if prompt is not None:
+            self._count("hits")
+            return prompt
+
+        with self._lock:
+            key_lock = self._building.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # Another session may have finished building while we waited
+                prompt = self.get(key)
+                if prompt is not None:
+                    self._count("hits")
+                    return prompt
+                self._count("misses")
+                prompt = build()
+                self.put(key, prompt)
+                return prompt
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def put(self, key, prompt):
+        with self._lock:
+            self._entries[key] = prompt
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries),
+                        chars=sum(len(p) for p in self._entries.values()))
+
+_cache = GoldPromptCache()
+metrics.register_provider("gold_cache", _cache.stats)
+
+def get_cache():
+    return _cache
+
+def get_or_build(key, build):
+    return _cache.get_or_build(tuple(key), build)
+
+# --- Per-Chunk Excerpts ---
+
+def _anchors(text):
+    """Tokens a translation keeps: numbers and capitalized names."""
+    return {token.lower() for token in _ANCHOR_RE.findall(text)}
+
+def _windows(number, en_text, pt_text, window_chars):
+    """Cuts one example into (number, en, pt) windows.
+
+    EN paragraphs are grouped by size; each group is paired with the run of
+    PT paragraphs of the expected length that shares the most anchors
+    (numbers, names) with it, or the run at the same relative position.
+    """
+    en_lines = [line for line in en_text.split("\n") if line.strip()]
+    pt_lines = [line for line in pt_text.split("\n") if line.strip()]
+    if not en_lines or not pt_lines:
+        return []
+    groups, current, size = [], [], 0
+    for line in en_lines:
+        current.append(line)
+        size += len(line)
+        if size >= window_chars:
+            groups.append(current)
+            current, size = [], 0
+    if current:
+        groups.append(current)
+
+    pt_anchors = [_anchors(line) for line in pt_lines]
+    ends = list(itertools.accumulate(len(line) for line in pt_lines))
+    ratio = ends[-1] / sum(len(line) for line in en_lines)
+    windows, done = [], 0
+    for group in groups:
+        en_part = "\n".join(group)
+        anchors = _anchors(en_part)
+        expected = len(en_part) * ratio
+        position = done * ratio
+        done += len(en_part)
+        best = None
+        for first in range(len(pt_lines)):
+            offset = ends[first] - len(pt_lines[first])
+            last = min(bisect.bisect_left(ends, offset + expected, lo=first), len(pt_lines) - 1)
+            shared = len(anchors.intersection(set().union(*pt_anchors[first:last + 1])))
+            rank = (shared, -abs(offset - position))
+            if best is None or rank > best[0]:
+                best = (rank, first, last)
+        _, first, last = best
+        windows.append((number, en_part, "\n".join(pt_lines[first:last + 1])))
+    return windows
+
+class GoldExcerpts:
+    """Window index over one gold prompt; excerpt() picks the windows most relevant to a text."""
+
+    def __init__(self, prompt, window_chars=None):
+        self.prompt = prompt
+        self.windows = []
+        for number, en_text, pt_text in parse_gold_prompt(prompt):
+            self.windows.extend(_windows(number, en_text, pt_text, window_chars or EXCERPT_WINDOW_CHARS))
+        self._words = [set(_WORD_RE.findall(en.lower())) for _, en, _ in self.windows]
+        document_frequency = collections.Counter(word for words in self._words for word in words)
+        count = len(self.windows)
+        self._idf = {word: math.log((count + 1) / df) for word, df in document_frequency.items()}
+
+    def excerpt(self, text, max_chars=None):
+        """Gold block of at most max_chars: the best-matching windows, in document order."""
+        max_chars = max_chars or GOLD_EXCERPT_CHARS
+        if len(self.prompt) <= max_chars:
+            return self.prompt
+        if not self.windows:
+            # Not built by format_gold_prompt(): keep its head, cut at a line break
+            head = self.prompt[:max_chars]
+            return head[:head.rfind("\n") + 1] or head
+
+        words = set(_WORD_RE.findall(text.lower()))
+        idf = self._idf
+        scores = [
+            sum(idf[word] for word in words & window_words) / math.sqrt(len(window_words) + 1)
+            for window_words in self._words
+        ]
+        chosen, used = [], len(GOLD_PROMPT_HEADER)
+        for index in sorted(range(len(self.windows)), key=lambda i: -scores[i]):
+            _, en, pt = self.windows[index]
+            size = len(en) + len(pt) + 80  # plus the example markers
+            if used + size <= max_chars:
+                chosen.append(index)
+                used += size
+        parts = [GOLD_PROMPT_HEADER]
+        parts.extend(format_example(self.windows[i][0], self.windows[i][1], self.windows[i][2], excerpt=True)
+                     for i in sorted(chosen))
+        return "".join(parts)
+
+_excerpt_indexes = collections.OrderedDict()  # prompt digest -> GoldExcerpts
+_excerpt_lock = threading.Lock()
+
+def excerpt_index(prompt):
+    """The (cached) GoldExcerpts of a gold prompt, built once per gold set."""
+    key = prompt_digest(prompt)
+    with _excerpt_lock:
+        index = _excerpt_indexes.get(key)
+        if index is not None:
+            _excerpt_indexes.move_to_end(key)
+            return index
+    index = GoldExcerpts(prompt)
+    with _excerpt_lock:
+        _excerpt_indexes[key] = index
+        while len(_excerpt_indexes) > MAX_ENTRIES:
+            _excerpt_indexes.popitem(last=False)
+    return index
+
+def excerpt(prompt, text, max_chars=None):
+    """The gold block to send with `text`: the whole prompt if it is short, else a relevant excerpt."""
+    if not prompt or len(prompt) <= (max_chars or GOLD_EXCERPT_CHARS):
+        return prompt or ""
+    return excerpt_index(prompt).excerpt(text, max_chars)
+
+# --- Pre-warming ---
+
+def find_gold_pairs(data_dir=None):
+    """Pairs ENG_<name>.docx with PT_<name>.docx under data_dir (newest copy in a subfolder wins)."""
+    data_dir = data_dir or GOLD_DATA_DIR
+    english, portuguese = {}, {}
+    paths = glob.glob(os.path.join(data_dir, "**", "*.*"), recursive=True)
+    for path in sorted(paths, key=lambda p: (p.count(os.sep), p)):
+        base = os.path.basename(path)
+        if not base.lower().endswith(extraction.SUPPORTED_EXTENSIONS):
+            continue
+        if base.startswith("ENG_"):
+            english.setdefault(base[4:], path)
+        elif base.startswith("PT_"):
+            # Deeper paths (e.g. data/Current/) come later and override data/
+            portuguese[base[3:]] = path
+    return [(english[name], portuguese[name]) for name in sorted(english) if name in portuguese]
+
+def prompt_for_paths(path_pairs):
+    """Returns the (cached) gold prompt for a list of (en_path, pt_path) pairs."""
+    key = [(file_hash(en), file_hash(pt)) for en, pt in path_pairs]
+    return get_or_build(key, lambda: format_gold_prompt(
+        (extraction.extract_text(en), extraction.extract_text(pt)) for en, pt in path_pairs
+    ))
+
+def prewarm(data_dir=None):
+    """Builds the prompt for the gold set found in data_dir so the first project hits the cache."""
+    pairs = find_gold_pairs(data_dir)
+    if not pairs:
+        return None
+    return prompt_for_paths(pairs)
@@ -0,0 +1,70 @@
+import importlib
+import threading
+import time
+
+# ====================================================
+#                 💤 LAZY MODULE IMPORTS
+# ====================================================
+# google.generativeai, the PDF parsers and docx add seconds to worker cold start but
+# are only needed once a user actually uploads a file or runs a step. Modules
+# bound with lazy_import() are imported on first attribute access, or ahead of
+# time by the warm-up hook (see warmup.py).
+
+_modules = {}
+_registry_lock = threading.Lock()
+
+class LazyModule:
+    """Stand-in for a module that imports the real one on first attribute access."""
+
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "import_seconds", None)
+
+    def load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    object.__setattr__(self, "import_seconds", time.perf_counter() - start)
+                    object.__setattr__(self, "_module", module)
+        return module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_import(name):
+    """Returns the shared LazyModule for `name`."""
+    with _registry_lock:
+        module = _modules.get(name)
+        if module is None:
+            module = _modules[name] = LazyModule(name)
+        return module
+
+def preload(*names):
+    """Imports the given lazy modules now; returns {name: seconds spent importing}."""
+    return {name: _timed_load(lazy_import(name)) for name in names}
+
+def _timed_load(module):
+    module.load()
+    return module.import_seconds
+
+def import_timings():
+    """{name: seconds or None if not imported yet} for every lazily bound module."""
+    with _registry_lock:
+        return {name: module.import_seconds for name, module in _modules.items()}
@@ -0,0 +1,70 @@
+import collections
+import threading
+
+# ====================================================
+#              📈 IN-PROCESS METRICS REGISTRY
+# ====================================================
+# Counters and rolling latency windows shared by the Gemini transport, the
+# resilience layer and the pipelines. snapshot() is what the UIs display.
+
+LATENCY_WINDOW = 1000  # most recent samples kept per latency series
+
+_lock = threading.Lock()
+_counters = collections.Counter()
+_latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+_providers = {}  # section name -> callable returning a dict of gauges
+
+def register_provider(name, fn):
+    """Adds a section to snapshot(), e.g. a cache's stats() method."""
+    with _lock:
+        _providers[name] = fn
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+def observe(name, seconds):
+    """Records one latency sample (seconds) for the series `name`."""
+    with _lock:
+        _latencies[name].append(seconds)
+
+def counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+def percentile(name, q, min_samples=1):
+    """q-th percentile (0-100) of the series, or None if it has fewer than min_samples."""
+    with _lock:
+        samples = sorted(_latencies.get(name, ()))
+    if len(samples) < max(1, min_samples):
+        return None
+    index = min(len(samples) - 1, max(0, round(q / 100 * (len(samples) - 1))))
+    return samples[index]
+
+def snapshot():
+    """Plain-dict view of all counters and latency percentiles (seconds)."""
+    with _lock:
+        counters = dict(_counters)
+        series = {name: sorted(samples) for name, samples in _latencies.items() if samples}
+        providers = dict(_providers)
+
+    def pick(samples, q):
+        return round(samples[min(len(samples) - 1, round(q / 100 * (len(samples) - 1)))], 3)
+
+    latency = {
+        name: {"count": len(samples), "p50": pick(samples, 50), "p95": pick(samples, 95),
+               "p99": pick(samples, 99), "max": round(samples[-1], 3)}
+        for name, samples in series.items()
+    }
+    result = {"counters": dict(sorted(counters.items())), "latency": dict(sorted(latency.items()))}
+    for name, fn in sorted(providers.items()):
+        try:
+            result[name] = fn()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _latencies.clear()
@@ -0,0 +1,495 @@
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import queue
+import threading
+
+import alignment
+import dedupe
+import gold_cache
+import metrics
+import qa
+import resilience
+import routing
+import scheduler
+import tm
+
+# ====================================================
+#       ⚡ FUSED TRANSLATE + EDIT + PROOFREAD MODE
+# ====================================================
+# The step-by-step flow makes three full-document round trips, each re-sending
+# the source, the gold block and the previous output. Fused mode splits the
+# source into paragraph-aligned chunks and asks for all three versions of each
+# chunk in one structured-output (JSON) call. The step-by-step mode stays
+# available for audits. Chunk prompts carry a capped excerpt of the gold
+# examples relevant to the chunk (gold_cache.py), not the whole gold block.
+#
+# Pipelined mode keeps the three separate passes but runs them per chunk as a
+# dataflow graph: translate -> edit -> proofread stages with worker threads and
+# bounded queues in between, so chunk 1 is being edited while chunk 2 is still
+# being translated. Finished chunks are assembled in order.
+#
+# The prompts of the three steps are shared with the step-by-step flow of the
+# UIs (step_prompt), which sends the whole document and the whole gold block.
+#
+# Multi-target runs prepare the source once (dedupe plan, chunking) and fan
+# out one pipeline per target language; all of them share the same call slots.
+#
+# Call slots are granted fairly across users and tiers (scheduler.py); worker
+# threads carry the caller's job context so their calls count as theirs.
+# The versions finished for each chunk are kept while a run is in progress; if
+# it is cancelled or fails, a new run of the same text resumes every chunk
+# from where it stopped instead of calling the model again.
+#
+# Every chunk's output must keep the chunk's paragraphs (alignment.py). A chunk
+# whose paragraphs were merged or split is re-requested once, on its own, in
+# numbered-segment form; if that fails too, the first output is kept and QA
+# reports the mismatch.
+
+CHUNK_CHARS = int(os.getenv("PIPELINE_CHUNK_CHARS", 6000))
+FUSED_VERSIONS = ("translation", "edited", "proofread")
+FUSED_SCHEMA = {
+    "type": "object",
+    "properties": {version: {"type": "string"} for version in FUSED_VERSIONS},
+    "required": list(FUSED_VERSIONS),
+}
+FUSED_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": FUSED_SCHEMA}
+
+STAGE_WORKERS = int(os.getenv("PIPELINE_STAGE_WORKERS", 4))  # threads per stage
+STAGE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))  # chunks waiting between stages
+MAX_CONCURRENT_CALLS = scheduler.per_process(int(os.getenv("GEMINI_MAX_CONCURRENT_CALLS", 8)))  # this process's share
+STEPS = ("translate", "edit", "proofread")  # step-by-step Steps 4, 5 and 6
+PIPELINE_MODES = ("Pipelined (Steps 4 → 5 → 6 per chunk)", "Fused (one call per chunk)")
+RESUME_MAX_CHUNKS = int(os.getenv("PIPELINE_RESUME_CHUNKS", 2000))  # finished chunks kept from unfinished runs
+
+_call_slots = scheduler.FairScheduler(MAX_CONCURRENT_CALLS)
+metrics.register_provider("scheduler", _call_slots.stats)
+
+_finished_chunks = collections.OrderedDict()  # (user, model, chunk digest) -> versions done for one chunk
+_finished_lock = threading.Lock()
+
+# --- Chunking ---
+
+def chunk_text(text, max_chars=None):
+    """Splits text into chunks of whole paragraphs (lines), each about max_chars at most."""
+    max_chars = max_chars or CHUNK_CHARS
+    chunks, current, size = [], [], 0
+    for paragraph in text.split("\n"):
+        if current and size + len(paragraph) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+# --- Model Calls ---
+
+def call_model(api_key, model_name, step, prompt, segment_text, reference_text=None, timeout=600,
+               tm_score=None, qa_failures=0, **kwargs):
+    """One chunk-level call, routed when model_name is "auto" (tm_score and qa_failures are routing signals).
+
+    Waits for one of MAX_CONCURRENT_CALLS slots, granted fairly to the current job (scheduler.py).
+    If the job is cancelled, the request is cancelled (resilience.py) and
+    scheduler.Cancelled is raised; the slot is held until then, so it always
+    matches a request that is really running.
+    """
+    def generate():
+        if model_name == routing.AUTO_MODEL:
+            text, _ = routing.generate(api_key, step, prompt, segment_text, reference_text, tm_score=tm_score,
+                                       qa_failures=qa_failures, timeout=timeout, **kwargs)
+            return text
+        return resilience.generate(api_key, model_name, prompt, timeout=timeout, **kwargs).text
+
+    with _call_slots.slot(len(segment_text or "")):
+        return generate()
+
+def call_aligned(api_key, model_name, step, prompt, chunk, segment_text=None, reference_text=None,
+                 tm_score=None, qa_failures=0):
+    """call_model() for one stage of a chunk, with the output laid out paragraph by paragraph like the chunk.
+
+    segment_text is the text the stage works on (the chunk itself, or an earlier
+    version of it); a misaligned output is re-requested in numbered form,
+    routed as one more QA failure.
+    """
+    segment_text = chunk if segment_text is None else segment_text
+    text = call_model(api_key, model_name, step, prompt, segment_text, reference_text,
+                      tm_score=tm_score, qa_failures=qa_failures)
+    aligned = alignment.realign(chunk, text)
+    if aligned is not None:
+        return aligned
+    metrics.incr(f"alignment.rerequests.{step}")
+    strict = alignment.numbered_prompt(prompt, (segment_text, reference_text, chunk), chunk)
+    aligned = alignment.realign_numbered(chunk, call_model(api_key, model_name, step, strict, segment_text, reference_text,
+                                                           tm_score=tm_score, qa_failures=qa_failures + 1))
+    if aligned is None:
+        metrics.incr(f"alignment.unresolved.{step}")
+        return text
+    return aligned
+
+# --- Routing Signals ---
+
+def routing_memory(model_name, source_lang, target_lang):
+    """The language pair's TM when calls are routed, else None (the signals are only used by routing)."""
+    return tm.get_memory(source_lang, target_lang) if model_name == routing.AUTO_MODEL else None
+
+def chunk_tm_score(memory, chunk):
+    """Lowest TM match score over the chunk's paragraphs (the chunk is only as covered as its least covered part)."""
+    paragraphs = alignment.paragraphs(chunk)
+    if memory is None or not paragraphs:
+        return None
+    return min(memory.lookup(paragraph)[0] for paragraph in paragraphs)
+
+def qa_failure_count(model_name, chunk, text, glossary=None):
+    """Local QA issues of an earlier version of a chunk, which route the stage that revises it."""
+    if model_name != routing.AUTO_MODEL:
+        return 0
+    return len(qa.check_document(chunk, text, glossary)["issues"])
+
+# --- Finished Chunks of Unfinished Runs ---
+
+def _chunk_key(model_name, mode, source_lang, target_lang, gold_prompt, chunk, glossary=None):
+    """Resume key of a chunk: the mode, languages, gold set (by digest), glossary terms and the chunk."""
+    digest = hashlib.blake2b(digest_size=16)
+    terms = glossary.prompt_block(chunk) if glossary else ""
+    for part in (mode, source_lang, target_lang, gold_cache.prompt_digest(gold_prompt), terms, chunk):
+        digest.update(part.encode("utf-8") + b"\0")
+    return scheduler.current_job().user, model_name, digest.hexdigest()
+
+def _finished_chunk(key):
+    with _finished_lock:
+        versions = _finished_chunks.get(key)
+    if versions is not None:
+        metrics.incr("pipeline.chunks_resumed")
+    return versions
+
+def _keep_chunk(key, versions):
+    with _finished_lock:
+        _finished_chunks[key] = versions
+        _finished_chunks.move_to_end(key)
+        while len(_finished_chunks) > RESUME_MAX_CHUNKS:
+            _finished_chunks.popitem(last=False)
+
+def _forget_chunks(keys):
+    """Drops the kept chunks of a run that completed."""
+    with _finished_lock:
+        for key in keys:
+            _finished_chunks.pop(key, None)
+
+# --- Fused Calls ---
+
+def fused_prompt(source_lang, target_lang, gold_prompt, chunk, glossary=None):
+    return f"""You are a professional {source_lang}-to-{target_lang} translation team: translator, editor and proofreader.
+    Work on the source text below in three passes and return all three versions as JSON:
+    - "translation": a professional, accurate {target_lang} translation.
+    - "edited": that translation reviewed against the source for accuracy, terminology and tone,
+      with stylistic and grammatical issues corrected to improve fluency.
+    - "proofread": the edited text with only objective errors fixed (typos, grammar, punctuation).
+    Preserve paragraph breaks (newlines) in every version.
+    {gold_cache.excerpt(gold_prompt, chunk)}{glossary.prompt_block(chunk) if glossary else ""}
+    ---
+    Source Text:
+    {chunk}"""
+
+def parse_fused(text):
+    """{"translation", "edited", "proofread"} from a fused response; ValueError if malformed."""
+    try:
+        data = json.loads(text)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Fused response is not valid JSON: {e}") from None
+    missing = [v for v in FUSED_VERSIONS if not isinstance(data.get(v), str)]
+    if missing:
+        raise ValueError(f"Fused response is missing: {', '.join(missing)}")
+    return {v: data[v] for v in FUSED_VERSIONS}
+
+def _fused_check(chunk):
+    def check(text):
+        try:
+            versions = parse_fused(text)
+        except ValueError as e:
+            return [str(e)]
+        return routing.local_qa_failures(chunk, versions["proofread"])
+    return check
+
+def run_fused_chunk(api_key, model_name, source_lang, target_lang, gold_prompt, chunk, glossary=None, timeout=600,
+                    memory=None):
+    """One structured-output call returning all three versions of one chunk.
+
+    If any version does not keep the chunk's paragraphs, the chunk is
+    re-requested once in numbered form (alignment.py). `memory` is the TM
+    whose match score routes the call.
+    """
+    prompt = fused_prompt(source_lang, target_lang, gold_prompt, chunk, glossary)
+    extra = {"check": _fused_check(chunk)} if model_name == routing.AUTO_MODEL else {}
+    tm_score = chunk_tm_score(memory, chunk)
+
+    def call(prompt, qa_failures=0):
+        return parse_fused(call_model(api_key, model_name, "fused", prompt, chunk, timeout=timeout, tm_score=tm_score,
+                                      qa_failures=qa_failures, generation_config=FUSED_GENERATION_CONFIG, **extra))
+
+    versions = call(prompt)
+    aligned = {v: alignment.realign(chunk, versions[v]) for v in FUSED_VERSIONS}
+    if None not in aligned.values():
+        return aligned
+    metrics.incr("alignment.rerequests.fused")
+    try:
+        retry = call(alignment.numbered_prompt(prompt, (chunk,), chunk), qa_failures=1)
+    except ValueError:
+        retry = dict.fromkeys(FUSED_VERSIONS, "")
+    aligned = {v: alignment.realign_numbered(chunk, retry[v]) for v in FUSED_VERSIONS}
+    if None in aligned.values():
+        metrics.incr("alignment.unresolved.fused")
+        return versions
+    return aligned
+
+def translate_fused(api_key, model_name, source_lang, target_lang, gold_prompt, source_text, on_chunk=None, glossary=None):
+    """Translated, edited and proofread versions of the whole text, one call per chunk."""
+    chunks = chunk_text(source_text)
+    keys = [_chunk_key(model_name, "fused", source_lang, target_lang, gold_prompt, chunk, glossary) for chunk in chunks]
+    memory = routing_memory(model_name, source_lang, target_lang)
+    results = []
+    for index, chunk in enumerate(chunks):
+        versions = _finished_chunk(keys[index])
+        if versions is None:
+            versions = run_fused_chunk(api_key, model_name, source_lang, target_lang, gold_prompt, chunk, glossary,
+                                       memory=memory)
+            _keep_chunk(keys[index], versions)
+        results.append(versions)
+        if on_chunk:
+            on_chunk(index + 1, len(chunks))
+    _forget_chunks(keys)
+    return {version: "\n".join(r[version] for r in results) for version in FUSED_VERSIONS}
+
+# --- Step Prompts ---
+
+def _translate_template(source_lang, target_lang, references, source_text):
+    return f"""You are a professional {source_lang}-to-{target_lang} translator.
+Translate the following text. Maintain a professional tone and ensure accuracy.
+Preserve paragraph breaks (indicated by newlines).
+{references}
+---
+Source Text to Translate:
+{source_text}
+---
+{target_lang} Translation:"""
+
+def _edit_template(source_lang, target_lang, references, source_text, translation):
+    return f"""You are a professional editor. Review the following translation from {source_lang} to {target_lang}.
+Compare it against the source text for accuracy, terminology, and tone.
+Correct any stylistic or grammatical issues to improve fluency. Preserve paragraph breaks.
+{references}
+---
+Source Text:
+{source_text}
+---
+Initial Translation to Review:
+{translation}
+---
+Provide only the final, improved {target_lang} translation:"""
+
+def proofread_prompt(target_lang, text):
+    return f"""You are a meticulous proofreader. Perform a final check on the following {target_lang} text.
+Correct only objective errors (typos, grammar, punctuation). Preserve paragraph breaks.
+Do NOT change the style or word choice unless it's grammatically incorrect.
+---
+Text to Proofread:
+{text}
+---
+Provide only the final, proofread text:"""
+
+def step_prompt(step, source_lang, target_lang, gold_prompt="", source_text="", translation="", glossary=None):
+    """The prompt of a step-by-step Step 4-6 (see STEPS): the whole gold block and the glossary entries in the source."""
+    references = f"{gold_prompt or ''}{glossary.prompt_block(source_text) if glossary else ''}"
+    if step == "translate":
+        return _translate_template(source_lang, target_lang, references, source_text)
+    if step == "edit":
+        return _edit_template(source_lang, target_lang, references, source_text, translation)
+    if step == "proofread":
+        return proofread_prompt(target_lang, translation)
+    raise ValueError(f"Unknown step '{step}'; use one of {list(STEPS)}.")
+
+# --- Pipelined Stages ---
+
+def _references(gold_prompt, chunk, glossary=None):
+    return f"{gold_cache.excerpt(gold_prompt, chunk)}{glossary.prompt_block(chunk) if glossary else ''}"
+
+def translate_prompt(source_lang, target_lang, gold_prompt, chunk, glossary=None):
+    return _translate_template(source_lang, target_lang, _references(gold_prompt, chunk, glossary), chunk)
+
+def edit_prompt(source_lang, target_lang, gold_prompt, chunk, translation, glossary=None):
+    return _edit_template(source_lang, target_lang, _references(gold_prompt, chunk, glossary), chunk, translation)
+
+def _stages(api_key, model_name, source_lang, target_lang, gold_prompt, glossary=None):
+    """[(version, fn(chunk, versions) -> text)] in pipeline order.
+
+    Each call is routed on the chunk's TM match score and on the local QA
+    issues of the version it revises.
+    """
+    memory = routing_memory(model_name, source_lang, target_lang)
+
+    def translate(chunk, versions):
+        prompt = translate_prompt(source_lang, target_lang, gold_prompt, chunk, glossary)
+        return call_aligned(api_key, model_name, "translate", prompt, chunk, tm_score=chunk_tm_score(memory, chunk))
+
+    def edit(chunk, versions):
+        prompt = edit_prompt(source_lang, target_lang, gold_prompt, chunk, versions["translation"], glossary)
+        return call_aligned(api_key, model_name, "edit", prompt, chunk, reference_text=versions["translation"],
+                            tm_score=chunk_tm_score(memory, chunk),
+                            qa_failures=qa_failure_count(model_name, chunk, versions["translation"], glossary))
+
+    def proofread(chunk, versions):
+        prompt = proofread_prompt(target_lang, versions["edited"])
+        return call_aligned(api_key, model_name, "proofread", prompt, chunk, versions["edited"],
+                            tm_score=chunk_tm_score(memory, chunk),
+                            qa_failures=qa_failure_count(model_name, chunk, versions["edited"], glossary))
+
+    return [("translation", translate), ("edited", edit), ("proofread", proofread)]
+
+_DONE = object()  # end-of-stream marker passed down the stage queues
+
+def iter_pipelined(api_key, model_name, source_lang, target_lang, gold_prompt, source_text, glossary=None):
+    """Yields (index, chunk_count, versions) in chunk order as each chunk clears all three stages."""
+    chunks = chunk_text(source_text)
+    keys = [_chunk_key(model_name, "pipelined", source_lang, target_lang, gold_prompt, chunk, glossary) for chunk in chunks]
+    stages = _stages(api_key, model_name, source_lang, target_lang, gold_prompt, glossary)
+    queues = [queue.Queue(maxsize=STAGE_QUEUE_SIZE) for _ in stages]
+    finished = queue.Queue()
+    failed = threading.Event()
+    remaining = [STAGE_WORKERS] * len(stages)
+    remaining_lock = threading.Lock()
+
+    def worker(stage_index):
+        version, fn = stages[stage_index]
+        inbox = queues[stage_index]
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            index, versions = item
+            if failed.is_set():
+                continue  # drain without calling the model once any chunk has failed
+            try:
+                versions[version] = fn(chunks[index], versions)
+            except Exception as e:
+                failed.set()
+                finished.put((index, e))
+                continue
+            _keep_chunk(keys[index], dict(versions))
+            if stage_index + 1 < len(stages):
+                queues[stage_index + 1].put((index, versions))  # blocks while the next stage is busy
+            else:
+                finished.put((index, versions))
+        with remaining_lock:
+            remaining[stage_index] -= 1
+            last = remaining[stage_index] == 0
+        if last:
+            if stage_index + 1 < len(stages):
+                for _ in range(STAGE_WORKERS):
+                    queues[stage_index + 1].put(_DONE)
+            else:
+                finished.put(_DONE)
+
+    def feed():
+        for index in range(len(chunks)):
+            # An earlier, unfinished run may have taken this chunk through some stages already
+            versions = dict(_finished_chunk(keys[index]) or {})
+            if len(versions) == len(stages):
+                finished.put((index, versions))
+            else:
+                queues[len(versions)].put((index, versions))
+        for _ in range(STAGE_WORKERS):
+            queues[0].put(_DONE)
+
+    for stage_index in range(len(stages)):
+        for _ in range(STAGE_WORKERS):
+            threading.Thread(target=scheduler.propagate(worker), args=(stage_index,), name="pipeline-stage", daemon=True).start()
+    threading.Thread(target=feed, name="pipeline-feed", daemon=True).start()
+
+    # Reorder: hold chunks that finish early until every chunk before them is done
+    pending, next_index = {}, 0
+    try:
+        while True:
+            item = finished.get()
+            if item is _DONE:
+                break
+            index, result = item
+            if isinstance(result, Exception):
+                raise result
+            pending[index] = result
+            while next_index in pending:
+                yield next_index, len(chunks), pending.pop(next_index)
+                next_index += 1
+        _forget_chunks(keys)
+    finally:
+        failed.set()  # on error or early exit, stop the remaining chunks from calling the model
+
+def translate_pipelined(api_key, model_name, source_lang, target_lang, gold_prompt, source_text, on_chunk=None, glossary=None):
+    """All three versions of the whole text via the pipelined stages; on_chunk(done, total) reports progress."""
+    results = []
+    for index, total, versions in iter_pipelined(api_key, model_name, source_lang, target_lang, gold_prompt, source_text, glossary):
+        results.append(versions)
+        if on_chunk:
+            on_chunk(index + 1, total)
+    return {version: "\n".join(r[version] for r in results) for version in FUSED_VERSIONS}
+
+def run_mode(mode, api_key, model_name, source_lang, target_lang, gold_prompt, source_text, on_chunk=None, glossary=None, plan=None):
+    """Runs Steps 4-6 in one of PIPELINE_MODES; `glossary` adds each chunk's matching terms to its prompts.
+
+    Repeated segments are sent once and expanded back into every occurrence
+    (dedupe.py; pass `plan` to reuse one); returns (versions, dedupe plan).
+    """
+    run = translate_fused if mode == PIPELINE_MODES[1] else translate_pipelined
+    return dedupe.run(
+        source_text,
+        lambda text: run(api_key, model_name, source_lang, target_lang, gold_prompt, text, on_chunk, glossary),
+        plan,
+    )
+
+# --- Multi-target Fan-out ---
+
+def run_targets(mode, api_key, model_name, source_lang, target_langs, gold_prompt, source_text, on_chunk=None, glossaries=None):
+    """Steps 4-6 from one source into several target languages concurrently.
+
+    The dedupe plan is made once and shared; each language runs its own
+    pipeline, and all of them draw on the same call slots, so the total load
+    on the API stays bounded. `glossaries` maps a target language to its
+    Glossary. on_chunk(done, total) reports chunks across all languages and
+    is called from the calling thread.
+
+    Returns ({target_lang: versions}, {target_lang: exception}, dedupe plan);
+    the plan is marked "fallback" if any language fell back to the full text.
+    """
+    plan = dedupe.dedupe(source_text)
+    glossaries = glossaries or {}
+    events = queue.Queue()
+    progress = {}
+    results, errors, fallback = {}, {}, False
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(target_langs)), thread_name_prefix="fanout") as pool:
+        futures = {
+            pool.submit(
+                scheduler.propagate(run_mode),
+                mode, api_key, model_name, source_lang, target_lang, gold_prompt, source_text,
+                lambda done, total, target_lang=target_lang: events.put((target_lang, done, total)),
+                glossaries.get(target_lang), plan,
+            ): target_lang
+            for target_lang in target_langs
+        }
+        pending = set(futures)
+        while pending:
+            finished, pending = concurrent.futures.wait(pending, timeout=0.2, return_when=concurrent.futures.FIRST_COMPLETED)
+            while not events.empty():
+                target_lang, done, total = events.get_nowait()
+                progress[target_lang] = (done, total)
+            if on_chunk and progress:
+                on_chunk(sum(d for d, _ in progress.values()), sum(t for _, t in progress.values()))
+            for future in finished:
+                target_lang = futures[future]
+                try:
+                    results[target_lang], run_plan = future.result()
+                    fallback = fallback or run_plan.get("fallback", False)
+                except Exception as e:
+                    errors[target_lang] = e
+    return results, errors, dict(plan, fallback=True) if fallback else plan
@@ -0,0 +1,178 @@
+import collections
+import re
+import time
+
+from glossary import Glossary
+
+# ====================================================
+#              🔎 LOCAL RULE-BASED QA ENGINE
+# ====================================================
+# Fast, deterministic checks on each source/target segment pair (one segment
+# per paragraph line). Step 6 only sends the segments flagged here to the LLM
+# proofreader, and Step 8 shows the report. Everything is precompiled regexes
+# and set arithmetic: thousands of segments take milliseconds.
+
+MIN_LENGTH_RATIO = 0.5  # target/source length outside this range is an outlier
+MAX_LENGTH_RATIO = 2.0
+MIN_RATIO_CHARS = 20  # shorter segments vary too much for the ratio check
+MIN_UNTRANSLATED_WORDS = 3  # identical source/target shorter than this is fine (names, codes)
+
+CHECK_LABELS = {
+    "alignment": "Segment alignment",
+    "empty": "Empty target",
+    "numbers": "Number mismatch",
+    "brackets": "Unbalanced brackets/quotes",
+    "end_punctuation": "End punctuation mismatch",
+    "double_space": "Doubled spaces",
+    "double_word": "Doubled words",
+    "untranslated": "Untranslated segment",
+    "length_ratio": "Length ratio outlier",
+    "glossary": "Glossary violation",
+}
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,\s]\d{3})*(?:[.,]\d+)?")
+_NON_DIGIT_RE = re.compile(r"\D")
+_DOUBLE_SPACE_RE = re.compile(r"\S  +\S")
+_DOUBLE_WORD_RE = re.compile(r"\b(\w+)\s+\1\b", re.IGNORECASE)
+_LETTER_RE = re.compile(r"[^\W\d_]")
+_BRACKET_PAIRS = (("(", ")"), ("[", "]"), ("{", "}"), ("“", "”"), ("«", "»"))
+_END_PUNCTUATION = ".!?:;…"
+
+# --- Segments ---
+
+def segment_pairs(source_text, target_text):
+    """[(target_line_index, source_segment, target_segment)] plus alignment issues.
+
+    Lines pair up by position when both texts have the same number of lines,
+    otherwise non-empty lines pair up in order.
+    """
+    source_lines = (source_text or "").split("\n")
+    target_lines = (target_text or "").split("\n")
+    if len(source_lines) == len(target_lines):
+        pairs = [(i, s, t) for i, (s, t) in enumerate(zip(source_lines, target_lines)) if s.strip() or t.strip()]
+        return pairs, []
+
+    source_segments = [s for s in source_lines if s.strip()]
+    target_segments = [(i, t) for i, t in enumerate(target_lines) if t.strip()]
+    pairs = [(i, s, t) for s, (i, t) in zip(source_segments, target_segments)]
+    issues = []
+    if len(source_segments) != len(target_segments):
+        issues.append(_issue(None, "alignment", f"{len(source_segments)} source paragraphs vs {len(target_segments)} target paragraphs"))
+    return pairs, issues
+
+def _issue(segment, check, message):
+    return {"segment": segment, "check": check, "message": message}
+
+# --- Checks ---
+
+def _numbers(text):
+    """Digits of each number, separators dropped (1,000.50 and 1.000,50 compare equal)."""
+    return sorted(_NON_DIGIT_RE.sub("", n) for n in _NUMBER_RE.findall(text))
+
+def check_segment(index, source, target, glossary=None):
+    """Issues for one source/target pair. `glossary` is a compiled Glossary (or None)."""
+    if not target.strip():
+        return [_issue(index, "empty", "Target segment is empty")] if source.strip() else []
+    issues = []
+
+    source_numbers, target_numbers = _numbers(source), _numbers(target)
+    if source_numbers != target_numbers:
+        source_numbers, target_numbers = collections.Counter(source_numbers), collections.Counter(target_numbers)
+        missing = sorted((source_numbers - target_numbers).elements())
+        extra = sorted((target_numbers - source_numbers).elements())
+        detail = "; ".join(filter(None, [missing and f"missing {', '.join(missing)}", extra and f"extra {', '.join(extra)}"]))
+        issues.append(_issue(index, "numbers", detail))
+
+    for opening, closing in _BRACKET_PAIRS:
+        target_balance = target.count(opening) - target.count(closing)
+        if target_balance and target_balance != source.count(opening) - source.count(closing):
+            issues.append(_issue(index, "brackets", f"Unbalanced {opening}{closing}"))
+    if target.count('"') % 2 and not source.count('"') % 2:
+        issues.append(_issue(index, "brackets", 'Unbalanced "'))
+
+    source_end, target_end = source.rstrip()[-1:], target.rstrip()[-1:]
+    if (source_end in _END_PUNCTUATION) != (target_end in _END_PUNCTUATION) or (
+        source_end in "?!" and target_end != source_end
+    ):
+        issues.append(_issue(index, "end_punctuation", f"Source ends with '{source_end}', target with '{target_end}'"))
+
+    if _DOUBLE_SPACE_RE.search(target) and not _DOUBLE_SPACE_RE.search(source):
+        issues.append(_issue(index, "double_space", "Doubled spaces"))
+
+    for match in _DOUBLE_WORD_RE.finditer(target):
+        if not match.group(1).isdigit() and match.group(0).lower() not in source.lower():
+            issues.append(_issue(index, "double_word", f"Doubled word '{match.group(0)}'"))
+            break
+
+    if (source.strip() == target.strip() and _LETTER_RE.search(source)
+            and len(source.split()) >= MIN_UNTRANSLATED_WORDS):
+        issues.append(_issue(index, "untranslated", "Target is identical to the source"))
+
+    if len(source) >= MIN_RATIO_CHARS:
+        ratio = len(target) / len(source)
+        if not MIN_LENGTH_RATIO <= ratio <= MAX_LENGTH_RATIO:
+            issues.append(_issue(index, "length_ratio", f"Target/source length ratio {ratio:.2f}"))
+
+    if glossary:
+        for source_term, target_term in glossary.violations(source, target):
+            issues.append(_issue(index, "glossary", f"'{source_term}' should be translated as '{target_term}'"))
+    return issues
+
+def check_document(source_text, target_text, glossary=None):
+    """Runs every check on every segment pair; returns a report dict.
+
+    `glossary` is a Glossary or a plain {source_term: target_term} dict.
+    """
+    start = time.perf_counter()
+    if isinstance(glossary, dict):
+        glossary = Glossary(glossary.items())
+    pairs, issues = segment_pairs(source_text, target_text)
+    for index, source, target in pairs:
+        issues.extend(check_segment(index, source, target, glossary))
+    flagged = sorted({issue["segment"] for issue in issues if issue["segment"] is not None})
+    return {
+        "segments": len(pairs),
+        "flagged": flagged,
+        "issues": issues,
+        "counts": dict(collections.Counter(issue["check"] for issue in issues)),
+        "seconds": time.perf_counter() - start,
+    }
+
+# --- Flagged Segments ---
+
+def extract_segments(text, indices):
+    """The lines at `indices`, joined with newlines (what Step 6 sends to the proofreader)."""
+    lines = text.split("\n")
+    return "\n".join(lines[i] for i in indices)
+
+def merge_segments(text, indices, replacement_text):
+    """Puts proofread lines back at `indices`; None if the line count does not match."""
+    replacements = replacement_text.strip("\n").split("\n")
+    if len(replacements) != len(indices):
+        return None
+    lines = text.split("\n")
+    for i, line in zip(indices, replacements):
+        lines[i] = line
+    return "\n".join(lines)
+
+# --- Report ---
+
+def format_report(report, max_issues=50):
+    """Markdown summary of a check_document() report for Step 8."""
+    if not report["issues"]:
+        return f"✔️ **No issues found** in {report['segments']} segments ({report['seconds'] * 1000:.1f} ms)."
+    lines = [
+        f"⚠️ **{len(report['issues'])} issue(s)** in {len(report['flagged'])} of {report['segments']} segments "
+        f"({report['seconds'] * 1000:.1f} ms).",
+        "",
+        "| Check | Count |",
+        "|---|---|",
+    ]
+    lines += [f"| {CHECK_LABELS.get(check, check)} | {count} |" for check, count in sorted(report["counts"].items())]
+    lines += ["", "| Paragraph | Check | Details |", "|---|---|---|"]
+    for issue in report["issues"][:max_issues]:
+        segment = "—" if issue["segment"] is None else issue["segment"] + 1
+        lines.append(f"| {segment} | {CHECK_LABELS.get(issue['check'], issue['check'])} | {issue['message'].replace('|', '/')} |")
+    if len(report["issues"]) > max_issues:
+        lines.append(f"\n…and {len(report['issues']) - max_issues} more.")
+    return "\n".join(lines)
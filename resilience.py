@@ -0,0 +1,254 @@
+import concurrent.futures
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+import gemini_client
+import metrics
+import scheduler
+
+# ====================================================
+#      🛡️ RETRIES, HEDGED REQUESTS & CIRCUIT BREAKERS
+# ====================================================
+# A single transient 429/503 used to fail a whole step, and a few stuck calls
+# dominated p99 step latency. Every Gemini call now goes through call():
+#   * retryable errors (429, 5xx, deadline) are retried with full-jitter
+#     exponential backoff, waiting at least as long as the server's retry hint;
+#   * once a call runs past the model's observed latency percentile, a hedged
+#     duplicate is sent and whichever finishes first wins; the other request
+#     is cancelled on the wire. Both are gRPC futures waited on from the
+#     caller's thread, so hedging takes no threads of its own;
+#   * a per-model circuit breaker fails fast while a model keeps failing.
+# Once the calling job is cancelled (scheduler.py), its requests in flight are
+# cancelled on the wire and no retry or hedge is sent.
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("GEMINI_RETRY_ATTEMPTS", 4))
+RETRY_BASE_DELAY_S = float(os.getenv("GEMINI_RETRY_BASE_DELAY", 1.0))
+RETRY_MAX_DELAY_S = float(os.getenv("GEMINI_RETRY_MAX_DELAY", 30.0))
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", 95))  # 0 disables hedging
+HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", 20))  # latency history needed first
+HEDGE_MIN_DELAY_S = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", 2.0))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("GEMINI_BREAKER_FAILURES", 5))  # consecutive failures
+BREAKER_RESET_S = float(os.getenv("GEMINI_BREAKER_RESET", 30.0))  # open -> half-open after this
+
+_RETRY_HINT_PATTERNS = (
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"retry in\s+([\d.]+)\s*s", re.IGNORECASE),
+)
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+# --- Error Classification ---
+
+def is_retryable(exc):
+    """True for rate limits, server errors and timeouts; False for bad requests, bad keys, etc."""
+    if isinstance(exc, (TimeoutError, ConnectionError, concurrent.futures.TimeoutError)):
+        return True
+    code = getattr(exc, "code", None)  # google.api_core exceptions carry the HTTP status
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+def retry_hint(exc):
+    """Server-suggested wait in seconds (RetryInfo detail or message text), or None."""
+    for detail in getattr(exc, "details", None) or ():
+        delay = getattr(detail, "retry_delay", None)
+        if delay is None:
+            continue
+        if hasattr(delay, "total_seconds"):
+            return delay.total_seconds()
+        return getattr(delay, "seconds", 0) + getattr(delay, "nanos", 0) / 1e9
+    message = str(exc)
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+def backoff_delay(attempt, hint=None):
+    """Full-jitter exponential backoff for retry number `attempt` (0-based), never below `hint`."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 2 ** attempt))
+    if hint is not None:
+        # Honor the server's hint, plus a little jitter so waiting clients don't return in lockstep
+        delay = hint + random.uniform(0, RETRY_BASE_DELAY_S)
+    return delay
+
+# --- Circuit Breaker ---
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open (one probe) after a cool-down."""
+
+    def __init__(self, name, failure_threshold=None, reset_after_s=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or BREAKER_FAILURE_THRESHOLD
+        self.reset_after_s = BREAKER_RESET_S if reset_after_s is None else reset_after_s
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not be attempted right now."""
+        with self._lock:
+            if self._state == "closed":
+                return
+            remaining = self._opened_at + self.reset_after_s - time.monotonic()
+            if self._state == "open" and remaining <= 0:
+                self._state = "half-open"
+            if self._state == "half-open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+        metrics.incr("resilience.breaker_rejections")
+        raise CircuitOpenError(
+            f"Model '{self.name}' is failing repeatedly; calls are paused "
+            f"for about {max(1, round(remaining))}s. Please retry shortly."
+        )
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Ends a call that says nothing about the model's health (cancelled, or a bad request); state is unchanged."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == "half-open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    metrics.incr("resilience.breaker_opened")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def state(self):
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(model_name):
+    with _breakers_lock:
+        breaker = _breakers.get(model_name)
+        if breaker is None:
+            breaker = _breakers[model_name] = CircuitBreaker(model_name)
+        return breaker
+
+def breaker_states():
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.state() for name, breaker in sorted(breakers.items())}
+
+metrics.register_provider("circuit_breakers", breaker_states)
+
+# --- Hedged Attempts ---
+
+def hedge_delay(model_name):
+    """Seconds to wait before hedging a call to `model_name`, or None (hedging off / no history)."""
+    if HEDGE_PERCENTILE <= 0:
+        return None
+    threshold = metrics.percentile(f"gemini.latency.{model_name}", HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    if threshold is None:
+        return None
+    return max(HEDGE_MIN_DELAY_S, threshold)
+
+def _attempt(start, model_name, hedge):
+    """One attempt: start() sends the request; a hedge is sent if it is slow. Returns the first response.
+
+    Raises scheduler.Cancelled as soon as the current job is cancelled; every
+    request still running is cancelled before this returns or raises.
+    """
+    delay = hedge_delay(model_name) if hedge else None
+    token = scheduler.current_job().cancel
+    finished = queue.SimpleQueue()  # calls, as they finish; None once the job is cancelled
+
+    def wake():
+        finished.put(None)
+
+    calls = [start()]
+    calls[0].add_done_callback(finished.put)
+    if token is not None:
+        token.on_cancel(wake)
+    outstanding, first_error = 1, None
+    try:
+        while outstanding:
+            try:
+                call = finished.get(timeout=delay if len(calls) == 1 else None)
+            except queue.Empty:
+                # Slower than the percentile: send a duplicate
+                scheduler.check_cancelled()
+                metrics.incr("resilience.hedges_sent")
+                calls.append(start())
+                calls[-1].add_done_callback(finished.put)
+                outstanding += 1
+                continue
+            if call is None:
+                raise scheduler.Cancelled()
+            outstanding -= 1
+            try:
+                response = call.result()
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            if call is not calls[0]:
+                metrics.incr("resilience.hedges_won")
+            return response
+        raise first_error
+    finally:
+        if token is not None:
+            token.remove(wake)
+        for call in calls:
+            if not call.done():
+                call.cancel()  # the loser, or all of them if we are leaving on an error or a cancel
+
+# --- Public API ---
+
+def call(model_name, start, hedge=True, max_attempts=None):
+    """Runs one Gemini request with breaker, hedging and jittered retries.
+
+    start() sends the request and returns its gemini_client.PendingCall; it
+    is called again for each retry and hedge.
+    """
+    breaker = get_breaker(model_name)
+    max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+    for attempt in range(max_attempts):
+        scheduler.check_cancelled()
+        breaker.before_call()
+        try:
+            result = _attempt(start, model_name, hedge)
+        except (scheduler.Cancelled, concurrent.futures.CancelledError):
+            breaker.release()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                # The model answered (e.g. bad key or request): neither a health failure nor a success
+                breaker.release()
+                raise
+            breaker.record_failure()
+            metrics.incr("resilience.retryable_errors")
+            if attempt == max_attempts - 1:
+                raise
+            metrics.incr("resilience.retries")
+            scheduler.sleep(backoff_delay(attempt, retry_hint(e)))
+        else:
+            breaker.record_success()
+            return result
+
+def generate(api_key, model_name, prompt, timeout=gemini_client.DEFAULT_TIMEOUT_S, hedge=True, **kwargs):
+    """Resilient gemini_client.generate()."""
+    return call(
+        model_name,
+        lambda: gemini_client.start(api_key, model_name, prompt, timeout=timeout, **kwargs),
+        hedge=hedge,
+    )
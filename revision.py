@@ -0,0 +1,92 @@
+import difflib
+import re
+
+import metrics
+import qa
+
+# ====================================================
+#        🔁 INCREMENTAL RE-TRANSLATION OF REVISIONS
+# ====================================================
+# When a client sends a revised source, the new text is diffed against a
+# delivered project (tm.save_project) paragraph by paragraph. Unchanged
+# paragraphs keep their approved translations; only inserted or modified
+# paragraphs go through Steps 4-6, and the results are merged back in
+# document order. difflib matches hashed paragraph keys, so even long
+# documents diff in milliseconds.
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def _key(segment):
+    return _WHITESPACE_RE.sub(" ", segment).strip()
+
+def plan_revision(old_source, old_final, new_source, name=None):
+    """Revision plan dict, or None if the old project's paragraphs do not line up.
+
+    `lines` are the new source lines; `reused` maps a line index to its
+    approved translation, and `changed` lists the line indices to translate.
+    """
+    pairs, issues = qa.segment_pairs(old_source, old_final)
+    if issues:
+        return None
+    old_keys = [_key(source) for _, source, _ in pairs]
+    old_targets = [target for _, _, target in pairs]
+
+    lines = (new_source or "").split("\n")
+    new_indices = [i for i, line in enumerate(lines) if line.strip()]
+    new_keys = [_key(lines[i]) for i in new_indices]
+
+    reused = {}
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(new_end - new_start):
+                reused[new_indices[new_start + offset]] = old_targets[old_start + offset]
+    changed = [i for i in new_indices if i not in reused]
+    return {"name": name, "lines": lines, "reused": reused, "changed": changed}
+
+def changed_text(plan):
+    """The inserted/modified paragraphs, one per line (what goes through Steps 4-6)."""
+    return "\n".join(plan["lines"][i] for i in plan["changed"])
+
+def merge(plan, translated_text):
+    """Full target text: approved translations plus the new ones; None if the lines do not line up."""
+    translated = [line for line in (translated_text or "").split("\n") if line.strip()]
+    if len(translated) != len(plan["changed"]):
+        return None
+    new = dict(zip(plan["changed"], translated))
+    reused = plan["reused"]
+    return "\n".join(reused[i] if i in reused else new.get(i, "") for i in range(len(plan["lines"])))
+
+def run(plan, source_text, translate_fn, versions=None):
+    """translate_fn applied to the changed paragraphs only, merged with the reused ones.
+
+    translate_fn(text) returns a translation, or None on failure; with
+    `versions` (names such as pipeline.FUSED_VERSIONS) it returns a dict of
+    translations instead. If a result does not line up, translate_fn gets the
+    full source.
+    """
+    if not plan["changed"]:
+        merged = merge(plan, "")
+        return {name: merged for name in versions} if versions else merged
+    result = translate_fn(changed_text(plan))
+    if result is None:
+        return None
+    if versions:
+        merged = {name: merge(plan, result[name]) for name in versions}
+        ok = all(version is not None for version in merged.values())
+    else:
+        merged = merge(plan, result)
+        ok = merged is not None
+    if not ok:
+        metrics.incr("revision.fallbacks")
+        return translate_fn(source_text)
+    metrics.incr("revision.segments_reused", len(plan["reused"]))
+    return merged
+
+def format_plan(plan):
+    """One-line summary of a revision plan for Step 2."""
+    total = len(plan["reused"]) + len(plan["changed"])
+    return (
+        f"🔁 Revision of '{plan['name']}': {len(plan['reused'])} of {total} paragraphs unchanged "
+        f"(approved translations reused); {len(plan['changed'])} new or modified paragraphs go through Steps 4-6."
+    )
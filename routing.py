@@ -0,0 +1,193 @@
+import atexit
+import functools
+import os
+import threading
+import time
+import uuid
+
+import access_log
+import metrics
+import resilience
+import scheduler
+
+# ====================================================
+#         🧭 COST- AND LATENCY-AWARE MODEL ROUTING
+# ====================================================
+# Most segments are simple text that the cheapest, fastest model handles well.
+# choose_model() starts every (step, segment) on the lowest tier its signals
+# allow (segment length, TM fuzzy score, earlier QA failures); generate()
+# escalates one tier at a time only when the output fails the local checks.
+# Every decision and outcome is logged for threshold tuning, through the
+# buffered, rotating segment writer of the access log (access_log.py): calls
+# never wait on disk, ROUTING_LOG_SEGMENTS caps what is kept, and summarize()
+# only reads the segments of the last ROUTING_SUMMARY_DAYS.
+
+AUTO_MODEL = "auto"
+MODEL_TIERS = tuple(
+    m.strip() for m in os.getenv(
+        "GEMINI_MODEL_TIERS", "gemini-2.5-flash-lite,gemini-2.5-flash,gemini-2.5-pro"
+    ).split(",") if m.strip()
+)
+STEP_BASE_TIER = {"translate": 0, "edit": 0, "proofread": 0, "fused": 0}
+
+LONG_SEGMENT_CHARS = int(os.getenv("ROUTING_LONG_SEGMENT_CHARS", 6000))  # +1 tier above this
+TM_HIGH_SCORE = float(os.getenv("ROUTING_TM_HIGH_SCORE", 95))  # near-exact TM match: cheapest tier
+MIN_LENGTH_RATIO = 0.5  # output/source length outside this range counts as a QA failure
+MAX_LENGTH_RATIO = 2.0
+ROUTING_LOG_DIR = os.getenv("ROUTING_LOG_DIR", os.path.join("logs", "routing"))
+ROUTING_LOG_SEGMENTS = int(os.getenv("ROUTING_LOG_SEGMENTS", 20))  # segments kept, each up to the access log's size
+ROUTING_SUMMARY_DAYS = float(os.getenv("ROUTING_SUMMARY_DAYS", 7))
+
+_logger = None
+_logger_lock = threading.Lock()
+
+class RouteDecision:
+    """Which model a step/segment was sent to, and why."""
+
+    __slots__ = ("id", "step", "tier", "model", "reasons", "signals")
+
+    def __init__(self, step, tier, reasons, signals):
+        self.id = uuid.uuid4().hex[:12]
+        self.step = step
+        self.tier = tier
+        self.model = MODEL_TIERS[tier]
+        self.reasons = reasons
+        self.signals = signals
+
+    def as_dict(self):
+        return {"id": self.id, "step": self.step, "tier": self.tier, "model": self.model,
+                "reasons": self.reasons, "signals": self.signals}
+
+# --- Decisions ---
+
+def choose_model(step, segment_text, tm_score=None, qa_failures=0, escalation=0):
+    """Picks the lowest model tier the signals allow for one step of one segment."""
+    chars = len(segment_text or "")
+    tier = STEP_BASE_TIER.get(step, 0)
+    reasons = [f"base tier for {step}"]
+    if tm_score is not None and tm_score >= TM_HIGH_SCORE:
+        tier = 0
+        reasons = [f"TM match {tm_score:.0f}%"]
+    elif chars > LONG_SEGMENT_CHARS:
+        tier += 1
+        reasons.append(f"long segment ({chars} chars)")
+    if qa_failures:
+        tier += 1
+        reasons.append(f"{qa_failures} earlier QA failure(s)")
+    if escalation:
+        tier += escalation
+        reasons.append(f"escalation {escalation}")
+    tier = min(tier, len(MODEL_TIERS) - 1)
+    signals = {"chars": chars, "tm_score": tm_score, "qa_failures": qa_failures, "escalation": escalation}
+    return RouteDecision(step, tier, reasons, signals)
+
+def local_qa_failures(reference_text, output_text):
+    """Cheap, local checks of a model output against the text it was produced from."""
+    if not output_text or not output_text.strip():
+        return ["empty output"]
+    failures = []
+    reference_text = reference_text or ""
+    ref_paragraphs = sum(1 for p in reference_text.split("\n") if p.strip())
+    out_paragraphs = sum(1 for p in output_text.split("\n") if p.strip())
+    if ref_paragraphs >= 3 and abs(ref_paragraphs - out_paragraphs) > max(1, ref_paragraphs // 10):
+        failures.append(f"paragraph count {out_paragraphs} vs {ref_paragraphs}")
+    if len(reference_text) >= 200:
+        ratio = len(output_text) / len(reference_text)
+        if not MIN_LENGTH_RATIO <= ratio <= MAX_LENGTH_RATIO:
+            failures.append(f"length ratio {ratio:.2f}")
+    return failures
+
+# --- Decision Log ---
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                _logger = access_log.AccessLogger(ROUTING_LOG_DIR, name_prefix="routing", max_segments=ROUTING_LOG_SEGMENTS)
+                atexit.register(_logger.close)
+    return _logger
+
+def _log(record):
+    # "username" and "kind" are what the segment index counts
+    base = access_log.make_record(scheduler.current_job().user, record["event"])
+    _get_logger().log_record({"t": base["t"], "timestamp": base["timestamp"], "username": base["username"],
+                              "kind": record["event"], **record})
+
+def log_decision(decision):
+    metrics.incr(f"routing.{decision.step}.{decision.model}")
+    _log({"event": "decision", **decision.as_dict()})
+
+def log_outcome(decision, ok, latency_s, qa_failures=(), error=None):
+    if qa_failures:
+        metrics.incr(f"routing.{decision.step}.qa_failures")
+    _log({"event": "outcome", "id": decision.id, "step": decision.step, "model": decision.model,
+          "ok": ok, "latency_s": round(latency_s, 3), "qa_failures": list(qa_failures), "error": error})
+
+def summarize(days=None, log_dir=None):
+    """Per (step, model) over the last `days`: calls, QA failure rate and mean latency, for tuning the thresholds."""
+    log_dir = log_dir or ROUTING_LOG_DIR
+    since = time.time() - 86400 * (ROUTING_SUMMARY_DAYS if days is None else days)
+    stats = {}
+    for meta in access_log.list_segments(log_dir):
+        if meta["end"] < since or "outcome" not in meta["kinds"]:
+            continue  # skipped on its index alone
+        for record in access_log.read_segment(meta, log_dir):
+            if record.get("event") != "outcome" or record["t"] < since:
+                continue
+            entry = stats.setdefault(f"{record['step']}/{record['model']}",
+                                     {"calls": 0, "qa_failed": 0, "errors": 0, "latency_s": 0.0})
+            entry["calls"] += 1
+            entry["qa_failed"] += bool(record.get("qa_failures"))
+            entry["errors"] += bool(record.get("error"))
+            entry["latency_s"] += record.get("latency_s") or 0.0
+    for entry in stats.values():
+        entry["qa_fail_rate"] = round(entry["qa_failed"] / entry["calls"], 3)
+        entry["mean_latency_s"] = round(entry.pop("latency_s") / entry["calls"], 3)
+    return stats
+
+# --- Routed Generation ---
+
+def generate(api_key, step, prompt, segment_text, reference_text=None, tm_score=None, qa_failures=0, timeout=600,
+             check=None, **kwargs):
+    """Runs one step on the cheapest suitable model, escalating while local QA checks fail.
+
+    `tm_score` (best TM match, 0-100) and `qa_failures` (local QA issues
+    found so far) pick the starting tier. `reference_text` is what the
+    output is checked against (defaults to `segment_text`); `check(text)`
+    replaces the default checks and returns a list of failures. Extra
+    kwargs (e.g. generation_config) go to the model.
+    Returns (text, decision) for the model that produced it.
+    """
+    reference_text = segment_text if reference_text is None else reference_text
+    check = check or functools.partial(local_qa_failures, reference_text)
+    decision = choose_model(step, segment_text, tm_score, qa_failures)
+    while True:
+        log_decision(decision)
+        start = time.perf_counter()
+        try:
+            response = resilience.generate(api_key, decision.model, prompt, timeout=timeout, **kwargs)
+            text = response.text
+        except resilience.CircuitOpenError as e:
+            # Cheap model unavailable right now: try the next tier instead of failing
+            log_outcome(decision, False, time.perf_counter() - start, error=str(e))
+            if decision.tier >= len(MODEL_TIERS) - 1:
+                raise
+            decision = _escalate(decision, f"{decision.model} circuit open")
+            continue
+        except Exception as e:
+            log_outcome(decision, False, time.perf_counter() - start, error=str(e))
+            raise
+
+        qa_failures = check(text)
+        log_outcome(decision, not qa_failures, time.perf_counter() - start, qa_failures)
+        if not qa_failures or decision.tier >= len(MODEL_TIERS) - 1:
+            return text, decision
+        metrics.incr("routing.escalations")
+        decision = _escalate(decision, f"QA failed on {decision.model}: {'; '.join(qa_failures)}")
+
+def _escalate(decision, reason):
+    """Same step and segment, one tier up."""
+    signals = dict(decision.signals, escalation=decision.signals["escalation"] + 1)
+    return RouteDecision(decision.step, min(decision.tier + 1, len(MODEL_TIERS) - 1),
+                         decision.reasons + [reason], signals)
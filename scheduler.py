@@ -0,0 +1,343 @@
+import collections
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+import metrics
+
+# ====================================================
+#      ⚖️ FAIR-SHARE SCHEDULING OF GEMINI CALLS
+# ====================================================
+# All sessions share a fixed number of concurrent model calls. Calls used to be
+# granted first come, first served, so one user's 300-page batch could queue
+# ahead of everyone else's one-page jobs. Every call now waits for a slot here:
+#   * two tiers with strict priority: interactive before batch. Batch calls may
+#     never take the last INTERACTIVE_RESERVE slots, so an interactive call
+#     finds a free slot without waiting for long batch calls to finish;
+#   * within a tier, deficit round robin (DRR) over users: each user's queue
+#     earns QUANTUM_CHARS x its role weight per round and spends the size of
+#     each call, so users get equal shares of throughput (admins twice that)
+#     however many calls they queue;
+#   * no user holds more than USER_MAX_CALLS slots at once.
+# The caller is identified by the job context (job()), which the pipelines
+# carry into their worker threads.
+#
+# The scheduler's state is in memory, so its limits and its fairness hold per
+# process: under N service workers (or N UI replicas) behind a load balancer,
+# a user could hold N x USER_MAX_CALLS calls, and users are only balanced
+# against the jobs that landed in the same process. SCHED_PROCESSES is the
+# number of processes sharing the Gemini quota; the call limits
+# (GEMINI_MAX_CONCURRENT_CALLS, SCHED_USER_MAX_CALLS,
+# SCHED_INTERACTIVE_RESERVE) are then deployment-wide and each process takes
+# its share (per_process(), at least one call). `python service.py` sets it to
+# SERVICE_WORKERS. Thin-client UIs make no model calls of their own
+# (service_client.py), so only the service's processes count.
+#
+# A job can be cancelled (Cancel buttons, Streamlit's Stop, a client closing
+# the service stream): its queued calls leave the queue, and its Gemini
+# requests in flight are cancelled (resilience.py), so their slots are free
+# as soon as the requests have really stopped; no retry or hedge follows.
+
+INTERACTIVE, BATCH = "interactive", "batch"
+TIERS = (INTERACTIVE, BATCH)  # strict priority order
+
+PROCESSES = max(1, int(os.getenv("SCHED_PROCESSES", 1)))  # processes sharing the call limits
+
+def per_process(limit):
+    """This process's share of a deployment-wide call limit."""
+    return max(1, limit // PROCESSES)
+
+ROLE_WEIGHTS = {"admin": 2, "user": 1}
+QUANTUM_CHARS = int(os.getenv("SCHED_QUANTUM_CHARS", 6000))  # about one pipeline chunk
+USER_MAX_CALLS = per_process(int(os.getenv("SCHED_USER_MAX_CALLS", 4)))
+INTERACTIVE_RESERVE = per_process(int(os.getenv("SCHED_INTERACTIVE_RESERVE", 2)))
+BATCH_CHARS = int(os.getenv("SCHED_BATCH_CHARS", 150_000))  # larger jobs (~40+ pages) run as batch
+ANONYMOUS = "anonymous"
+
+Job = collections.namedtuple("Job", "user role tier cancel")
+_DEFAULT_JOB = Job(ANONYMOUS, "user", INTERACTIVE, None)
+_job = contextvars.ContextVar("scheduler_job", default=_DEFAULT_JOB)
+
+_running_jobs = collections.defaultdict(set)  # cancel key -> CancelTokens of its running jobs
+_running_jobs_lock = threading.Lock()
+
+class Cancelled(Exception):
+    """Raised in a job's threads once the job is cancelled."""
+
+    def __init__(self, message="The translation was cancelled."):
+        super().__init__(message)
+
+# --- Cancellation ---
+
+class CancelToken:
+    """Cancels one job; callbacks registered with on_cancel() run once, on cancel()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks = []
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def on_cancel(self, callback):
+        """Runs callback() on cancel, or right away if already cancelled."""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+def cancel(key):
+    """Cancels every running job started with this cancel key; returns how many there were."""
+    with _running_jobs_lock:
+        tokens = list(_running_jobs.get(key, ()))
+    for token in tokens:
+        token.cancel()
+    return len(tokens)
+
+def check_cancelled():
+    token = current_job().cancel
+    if token is not None and token.cancelled():
+        raise Cancelled()
+
+def sleep(seconds):
+    """time.sleep() that ends early, raising Cancelled, when the current job is cancelled."""
+    token = current_job().cancel
+    if token is None:
+        time.sleep(seconds)
+        return
+    woken = threading.Event()
+    token.on_cancel(woken.set)
+    try:
+        woken.wait(seconds)
+    finally:
+        token.remove(woken.set)
+    check_cancelled()
+
+def run_cancellable(fn):
+    """fn(), whose result the caller stops waiting for as soon as the current job is cancelled.
+
+    Cancellable jobs run fn in a helper thread (with the same job context);
+    after a cancel it finishes in the background and its result is dropped.
+    Only for work that holds no call slot (e.g. reading a service stream):
+    model calls are cancelled on the wire instead.
+    """
+    token = current_job().cancel
+    if token is None:
+        return fn()
+    check_cancelled()
+    done = threading.Event()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=propagate(run), name="cancellable-call", daemon=True).start()
+    token.on_cancel(done.set)
+    try:
+        done.wait()
+    finally:
+        token.remove(done.set)
+    if "error" in outcome:
+        raise outcome["error"]
+    if "result" not in outcome:
+        metrics.incr("scheduler.calls_abandoned")
+        raise Cancelled()
+    return outcome["result"]
+
+# --- Job Context ---
+
+def tier_for(size):
+    """Tier for a job over `size` source characters."""
+    return BATCH if size > BATCH_CHARS else INTERACTIVE
+
+@contextlib.contextmanager
+def job(user, role=None, tier=None, size=0, cancel_key=None, cancel_token=None):
+    """Runs the block's model calls as `user`; tier defaults to one chosen by job size.
+
+    With a cancel_key (e.g. the browser session), cancel(cancel_key) stops the
+    job; a cancel_token can be passed in instead, to be cancelled directly.
+    Yields the job's CancelToken (None if it is not cancellable).
+    """
+    if cancel_key is not None and cancel_token is None:
+        cancel_token = CancelToken()
+    if cancel_key is not None:
+        with _running_jobs_lock:
+            _running_jobs[cancel_key].add(cancel_token)
+    context_token = _job.set(Job(user or ANONYMOUS, role or "user", tier or tier_for(size), cancel_token))
+    try:
+        yield cancel_token
+    finally:
+        _job.reset(context_token)
+        if cancel_key is not None:
+            with _running_jobs_lock:
+                _running_jobs[cancel_key].discard(cancel_token)
+                if not _running_jobs[cancel_key]:
+                    del _running_jobs[cancel_key]
+
+def current_job():
+    return _job.get()
+
+def propagate(fn):
+    """fn bound to a copy of the caller's job context; make one per thread it is handed to."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return run
+
+# --- Scheduler ---
+
+class _Waiter:
+    __slots__ = ("cost", "granted", "woken", "enqueued")
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.granted = False
+        self.woken = threading.Event()  # set on grant or on cancel
+        self.enqueued = time.perf_counter()
+
+class _Flow:
+    """One user's queue of waiting calls within a tier."""
+    __slots__ = ("user", "weight", "deficit", "waiters")
+
+    def __init__(self, user, weight):
+        self.user = user
+        self.weight = weight
+        self.deficit = 0
+        self.waiters = collections.deque()
+
+class FairScheduler:
+    """A counting semaphore over `slots` that grants waiting calls in fair-share order."""
+
+    def __init__(self, slots, user_max_calls=None, interactive_reserve=None, quantum=None):
+        self.slots = slots
+        self.user_max_calls = max(1, user_max_calls or USER_MAX_CALLS)
+        reserve = INTERACTIVE_RESERVE if interactive_reserve is None else interactive_reserve
+        self.batch_slots = max(1, slots - reserve)
+        self.quantum = quantum or QUANTUM_CHARS
+        self._lock = threading.Lock()
+        self._running = collections.Counter()  # tier -> calls in flight
+        self._user_running = collections.Counter()  # user -> calls in flight
+        self._flows = {tier: {} for tier in TIERS}  # tier -> {user: _Flow}
+        self._active = {tier: collections.deque() for tier in TIERS}  # flows with waiters, round robin
+
+    @contextlib.contextmanager
+    def slot(self, cost=0):
+        """Holds one call slot for the block, waiting for a fair turn; `cost` is the call's size in chars.
+
+        Raises Cancelled if the job is cancelled while waiting.
+        """
+        check_cancelled()
+        current = current_job()
+        waiter = _Waiter(min(max(1, cost), self.quantum))
+        with self._lock:
+            flows = self._flows[current.tier]
+            flow = flows.get(current.user)
+            if flow is None:
+                flow = flows[current.user] = _Flow(current.user, ROLE_WEIGHTS.get(current.role, 1))
+            if not flow.waiters:
+                self._active[current.tier].append(flow)
+            flow.waiters.append(waiter)
+            self._dispatch()
+        if current.cancel is not None:
+            current.cancel.on_cancel(waiter.woken.set)
+        try:
+            waiter.woken.wait()
+        finally:
+            if current.cancel is not None:
+                current.cancel.remove(waiter.woken.set)
+        if not waiter.granted:
+            self._withdraw(current, flow, waiter)
+            metrics.incr("scheduler.cancelled_waits")
+            raise Cancelled()
+        metrics.observe(f"scheduler.wait.{current.tier}", time.perf_counter() - waiter.enqueued)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running[current.tier] -= 1
+                self._user_running[current.user] -= 1
+                if not self._user_running[current.user]:
+                    del self._user_running[current.user]
+                self._dispatch()
+
+    def _dispatch(self):
+        # Called with the lock held: grants free slots, interactive tier first
+        while sum(self._running.values()) < self.slots:
+            for tier in TIERS:
+                if tier == BATCH and self._running[BATCH] >= self.batch_slots:
+                    continue
+                flow = self._next_flow(tier)
+                if flow is not None:
+                    break
+            else:
+                return
+            waiter = flow.waiters.popleft()
+            flow.deficit -= waiter.cost
+            if not flow.waiters:
+                self._active[tier].remove(flow)
+                del self._flows[tier][flow.user]  # idle users do not bank credit
+            self._running[tier] += 1
+            self._user_running[flow.user] += 1
+            waiter.granted = True
+            waiter.woken.set()
+
+    def _withdraw(self, current, flow, waiter):
+        with self._lock:
+            if waiter.granted:  # granted just after the cancel: give the slot back
+                self._running[current.tier] -= 1
+                self._user_running[current.user] -= 1
+                if not self._user_running[current.user]:
+                    del self._user_running[current.user]
+            else:
+                flow.waiters.remove(waiter)
+                if not flow.waiters:
+                    self._active[current.tier].remove(flow)
+                    del self._flows[current.tier][current.user]
+            self._dispatch()
+
+    def _next_flow(self, tier):
+        """DRR: the head flow is served while its deficit covers its next call, then goes to the back."""
+        active = self._active[tier]
+        # A call costs at most one quantum, so two passes reach every flow that can be served
+        for _ in range(2 * len(active)):
+            flow = active[0]
+            if self._user_running[flow.user] < self.user_max_calls:
+                if flow.deficit >= flow.waiters[0].cost:
+                    return flow
+                flow.deficit += self.quantum * flow.weight
+            active.rotate(-1)
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "processes": PROCESSES,
+                **{f"{tier}_running": self._running[tier] for tier in TIERS},
+                **{f"{tier}_waiting": sum(len(f.waiters) for f in self._active[tier]) for tier in TIERS},
+                "users_running": len(self._user_running),
+            }
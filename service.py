@@ -0,0 +1,336 @@
+import asyncio
+import json
+import os
+import secrets
+
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from fastapi.security import HTTPBearer
+from pydantic import BaseModel
+
+import analysis
+import delivery
+import extraction
+import glossary
+import metrics
+import pipeline
+import revision
+import routing
+import scheduler
+import usage
+import user_store
+
+# ====================================================
+#        🌐 TRANSLATION SERVICE (FastAPI backend)
+# ====================================================
+# A stateless HTTP API for the work of the UIs: file extraction, the automatic
+# Steps 4-6 (optionally streamed as NDJSON progress events), single- or
+# multi-target, the prompts and model calls of the step-by-step Steps 4-6,
+# and export. Nothing is kept per request, so it runs under several uvicorn
+# workers and behind a load balancer; the UIs become thin clients when
+# AFRIDE_API_URL points here (service_client.py) and make no model calls of
+# their own. The Gemini key is the service's own (GEMINI_API_KEY).
+# Translation results carry the Gemini requests they made ("usage"), which
+# the UIs add to the project's archive record (archive.py). The service has
+# no glossaries or delivered projects of its own: a translation request
+# carries the glossary terms found in its source and, for a revision, the
+# delivered project it revises.
+#
+# Every endpoint but /health and /token needs an API token ("Authorization:
+# Bearer ..."). POST /token exchanges a username and password from the user
+# store (user_store.py) for one. The service listens on 127.0.0.1 unless
+# SERVICE_HOST says otherwise; put TLS in front of it before exposing it.
+#
+# Call limits and fair-share scheduling are per process (scheduler.py). The
+# workers split the deployment-wide limits by SCHED_PROCESSES, which
+# `python service.py` sets to SERVICE_WORKERS; with uvicorn directly, or with
+# several replicas behind a load balancer, set it to the total number of
+# workers.
+#
+#     python service.py                  # SERVICE_HOST / SERVICE_PORT / SERVICE_WORKERS
+#     SCHED_PROCESSES=4 uvicorn service:app --workers 4
+
+load_dotenv()
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", 8000))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", 1))
+HEARTBEAT_S = float(os.getenv("SERVICE_HEARTBEAT_S", 1.0))  # idle interval between stream events
+MODE_ALIASES = {"pipelined": pipeline.PIPELINE_MODES[0], "fused": pipeline.PIPELINE_MODES[1]}
+
+app = FastAPI(title="AfrIDE Translation Service")
+_bearer = HTTPBearer(auto_error=False)
+
+# --- Request Bodies ---
+
+class TokenRequest(BaseModel):
+    username: str
+    password: str
+
+class RevisionBaseline(BaseModel):
+    name: str
+    source_text: str
+    final_text: str
+
+class TranslateRequest(BaseModel):
+    source_text: str
+    source_lang: str = "English"
+    target_lang: str = "Portuguese"
+    target_langs: list = []  # multi-target runs only
+    mode: str = "pipelined"  # pipelined, fused or one of pipeline.PIPELINE_MODES
+    model: str = routing.AUTO_MODEL
+    gold_prompt: str = ""
+    glossary_terms: dict = {}  # {source_term: target_term} occurring in the source
+    glossaries: dict = {}  # multi-target runs: {target_lang: {source_term: target_term}}
+    revision: RevisionBaseline | None = None  # the delivered project being revised
+    # The job runs as the token's user and role (scheduler.py); only admins may raise its priority
+    priority: str = ""  # interactive or batch; chosen by job size when empty
+
+class PromptRequest(BaseModel):
+    step: str  # translate, edit or proofread (pipeline.STEPS)
+    source_lang: str = "English"
+    target_lang: str = "Portuguese"
+    gold_prompt: str = ""
+    glossary_terms: dict = {}  # {source_term: target_term} occurring in source_text
+    source_text: str = ""
+    translation: str = ""  # the text edited (edit) or proofread (proofread)
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    step: str  # translate, edit or proofread; the routing cascade picks the model per step
+    model: str = routing.AUTO_MODEL
+    segment_text: str = ""  # the text the prompt asks to work on
+    reference_text: str = ""  # the text the output is checked against, if any
+    qa_failures: int = 0  # local QA issues of segment_text; routing starts on a stronger model
+    priority: str = ""
+
+class ExportRequest(BaseModel):
+    text: str
+    base_name: str = "document"
+
+class BundleRequest(BaseModel):
+    texts: dict  # {target_lang: text}
+    base_name: str = "document"
+
+# --- Authentication ---
+
+def authenticate(credentials=Depends(_bearer)):
+    """The {"username", "role"} a request's bearer token was issued to; 401 without a valid one."""
+    identity = credentials and user_store.identity_for_token(credentials.credentials)
+    if not identity:
+        raise HTTPException(401, "Missing or invalid API token.", headers={"WWW-Authenticate": "Bearer"})
+    return identity
+
+signed_in = [Depends(authenticate)]
+
+def issue_token(request):
+    user = user_store.get_user(request.username)
+    # Passwords are stored as the UIs store them (plaintext), so compare in constant time
+    if not user or not secrets.compare_digest(user["password"].encode(), request.password.encode()):
+        raise HTTPException(401, "Invalid username or password.")
+    return {"token": user_store.issue_token(request.username), "expires_in": user_store.API_TOKEN_TTL_S}
+
+# --- Helpers ---
+
+def _api_key():
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise HTTPException(503, "The service has no GEMINI_API_KEY configured.")
+    return api_key
+
+def _mode(mode):
+    mode = MODE_ALIASES.get(mode, mode)
+    if mode not in pipeline.PIPELINE_MODES:
+        raise HTTPException(422, f"Unknown mode '{mode}'; use one of {sorted(MODE_ALIASES)}.")
+    return mode
+
+def _glossary(terms):
+    return glossary.Glossary(terms.items()) if terms else None
+
+def _step(step):
+    if step not in pipeline.STEPS:
+        raise HTTPException(422, f"Unknown step '{step}'; use one of {list(pipeline.STEPS)}.")
+    return step
+
+def _tier(identity, priority, size):
+    """The job's tier: chosen by size; a requested priority may lower it, and only an admin's may raise it."""
+    tier = scheduler.tier_for(size)
+    if not priority:
+        return tier
+    if priority not in scheduler.TIERS:
+        raise HTTPException(422, f"Unknown priority '{priority}'; use one of {list(scheduler.TIERS)}.")
+    if identity["role"] != "admin" and scheduler.TIERS.index(priority) < scheduler.TIERS.index(tier):
+        metrics.incr("service.priority_clamped")
+        return tier
+    return priority
+
+def _job(request, identity, size, cancel_token=None):
+    tier = _tier(identity, request.priority, size)
+    return scheduler.job(identity["username"], identity["role"], tier, size, cancel_token=cancel_token)
+
+def run_steps(request, identity, on_chunk=None, cancel_token=None):
+    """Steps 4-6 for one target; returns {"versions", "summary"}. Runs in a worker thread."""
+    api_key, mode = _api_key(), _mode(request.mode)
+    project_glossary = _glossary(request.glossary_terms)
+
+    def run(text):
+        return pipeline.run_mode(
+            mode, api_key, request.model, request.source_lang, request.target_lang,
+            request.gold_prompt, text, on_chunk, project_glossary,
+        )
+
+    baseline = request.revision
+    plan = baseline and revision.plan_revision(baseline.source_text, baseline.final_text, request.source_text, baseline.name)
+    with _job(request, identity, len(request.source_text), cancel_token), usage.metering(usage.UsageMeter()) as meter:
+        if plan:
+            versions = revision.run(plan, request.source_text, lambda text: run(text)[0], pipeline.FUSED_VERSIONS)
+            return {"versions": versions, "summary": revision.format_plan(plan), "usage": meter.calls}
+        versions, dedupe_plan = run(request.source_text)
+    return {"versions": versions, "summary": analysis.format_dedupe(dedupe_plan), "usage": meter.calls}
+
+def run_generate(request, identity, on_chunk=None, cancel_token=None):
+    """One step-by-step model call; returns {"text", "usage"}. Runs in a worker thread."""
+    api_key, step = _api_key(), _step(request.step)
+    with _job(request, identity, len(request.segment_text), cancel_token), usage.metering(usage.UsageMeter()) as meter:
+        text = pipeline.call_model(api_key, request.model, step, request.prompt, request.segment_text,
+                                   request.reference_text or None, qa_failures=request.qa_failures)
+    return {"text": text, "usage": meter.calls}
+
+def run_targets(request, identity, on_chunk=None, cancel_token=None):
+    """Steps 4-6 into every language of request.target_langs; returns {"results", "errors", "summary"}."""
+    api_key, mode = _api_key(), _mode(request.mode)
+    target_langs = [lang for lang in request.target_langs if lang != request.source_lang]
+    with _job(request, identity, len(request.source_text) * len(target_langs), cancel_token), \
+            usage.metering(usage.UsageMeter()) as meter:
+        results, errors, plan = pipeline.run_targets(
+            mode, api_key, request.model, request.source_lang, target_langs, request.gold_prompt, request.source_text,
+            on_chunk=on_chunk,
+            glossaries={lang: _glossary(request.glossaries.get(lang)) for lang in target_langs},
+        )
+    return {
+        "results": results,
+        "errors": {lang: str(error) for lang, error in errors.items()},
+        "summary": analysis.format_dedupe(plan),
+        "usage": meter.calls,
+    }
+
+async def _stream(work):
+    """NDJSON events from work(on_chunk, cancel_token) running in a thread: progress lines, then result or error.
+
+    Heartbeat lines are sent while nothing else is, so a client that went away
+    (e.g. its user pressed Cancel) is noticed within HEARTBEAT_S; the job is
+    then cancelled and its call slots are freed.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    cancel_token = scheduler.CancelToken()
+
+    def emit(event):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def run():
+        try:
+            emit({"event": "result", **work(
+                lambda done, total: emit({"event": "progress", "done": done, "total": total}), cancel_token
+            )})
+        except HTTPException as e:
+            emit({"event": "error", "detail": e.detail})
+        except Exception as e:
+            emit({"event": "error", "detail": str(e)})
+        finally:
+            emit(None)
+
+    task = loop.run_in_executor(None, run)
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                event = {"event": "heartbeat"}
+            if event is None:
+                break
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+        await task
+    finally:
+        cancel_token.cancel()  # no effect once the work is done
+
+# --- Endpoints ---
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.post("/token")
+async def token(request: TokenRequest):
+    return await run_in_threadpool(issue_token, request)
+
+@app.get("/metrics", dependencies=signed_in)
+async def service_metrics():
+    return metrics.snapshot()
+
+@app.post("/extract", dependencies=signed_in)
+async def extract(file: UploadFile = File(...)):
+    # The upload is a spooled temporary file (on disk when large); it is parsed from there, not read into memory
+    try:
+        text = await run_in_threadpool(extraction.extract_upload, file.file, file.filename)
+    except ValueError as e:
+        raise HTTPException(415, str(e))
+    except Exception as e:
+        raise HTTPException(422, f"Error reading file {file.filename}: {e}")
+    return {"file_name": file.filename, "text": text, "words": len(text.split())}
+
+@app.post("/translate")
+async def translate(request: TranslateRequest, stream: bool = False, identity=Depends(authenticate)):
+    """Steps 4-6; with ?stream=true the response is NDJSON progress events ending in the result."""
+    if stream:
+        return StreamingResponse(_stream(lambda on_chunk, cancel_token: run_steps(request, identity, on_chunk, cancel_token)), media_type="application/x-ndjson")
+    return await run_in_threadpool(run_steps, request, identity)
+
+@app.post("/translate/multi")
+async def translate_multi(request: TranslateRequest, stream: bool = False, identity=Depends(authenticate)):
+    """Steps 4-6 into every language of target_langs from one source."""
+    if not request.target_langs:
+        raise HTTPException(422, "target_langs is empty.")
+    if stream:
+        return StreamingResponse(_stream(lambda on_chunk, cancel_token: run_targets(request, identity, on_chunk, cancel_token)), media_type="application/x-ndjson")
+    return await run_in_threadpool(run_targets, request, identity)
+
+@app.post("/prompts", dependencies=signed_in)
+async def prompts(request: PromptRequest):
+    """The prompt of a step-by-step Step 4-6 (pipeline.step_prompt)."""
+    prompt = pipeline.step_prompt(
+        _step(request.step), request.source_lang, request.target_lang, request.gold_prompt,
+        request.source_text, request.translation, _glossary(request.glossary_terms),
+    )
+    return {"prompt": prompt}
+
+@app.post("/generate")
+async def generate(request: GenerateRequest, stream: bool = False, identity=Depends(authenticate)):
+    """One model call of a step-by-step Step 4-6; with ?stream=true, NDJSON heartbeats end in the result."""
+    if stream:
+        return StreamingResponse(_stream(lambda on_chunk, cancel_token: run_generate(request, identity, on_chunk, cancel_token)), media_type="application/x-ndjson")
+    return await run_in_threadpool(run_generate, request, identity)
+
+@app.post("/export", dependencies=signed_in)
+async def export(request: ExportRequest):
+    data = await run_in_threadpool(delivery.word_document, request.text)
+    return Response(data, media_type=delivery.DOCX_MIME, headers={
+        "Content-Disposition": f'attachment; filename="translated_{request.base_name}.docx"'
+    })
+
+@app.post("/export/bundle", dependencies=signed_in)
+async def export_bundle(request: BundleRequest):
+    if not request.texts:
+        raise HTTPException(422, "Nothing to export.")
+    data = await run_in_threadpool(delivery.delivery_bundle, request.texts, request.base_name)
+    return Response(data, media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="translated_{request.base_name}_bundle.zip"'
+    })
+
+if __name__ == "__main__":
+    import uvicorn
+
+    os.environ.setdefault("SCHED_PROCESSES", str(SERVICE_WORKERS))  # read by each worker's scheduler
+    uvicorn.run("service:app", host=SERVICE_HOST, port=SERVICE_PORT, workers=SERVICE_WORKERS)
@@ -0,0 +1,183 @@
+import contextvars
+import json
+import os
+import threading
+
+import glossary
+import scheduler
+import tm
+import usage
+from lazy_imports import lazy_import
+
+httpx = lazy_import("httpx")
+
+# ====================================================
+#        🔌 CLIENT FOR THE TRANSLATION SERVICE
+# ====================================================
+# When AFRIDE_API_URL is set (e.g. http://translation-service:8000), the UIs
+# are thin clients: extraction, the automatic Steps 4-6, the prompts and model
+# calls of the step-by-step Steps 4-6 and export run on the service
+# (service.py) instead of in-process, so UI servers and translation backends
+# scale separately and every model call is scheduled in one place. Unset,
+# everything runs in-process as before. Glossaries and delivered projects stay
+# in the UI's own databases: each request sends the glossary terms found in
+# its source and the project a revision is based on.
+#
+# Requests carry an API token: UIs that sign users in get one per user at
+# login (login(), use_token()); the others send AFRIDE_API_TOKEN, a token
+# issued to a service account.
+
+API_URL = os.getenv("AFRIDE_API_URL", "").rstrip("/")
+API_TOKEN = os.getenv("AFRIDE_API_TOKEN", "")
+TIMEOUT_S = float(os.getenv("AFRIDE_API_TIMEOUT_S", 1800))
+
+_token = contextvars.ContextVar("service_token", default=None)
+
+_client = None
+_client_lock = threading.Lock()
+
+def enabled():
+    return bool(API_URL)
+
+def _http():
+    """One pooled, thread-safe HTTP client per process (keep-alive connections)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(base_url=API_URL, timeout=httpx.Timeout(TIMEOUT_S, connect=10))
+        return _client
+
+def _headers():
+    token = _token.get() or API_TOKEN
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+def use_token(token):
+    """Sends this context's requests with `token` (worker threads inherit it through scheduler.propagate)."""
+    _token.set(token)
+
+def _raise_for_status(response):
+    if response.is_error:
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        raise RuntimeError(f"Translation service error {response.status_code}: {detail}")
+
+def _post(path, body):
+    response = _http().post(path, json=body, headers=_headers())
+    _raise_for_status(response)
+    return response
+
+def _streamed(path, body, on_chunk=None):
+    """Posts to a streaming endpoint, forwards progress to on_chunk(done, total) and returns the result event.
+
+    Cancelling the current job returns at once; the stream is dropped at the
+    service's next heartbeat, which cancels the job on the service too.
+    """
+    cancel_token = scheduler.current_job().cancel
+    headers = _headers()
+
+    def read():
+        with _http().stream("POST", path, params={"stream": "true"}, json=body, headers=headers) as response:
+            if response.is_error:
+                response.read()
+                _raise_for_status(response)
+            for line in response.iter_lines():
+                if cancel_token is not None and cancel_token.cancelled():
+                    return None  # leaving the block closes the connection
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["event"] == "progress":
+                    if on_chunk:
+                        on_chunk(event["done"], event["total"])
+                elif event["event"] == "error":
+                    raise RuntimeError(event["detail"])
+                elif event["event"] == "result":
+                    usage.record_calls(event.get("usage", ()))  # the service's Gemini requests, for the archive
+                    return event
+        raise RuntimeError("Translation service closed the stream without a result.")
+
+    return scheduler.run_cancellable(read)
+
+def _terms(source_lang, target_lang, client, source_text):
+    """{source_term: target_term} of the local glossary entries that occur in the source."""
+    project_glossary = glossary.get_glossary(source_lang, target_lang, client)
+    return project_glossary.find_terms(source_text) if project_glossary else {}
+
+def _baseline(revision_of):
+    """The local delivered project a revision is based on, as the service expects it, or None."""
+    project = tm.get_project(revision_of) if revision_of else None
+    if not project:
+        return None
+    return {"name": project["name"], "source_text": project["source_text"], "final_text": project["final_text"]}
+
+def _job():
+    """The caller's job priority (scheduler.py); the service runs it as the token's user, within that user's role."""
+    return {"priority": scheduler.current_job().tier}
+
+# --- API ---
+
+def login(username, password):
+    """A service API token for a user of the service's user store."""
+    response = _http().post("/token", json={"username": username, "password": password})
+    _raise_for_status(response)
+    return response.json()["token"]
+
+def extract(data, file_name):
+    """Text of an uploaded file (bytes, or a binary file object, which is streamed), extracted by the service."""
+    response = _http().post("/extract", files={"file": (file_name, data)}, headers=_headers())
+    _raise_for_status(response)
+    return response.json()["text"]
+
+def translate(mode, model_name, source_lang, target_lang, gold_prompt, source_text,
+              client=None, revision_of=None, on_chunk=None):
+    """Steps 4-6 on the service; returns (versions, summary).
+
+    `client` (glossary) and `revision_of` (delivered project) are looked up
+    in this process's databases and sent along.
+    """
+    event = _streamed("/translate", {
+        "mode": mode, "model": model_name, "source_lang": source_lang, "target_lang": target_lang,
+        "gold_prompt": gold_prompt or "", "source_text": source_text,
+        "glossary_terms": _terms(source_lang, target_lang, client, source_text), "revision": _baseline(revision_of),
+        **_job(),
+    }, on_chunk)
+    return event["versions"], event["summary"]
+
+def translate_targets(mode, model_name, source_lang, target_langs, gold_prompt, source_text, client=None, on_chunk=None):
+    """Multi-target Steps 4-6 on the service; returns (results, {lang: error message}, summary)."""
+    event = _streamed("/translate/multi", {
+        "mode": mode, "model": model_name, "source_lang": source_lang, "target_langs": list(target_langs),
+        "gold_prompt": gold_prompt or "", "source_text": source_text,
+        "glossaries": {lang: _terms(source_lang, lang, client, source_text) for lang in target_langs},
+        **_job(),
+    }, on_chunk)
+    return event["results"], event["errors"], event["summary"]
+
+def step_prompt(step, source_lang, target_lang, gold_prompt="", source_text="", translation="", glossary=None):
+    """The prompt of a step-by-step Step 4-6, built by the service (pipeline.step_prompt).
+
+    `glossary` is the local compiled glossary; the entries found in the source are sent along.
+    """
+    return _post("/prompts", {
+        "step": step, "source_lang": source_lang, "target_lang": target_lang, "gold_prompt": gold_prompt or "",
+        "glossary_terms": glossary.find_terms(source_text) if glossary else {},
+        "source_text": source_text or "", "translation": translation or "",
+    }).json()["prompt"]
+
+def generate(model_name, step, prompt, segment_text, reference_text=None, qa_failures=0):
+    """One model call of a step-by-step Step 4-6 on the service; returns the text."""
+    event = _streamed("/generate", {
+        "prompt": prompt, "step": step, "model": model_name, "segment_text": segment_text or "",
+        "reference_text": reference_text or "", "qa_failures": qa_failures, **_job(),
+    })
+    return event["text"]
+
+def word_document(text, base_name="document"):
+    """The .docx (bytes) of a translation, built by the service."""
+    return _post("/export", {"text": text or "", "base_name": base_name}).content
+
+def delivery_bundle(final_texts, base_name):
+    """The .zip (bytes) of a multi-target delivery, built by the service."""
+    return _post("/export/bundle", {"texts": final_texts, "base_name": base_name}).content
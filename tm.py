@@ -0,0 +1,268 @@
+import collections
+import hashlib
+import itertools
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import qa
+
+# ====================================================
+#          🧠 TRANSLATION MEMORY (exact + fuzzy)
+# ====================================================
+# Delivered projects are stored as source/target segment pairs (one segment
+# per paragraph line, like the QA engine) per language pair. In memory, each
+# TM is a hash index for exact matches plus an inverted index of word
+# shingles for fuzzy matches, built once per TM version and shared by all
+# sessions. Fuzzy scores are shingle Dice similarity in percent. Whole
+# delivered projects are kept too, as the baseline for revisions (revision.py).
+
+TM_DB_PATH = os.getenv("TM_DB_PATH", "tm.db")
+BUSY_TIMEOUT_MS = 5000
+MIN_FUZZY_SCORE = 75  # below this a TM hit is worthless ("no match")
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths = set()
+
+_cache = {}  # (db_path, source_lang, target_lang) -> (version, TranslationMemory)
+_cache_lock = threading.Lock()
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    version     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source_lang, target_lang)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS units (
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    source      TEXT NOT NULL,
+    target      TEXT NOT NULL,
+    PRIMARY KEY (source_lang, target_lang, source_hash)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS projects (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL,
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    client      TEXT NOT NULL,
+    source_text TEXT NOT NULL,
+    final_text  TEXT NOT NULL,
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_projects_langs ON projects (source_lang, target_lang, created_at);
+"""
+
+# --- Segments ---
+
+def normalize(segment):
+    """Lower-cased, whitespace-collapsed form used for exact and fuzzy matching."""
+    return _WHITESPACE_RE.sub(" ", segment).strip().lower()
+
+def segment_hash(segment):
+    return hashlib.blake2b(normalize(segment).encode("utf-8"), digest_size=12).hexdigest()
+
+def shingles(normalized):
+    """Words plus adjacent word pairs, so reordered text does not score as identical."""
+    words = normalized.split()
+    return set(words).union(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+# --- In-memory Index ---
+
+class TranslationMemory:
+    """Exact (hash) and fuzzy (shingle) lookup over one language pair's units."""
+
+    def __init__(self, pairs):
+        self._exact = {}  # normalized source -> target
+        self._sources = []  # unit id -> normalized source
+        self._targets = []
+        self._grams = []  # unit id -> shingle set
+        self._sizes = []  # unit id -> shingle count
+        self._index = {}  # shingle -> [unit ids]
+        for source, target in pairs:
+            key = normalize(source)
+            if not key or key in self._exact:
+                continue
+            self._exact[key] = target
+            unit = len(self._sources)
+            grams = shingles(key)
+            self._sources.append(key)
+            self._targets.append(target)
+            self._grams.append(grams)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                self._index.setdefault(gram, []).append(unit)
+
+    def __len__(self):
+        return len(self._sources)
+
+    def lookup(self, segment, min_score=MIN_FUZZY_SCORE):
+        """(score 0-100, target) of the best match for `segment`, or (0, None)."""
+        key = normalize(segment)
+        target = self._exact.get(key)
+        if target is not None:
+            return 100, target
+        if not key or not self._sources:
+            return 0, None
+
+        grams = shingles(key)
+        size = len(grams)
+        # Dice >= min_score bounds the candidate's shingle count and the overlap it needs
+        ratio = min_score / (200 - min_score)
+        low, high = size * ratio, size / ratio
+        needed = math.ceil(min_score * (size + low) / 200)
+        # Prefix filter: a unit sharing `needed` shingles must share one of the
+        # (size - needed + 1) rarest, so only those postings are scanned; the
+        # common rest is checked per candidate, and only if it could still win
+        index = self._index
+        ordered = sorted(grams, key=lambda gram: len(index.get(gram, ())))
+        cut = size - needed + 1
+        rest = set(ordered[cut:])
+        candidates = collections.Counter(itertools.chain.from_iterable(index.get(gram, ()) for gram in ordered[:cut]))
+
+        best_score, best_unit = 0, None
+        sizes, unit_grams = self._sizes, self._grams
+        for unit, count in candidates.items():
+            other = sizes[unit]
+            if not low <= other <= high or 200 * (count + len(rest)) / (size + other) <= best_score:
+                continue
+            if rest:
+                count += len(rest & unit_grams[unit])
+            score = 200 * count / (size + other)
+            if score > best_score:
+                best_score, best_unit = score, unit
+        if best_unit is None or best_score < min_score:
+            return 0, None
+        # Never report a fuzzy match as 100%: that band is reserved for exact matches
+        return min(int(best_score), 99), self._targets[best_unit]
+
+# --- Connection Handling ---
+
+def _connect(db_path=None):
+    """Returns this thread's connection to the TM database, creating it on first use."""
+    db_path = db_path or TM_DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        connections[db_path] = conn
+        with _init_lock:
+            if db_path not in _initialized_paths:
+                conn.executescript(_SCHEMA)
+                _initialized_paths.add(db_path)
+    return conn
+
+# --- Store API ---
+
+def add_units(source_lang, target_lang, pairs, db_path=None):
+    """Stores (source, target) segment pairs in one transaction; newer translations win."""
+    rows = [
+        (source_lang, target_lang, segment_hash(s), s.strip(), t.strip())
+        for s, t in pairs if s.strip() and t.strip()
+    ]
+    if not rows:
+        return 0
+    conn = _connect(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            """INSERT INTO units (source_lang, target_lang, source_hash, source, target) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT DO UPDATE SET source = excluded.source, target = excluded.target""",
+            rows,
+        )
+        conn.execute(
+            """INSERT INTO memories (source_lang, target_lang, version) VALUES (?, ?, 1)
+               ON CONFLICT DO UPDATE SET version = version + 1""",
+            (source_lang, target_lang),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+def get_memory(source_lang, target_lang, db_path=None):
+    """The indexed TranslationMemory for a language pair, or None if it is empty.
+
+    The index is built once per TM version and shared by all sessions.
+    """
+    db_path = db_path or TM_DB_PATH
+    conn = _connect(db_path)
+    row = conn.execute(
+        "SELECT version FROM memories WHERE source_lang = ? AND target_lang = ?", (source_lang, target_lang)
+    ).fetchone()
+    if row is None:
+        return None
+
+    key = (db_path, source_lang, target_lang)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == row[0]:
+            return cached[1]
+    pairs = conn.execute(
+        "SELECT source, target FROM units WHERE source_lang = ? AND target_lang = ?", (source_lang, target_lang)
+    ).fetchall()
+    memory = TranslationMemory(pairs) if pairs else None
+    with _cache_lock:
+        _cache[key] = (row[0], memory)
+    return memory
+
+def add_document(source_lang, target_lang, source_text, target_text, db_path=None):
+    """Stores a delivered translation segment by segment; returns the number of units added.
+
+    Nothing is stored when the source and target paragraphs do not line up,
+    since misaligned pairs would poison every later match.
+    """
+    pairs, issues = qa.segment_pairs(source_text, target_text)
+    if issues:
+        return 0
+    return add_units(source_lang, target_lang, [(s, t) for _, s, t in pairs], db_path)
+
+# --- Delivered Projects ---
+
+def save_project(name, source_lang, target_lang, client, source_text, final_text, db_path=None):
+    """Keeps a delivered project (the baseline for later revisions) and adds it to the TM.
+
+    Returns (project_id, TM units added).
+    """
+    conn = _connect(db_path)
+    cursor = conn.execute(
+        """INSERT INTO projects (name, source_lang, target_lang, client, source_text, final_text, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (name, source_lang, target_lang, client, source_text, final_text, time.time()),
+    )
+    return cursor.lastrowid, add_document(source_lang, target_lang, source_text, final_text, db_path)
+
+def list_projects(source_lang, target_lang, limit=50, db_path=None):
+    """[(project_id, name, client, created_at)] for a language pair, newest first."""
+    return _connect(db_path).execute(
+        """SELECT id, name, client, created_at FROM projects WHERE source_lang = ? AND target_lang = ?
+           ORDER BY created_at DESC LIMIT ?""",
+        (source_lang, target_lang, limit),
+    ).fetchall()
+
+def get_project(project_id, db_path=None):
+    """Dict with the project's metadata, source_text and final_text, or None."""
+    conn = _connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+    finally:
+        conn.row_factory = None
+    return dict(row) if row else None
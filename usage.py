@@ -0,0 +1,67 @@
+import collections
+import contextlib
+import contextvars
+import time
+
+# ====================================================
+#        🧾 PER-PROJECT TOKEN & LATENCY METERING
+# ====================================================
+# metrics.py counts calls for the whole process; the project archive
+# (archive.py) needs what one project used. A UsageMeter is made active for a
+# block with metering(), and every Gemini request made in that block, or in
+# the worker threads the pipelines start from it (they copy the context), is
+# added to it. Retries, hedges and escalations are requests too, so the
+# totals are what was billed.
+
+Call = collections.namedtuple("Call", "model latency_s prompt_tokens output_tokens ok")
+
+_meter = contextvars.ContextVar("usage_meter", default=None)
+
+class UsageMeter:
+    """The Gemini requests made for one project."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.calls = []  # [Call]; list.append is atomic, so worker threads share it without a lock
+
+    def record(self, model, latency_s, prompt_tokens=0, output_tokens=0, ok=True):
+        self.calls.append(Call(model, latency_s, prompt_tokens, output_tokens, ok))
+
+    def totals(self):
+        calls = list(self.calls)
+        return {
+            "calls": len(calls),
+            "prompt_tokens": sum(c.prompt_tokens for c in calls),
+            "output_tokens": sum(c.output_tokens for c in calls),
+            "latency_s": sum(c.latency_s for c in calls),
+        }
+
+@contextlib.contextmanager
+def metering(meter):
+    """Adds the block's Gemini requests to `meter` (nothing is metered for None)."""
+    if meter is None:
+        yield None
+        return
+    token = _meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _meter.reset(token)
+
+def record(model, latency_s, response=None):
+    """Adds one request to the active meter; `response` is None if it failed."""
+    meter = _meter.get()
+    if meter is None:
+        return
+    usage = getattr(response, "usage_metadata", None)
+    meter.record(
+        model, latency_s,
+        getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0,
+        response is not None,
+    )
+
+def record_calls(calls):
+    """Adds requests metered elsewhere (e.g. by the translation service) to the active meter."""
+    meter = _meter.get()
+    if meter is not None:
+        meter.calls.extend(Call(*call) for call in calls)
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+# ====================================================
+#              👥 USER STORE (SQLite, WAL)
+# ====================================================
+# Users live in a small SQLite database instead of users.json. Lookups hit the
+# primary-key index, every write is a single transaction, and WAL mode lets
+# readers keep working while an admin is adding users from another session.
+# The translation service (service.py) authenticates with API tokens issued
+# to these users; only a hash of each token is stored.
+
+USER_DB_PATH = os.getenv("USER_DB_PATH", "users.db")
+LEGACY_USER_FILE = "users.json"
+BUSY_TIMEOUT_MS = 5000
+API_TOKEN_TTL_S = float(os.getenv("API_TOKEN_TTL_S", 30 * 86400))
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths = set()
+
+# (db_path, version, users) — swapped atomically, never mutated in place
+_cache = (None, None, None)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role     TEXT NOT NULL DEFAULT 'user'
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS tokens (
+    token_hash TEXT PRIMARY KEY,
+    username   TEXT NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_tokens_username ON tokens (username);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+CREATE TRIGGER IF NOT EXISTS users_version_insert AFTER INSERT ON users
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+
+CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE ON users
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+
+CREATE TRIGGER IF NOT EXISTS users_version_delete AFTER DELETE ON users
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+"""
+
+# --- Connection Handling ---
+
+def _connect(db_path=None):
+    """Returns this thread's connection to the user database, creating it on first use."""
+    db_path = db_path or USER_DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        # isolation_level=None: we issue BEGIN IMMEDIATE ourselves for writes
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        connections[db_path] = conn
+        _ensure_schema(conn, db_path)
+    return conn
+
+def _ensure_schema(conn, db_path):
+    """Creates the schema once per process and imports users.json into an empty database."""
+    with _init_lock:
+        if db_path in _initialized_paths:
+            return
+        conn.executescript(_SCHEMA)
+        _import_legacy_users(conn)
+        _initialized_paths.add(db_path)
+
+def _import_legacy_users(conn):
+    """One-time migration of the old users.json file into an empty database.
+
+    The migration is recorded in meta ('legacy_imported'), so a database
+    whose users were all deleted later is not repopulated on restart.
+    """
+    if not os.path.exists(LEGACY_USER_FILE):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        imported = conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone()
+        if imported is None and conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None:
+            with open(LEGACY_USER_FILE, "r") as f:
+                legacy = json.load(f)
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, ?)",
+                [(u, d["password"], d.get("role", "user")) for u, d in legacy.items()],
+            )
+        # Also marks databases that already had users (migrated before this key existed)
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('legacy_imported', 1)")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _version(conn):
+    return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+# --- Read API ---
+
+def _cached_users(conn, db_path):
+    """Returns the cached {username: record} map, reloading only if the version moved."""
+    global _cache
+    version = _version(conn)
+    cached_path, cached_version, users = _cache
+    if cached_path == db_path and cached_version == version:
+        return users
+
+    rows = conn.execute("SELECT username, password, role FROM users").fetchall()
+    users = {u: {"password": p, "role": r} for u, p, r in rows}
+    _cache = (db_path, version, users)
+    return users
+
+def get_all_users(db_path=None):
+    """Returns a copy of every user record, served from the in-process cache when current."""
+    db_path = db_path or USER_DB_PATH
+    users = _cached_users(_connect(db_path), db_path)
+    return {u: dict(record) for u, record in users.items()}
+
+def get_user(username, db_path=None):
+    """Looks up a single user by name. Returns the record dict or None."""
+    if not username:
+        return None
+    db_path = db_path or USER_DB_PATH
+    conn = _connect(db_path)
+
+    cached_path, cached_version, users = _cache
+    if cached_path == db_path and cached_version == _version(conn):
+        record = users.get(username)
+        return dict(record) if record else None
+
+    row = conn.execute(
+        "SELECT password, role FROM users WHERE username = ?", (username,)
+    ).fetchone()
+    return {"password": row[0], "role": row[1]} if row else None
+
+def count_users(db_path=None):
+    return _connect(db_path).execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+# --- Write API ---
+
+def add_user(username, password, role="user", db_path=None):
+    """Atomically creates a user. Returns False if the username is already taken."""
+    conn = _connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+            (username, password, role),
+        )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+def delete_user(username, db_path=None):
+    """Removes a user and their API tokens. Returns True if a row was deleted."""
+    conn = _connect(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        deleted = conn.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount > 0
+        conn.execute("DELETE FROM tokens WHERE username = ?", (username,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return deleted
+
+def upsert_users(users, db_path=None):
+    """Inserts or updates every record in {username: {"password", "role"}} in one transaction.
+
+    Users missing from the mapping are left alone, so a stale copy held by one
+    admin session can never wipe out users another session just added.
+    """
+    conn = _connect(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            """INSERT INTO users (username, password, role) VALUES (?, ?, ?)
+               ON CONFLICT(username) DO UPDATE SET password = excluded.password, role = excluded.role
+               WHERE users.password != excluded.password OR users.role != excluded.role""",
+            [(u, d["password"], d.get("role", "user")) for u, d in users.items()],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+# --- API Tokens ---
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def issue_token(username, db_path=None):
+    """Creates an API token for `username`; the token itself is returned once and never stored."""
+    token = secrets.token_urlsafe(32)
+    _connect(db_path).execute(
+        "INSERT INTO tokens (token_hash, username, created_at) VALUES (?, ?, ?)",
+        (_token_hash(token), username, time.time()),
+    )
+    return token
+
+def identity_for_token(token, db_path=None):
+    """{"username", "role"} of the user an unexpired token was issued to, or None."""
+    if not token:
+        return None
+    row = _connect(db_path).execute(
+        """SELECT users.username, users.role FROM tokens JOIN users ON users.username = tokens.username
+           WHERE tokens.token_hash = ? AND tokens.created_at > ?""",
+        (_token_hash(token), time.time() - API_TOKEN_TTL_S),
+    ).fetchone()
+    return {"username": row[0], "role": row[1]} if row else None
+
+def revoke_tokens(username, db_path=None):
+    """Invalidates every API token of a user. Returns how many were removed."""
+    return _connect(db_path).execute("DELETE FROM tokens WHERE username = ?", (username,)).rowcount
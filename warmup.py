@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+import gemini_client
+import gold_cache
+import metrics
+from lazy_imports import preload
+
+# ====================================================
+#               🔥 BACKGROUND WORKER WARM-UP
+# ====================================================
+# Heavy modules are imported lazily so a worker can start serving quickly.
+# Once it is accepting traffic, start_background_warmup() loads the parsers and
+# the Gemini client and pre-builds the gold corpus prompt on a daemon thread,
+# so the first real project does not pay for any of it.
+
+HEAVY_MODULES = ("google.generativeai", "pdfplumber", "pypdfium2", "docx")
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+_status = {"state": "idle", "steps": {}, "error": None}
+_status_lock = threading.Lock()
+_started = threading.Event()
+
+def _record(step, seconds):
+    with _status_lock:
+        _status["steps"][step] = round(seconds, 3)
+
+def _run(model_name):
+    with _status_lock:
+        _status["state"] = "running"
+    try:
+        for name, seconds in preload(*HEAVY_MODULES).items():
+            _record(f"import {name}", seconds or 0.0)
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if api_key:
+            start = time.perf_counter()
+            gemini_client.get_pool().warm(api_key, model_name)
+            _record("model client", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        gold_cache.prewarm()
+        _record("gold corpus", time.perf_counter() - start)
+
+        with _status_lock:
+            _status["state"] = "done"
+    except Exception as e:
+        with _status_lock:
+            _status["state"] = "failed"
+            _status["error"] = str(e)
+        print(f"Warm-up failed: {e}")
+
+def start_background_warmup(model_name=None):
+    """Starts the warm-up thread once per process. Safe to call on every request."""
+    if _started.is_set():
+        return False
+    with _status_lock:
+        if _started.is_set():
+            return False
+        _started.set()
+    threading.Thread(target=_run, args=(model_name or DEFAULT_MODEL,), name="warmup", daemon=True).start()
+    return True
+
+def warmup_status():
+    with _status_lock:
+        return {"state": _status["state"], "steps": dict(_status["steps"]), "error": _status["error"]}
+
+metrics.register_provider("warmup", warmup_status)